@@ -0,0 +1,102 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='About',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('subtitle', models.CharField(blank=True, max_length=255, null=True)),
+                ('description', models.TextField()),
+                ('image', models.ImageField(blank=True, null=True, upload_to='about_images/')),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('phone1', models.CharField(blank=True, max_length=20, null=True)),
+                ('phone2', models.CharField(blank=True, max_length=20, null=True)),
+                ('whatsapp_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('facebook_link', models.URLField(blank=True, null=True)),
+                ('telegram_link', models.URLField(blank=True, null=True)),
+                ('instagram_link', models.URLField(blank=True, null=True)),
+                ('youtube_link', models.URLField(blank=True, null=True)),
+                ('tiktok_link', models.URLField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Caption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('caption', models.CharField(max_length=255)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Count',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscribers_count', models.PositiveIntegerField(default=0)),
+                ('doctors_count', models.PositiveIntegerField(default=0)),
+                ('students_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FAQ',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('file', models.FileField(blank=True, null=True, upload_to='faq_files/')),
+                ('video_url', models.URLField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SupportDescription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('description', models.TextField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Support Description',
+                'verbose_name_plural': 'Support Descriptions',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WelcomeMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('user_type', models.CharField(choices=[('student', 'Student'), ('parent', 'Parent'), ('store', 'Store')], max_length=20, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AboutDescription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(blank=True, max_length=255, null=True)),
+                ('description', models.TextField()),
+                ('order', models.PositiveIntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('about', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descriptions', to='about.about')),
+            ],
+            options={
+                'ordering': ['order'],
+            },
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:58
+
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProfileImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='profile_images/')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('first_name', models.CharField(blank=True, max_length=150, verbose_name='first name')),
+                ('last_name', models.CharField(blank=True, max_length=150, verbose_name='last name')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('name', models.CharField(max_length=100)),
+                ('otp', models.CharField(blank=True, max_length=6, null=True)),
+                ('otp_created_at', models.DateTimeField(blank=True, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('user_type', models.CharField(blank=True, choices=[('student', 'Student'), ('parent', 'Parent'), ('store', 'Store')], default='student', max_length=20, null=True)),
+                ('phone', models.CharField(blank=True, max_length=20, null=True)),
+                ('phone2', models.CharField(blank=True, max_length=20, null=True)),
+                ('parent_phone', models.CharField(blank=True, help_text='Only applicable for students', max_length=20, null=True)),
+                ('year', models.CharField(blank=True, choices=[('first-secondary', 'First Secondary'), ('second-secondary', 'Second Secondary'), ('third-secondary', 'Third Secondary')], help_text='Only applicable for students', max_length=20, null=True)),
+                ('government', models.CharField(blank=True, choices=[('1', 'Cairo'), ('2', 'Alexandria'), ('3', 'Kafr El Sheikh'), ('4', 'Dakahlia'), ('5', 'Sharqia'), ('6', 'Gharbia'), ('7', 'Monufia'), ('8', 'Qalyubia'), ('9', 'Giza'), ('10', 'Beni Suef'), ('11', 'Fayoum'), ('12', 'Minya'), ('13', 'Assiut'), ('14', 'Sohag'), ('15', 'Qena'), ('16', 'Luxor'), ('17', 'Aswan'), ('18', 'Red Sea'), ('19', 'Beheira'), ('20', 'Ismailia'), ('21', 'Suez'), ('22', 'Port Said'), ('23', 'Damietta'), ('24', 'Matruh'), ('25', 'New Valley'), ('26', 'North Sinai'), ('27', 'South Sinai')], max_length=2, null=True)),
+                ('city', models.CharField(blank=True, max_length=100, null=True)),
+                ('address', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, null=True)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions')),
+                ('user_profile_image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='users', to='accounts.userprofileimage')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=150, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('phone', models.CharField(blank=True, max_length=20, null=True)),
+                ('phone2', models.CharField(blank=True, max_length=20, null=True)),
+                ('government', models.CharField(blank=True, choices=[('1', 'Cairo'), ('2', 'Alexandria'), ('3', 'Kafr El Sheikh'), ('4', 'Dakahlia'), ('5', 'Sharqia'), ('6', 'Gharbia'), ('7', 'Monufia'), ('8', 'Qalyubia'), ('9', 'Giza'), ('10', 'Beni Suef'), ('11', 'Fayoum'), ('12', 'Minya'), ('13', 'Assiut'), ('14', 'Sohag'), ('15', 'Qena'), ('16', 'Luxor'), ('17', 'Aswan'), ('18', 'Red Sea'), ('19', 'Beheira'), ('20', 'Ismailia'), ('21', 'Suez'), ('22', 'Port Said'), ('23', 'Damietta'), ('24', 'Matruh'), ('25', 'New Valley'), ('26', 'North Sinai'), ('27', 'South Sinai')], max_length=2, null=True)),
+                ('city', models.CharField(blank=True, max_length=100, null=True)),
+                ('address', models.CharField(blank=True, max_length=255, null=True)),
+                ('is_default', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='addresses', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'User Addresses',
+                'ordering': ['-is_default', '-created_at'],
+            },
+        ),
+    ]
@@ -1,6 +1,124 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class DateAddedCursorPagination(BasePagination):
+    """
+    Keyset pagination on (date_added, id), newest first.
+
+    Each page is a single indexed range query regardless of depth and there is
+    no COUNT(*). The next/previous links carry an opaque cursor encoding the
+    boundary row. Rows without a date_added are not reachable in this mode.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 100
+    page_size_query_param = 'per_page'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    @staticmethod
+    def supports(queryset):
+        return any(field.name == 'date_added' for field in queryset.model._meta.concrete_fields)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = (parse_datetime(data['d']), int(data['i']), bool(data.get('r')))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, item, reverse):
+        data = {'d': item.date_added.isoformat(), 'i': item.pk, 'r': int(reverse)}
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        reverse = bool(position and position[2])
+
+        queryset = queryset.filter(date_added__isnull=False)
+        if position:
+            date_added, pk = position[0], position[1]
+            if reverse:
+                queryset = queryset.filter(Q(date_added__gt=date_added) | Q(date_added=date_added, pk__gt=pk))
+            else:
+                queryset = queryset.filter(Q(date_added__lt=date_added) | Q(date_added=date_added, pk__lt=pk))
+        ordering = ('date_added', 'pk') if reverse else ('-date_added', '-pk')
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        # Going backwards, "more" means there is a previous page; a cursor we came from means a next page
+        self.has_next = has_more if not reverse else bool(position)
+        self.has_previous = has_more if reverse else bool(position)
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 100 # Default page size
     page_size_query_param = 'per_page'  # Query parameter for custom page size
-    max_page_size = 100000  # Maximum allowed page size
\ No newline at end of file
+    max_page_size = 100000  # Maximum allowed page size
+    # Views that can stream their whole list (?stream=) page at most this many rows
+    streaming_max_page_size = 1000
+
+    # Passing ?cursor= (empty for the first page) switches to keyset pagination
+    cursor_pagination_class = DateAddedCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if getattr(view, 'stream_query_param', None):
+            self.max_page_size = self.streaming_max_page_size
+        cursor_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_param in request.query_params and self.cursor_pagination_class.supports(queryset):
+            self.cursor_paginator = self.cursor_pagination_class()
+            self.cursor_paginator.max_page_size = min(self.max_page_size, self.cursor_paginator.max_page_size)
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
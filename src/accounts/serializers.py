@@ -1,13 +1,45 @@
-from django.db.models import Count, Sum, F
+from django.db.models import Count, Sum, F, Q
 from rest_framework import serializers
 from rest_framework.fields import ImageField
 
 from products.models import PILL_STATUS_CHOICES, LovedProduct, Pill, Product
 from products.serializers import LovedProductSerializer, PillDetailSerializer
 from .models import User, UserAddress, UserProfileImage
+from .sparse_fieldsets import SparseFieldsetsMixin
 from django.db.models import Count, Sum, Case, When, Value, FloatField
 from django.db.models.functions import Coalesce
 
+# Counted as pending in financial_summary: all but delivered, canceled and refunded
+PENDING_PILL_STATUSES = [status for status, _ in PILL_STATUS_CHOICES if status not in ('d', 'r', 'c')]
+
+
+def with_financial_totals(queryset):
+    """Annotate users with the pill totals FinancialSummaryMixin reads, in the same query."""
+    return queryset.annotate(
+        total_paid=Sum('pills__price_final', filter=Q(pills__status='d')),
+        total_pending=Sum('pills__price_final', filter=Q(pills__status__in=PENDING_PILL_STATUSES)),
+    )
+
+
+class FinancialSummaryMixin:
+    """
+    financial_summary from the stored pill price breakdowns, read from the
+    with_financial_totals annotations when the queryset has them. Pills priced
+    before breakdowns were stored count once backfill_pill_prices has run.
+    """
+
+    def get_financial_summary(self, obj):
+        if not hasattr(obj, 'total_paid'):
+            obj = with_financial_totals(User.objects.filter(pk=obj.pk)).only('pk').get()
+        paid = obj.total_paid or 0
+        pending = obj.total_pending or 0
+
+        return {
+            'total_paid': paid,
+            'total_pending': pending,
+            'all_time_total': paid + pending
+        }
+
 class UserProfileImageSerializer(serializers.ModelSerializer):
     image = ImageField(use_url=True) # Explicitly set use_url to True
 
@@ -20,7 +52,7 @@ class UserProfileImageCreateSerializer(serializers.ModelSerializer):
         model = UserProfileImage
         fields = ['image']
         
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(FinancialSummaryMixin, SparseFieldsetsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     user_profile_image = UserProfileImageSerializer(read_only=True)
     user_profile_image_id = serializers.PrimaryKeyRelatedField(
@@ -83,22 +115,6 @@ class UserSerializer(serializers.ModelSerializer):
             'by_status': status_counts
         }
     
-    def get_financial_summary(self, obj):
-        paid = 0
-        pending = 0
-        
-        for pill in obj.pills.all():
-            if pill.status == 'd':
-                paid += pill.final_price()
-            elif pill.status not in ['r', 'c']:
-                pending += pill.final_price()
-        
-        return {
-            'total_paid': paid,
-            'total_pending': pending,
-            'all_time_total': paid + pending
-        }
-
     def create(self, validated_data):
         profile_image = validated_data.pop('user_profile_image', None)
         email = validated_data.get('email', None)
@@ -196,7 +212,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
         ).order_by('-count').first()
         return favorite['category__name'] if favorite else None
 
-class UserDetailSerializer(serializers.ModelSerializer):
+class UserDetailSerializer(FinancialSummaryMixin, serializers.ModelSerializer):
     addresses = UserAddressSerializer(many=True, read_only=True)
     pill_stats = serializers.SerializerMethodField()
     loved_products = serializers.SerializerMethodField()
@@ -245,22 +261,6 @@ class UserDetailSerializer(serializers.ModelSerializer):
             'id', 'product__name', 'created_at'
         )
     
-    def get_financial_summary(self, obj):
-        paid = 0
-        pending = 0
-        
-        for pill in obj.pills.all():
-            if pill.status == 'd':
-                paid += pill.final_price()
-            elif pill.status not in ['r', 'c']:
-                pending += pill.final_price()
-        
-        return {
-            'total_paid': paid,
-            'total_pending': pending,
-            'all_time_total': paid + pending
-        }
-
     def get_cart_items(self, obj):
         from products.models import PillItem
         from products.serializers import PillItemSerializer
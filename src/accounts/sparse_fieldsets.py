@@ -0,0 +1,43 @@
+from rest_framework import serializers
+
+
+def parse_field_selection(request):
+    """Return (only, omit) from ?fields=a,b and ?omit=c; only is None when every field is wanted."""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None, set()
+    params = request.query_params
+    only = {name.strip() for name in params.get('fields', '').split(',') if name.strip()} or None
+    omit = {name.strip() for name in params.get('omit', '').split(',') if name.strip()}
+    return only, omit
+
+
+class SparseFieldsetsMixin:
+    """
+    Lets GET requests pick the serialized fields with ?fields= / ?omit=.
+
+    Unselected fields are dropped before binding, so their SerializerMethodFields
+    are never evaluated. Only the top-level serializer (or the child of a
+    top-level list) is narrowed; nested serializers keep all their fields.
+    """
+
+    @classmethod
+    def field_is_requested(cls, request, name):
+        only, omit = parse_field_selection(request)
+        return name not in omit and (only is None or name in only)
+
+    def _is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self._is_root():
+            return fields
+        only, omit = parse_field_selection(self.context.get('request'))
+        if only is not None:
+            fields = {name: field for name, field in fields.items() if name in only}
+        for name in omit:
+            fields.pop(name, None)
+        return fields
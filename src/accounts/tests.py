@@ -1,3 +1,27 @@
 from django.test import TestCase
 
-# Create your tests here.
+from products.models import Pill
+from .models import User
+from .serializers import FinancialSummaryMixin, with_financial_totals
+
+
+class FinancialSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='x')
+        for status, final in [('d', 120), ('d', 30), ('w', 50), ('c', 999), ('r', 999)]:
+            pill = Pill.objects.create(user=self.user)
+            Pill.objects.filter(pk=pill.pk).update(status=status, price_final=final)
+        User.objects.create_user(username='idle', password='x')
+
+    def test_totals_from_stored_breakdowns(self):
+        summary = FinancialSummaryMixin().get_financial_summary(self.user)
+        self.assertEqual(summary, {'total_paid': 150, 'total_pending': 50, 'all_time_total': 200})
+
+    def test_annotated_list_matches_and_reads_no_more(self):
+        users = list(with_financial_totals(User.objects.order_by('username')))
+        with self.assertNumQueries(0):
+            summaries = [FinancialSummaryMixin().get_financial_summary(user) for user in users]
+        self.assertEqual(summaries, [
+            {'total_paid': 150, 'total_pending': 50, 'all_time_total': 200},
+            {'total_paid': 0, 'total_pending': 0, 'all_time_total': 0},
+        ])
@@ -11,6 +11,7 @@ from django.core.mail import send_mail
 from django.utils import timezone
 from datetime import timedelta
 import random
+from .serializers import with_financial_totals
 from .serializers import ChangePasswordSerializer, UserAddressSerializer, UserDetailSerializer, UserProfileImageCreateSerializer, UserProfileImageSerializer, UserProfileSerializer, UserSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer
 from .models import User, UserAddress, UserProfileImage
 from django.contrib.auth import update_session_auth_hash
@@ -271,10 +272,7 @@ class UserProfileImageRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAP
 class AdminUserListView(generics.ListAPIView):
     serializer_class = UserSerializer
     # permission_classes = [IsAdminUser]
-    queryset = User.objects.prefetch_related(
-        'pills',
-        'loved_products'
-    ).order_by('-created_at')
+    queryset = User.objects.order_by('-created_at')
     
     filter_backends = [SearchFilter, OrderingFilter,DjangoFilterBackend]
     ordering_fields = [
@@ -285,6 +283,15 @@ class AdminUserListView(generics.ListAPIView):
     search_fields = ['username', 'name', 'email', 'phone','address', 'government', 'city']
     filterset_fields = ['is_staff', 'is_superuser','year', 'government']
 
+    def get_queryset(self):
+        # Only prefetch what the selected fields (?fields= / ?omit=) read
+        queryset = super().get_queryset()
+        if UserSerializer.field_is_requested(self.request, 'financial_summary'):
+            queryset = with_financial_totals(queryset)
+        if UserSerializer.field_is_requested(self.request, 'loved_count'):
+            queryset = queryset.prefetch_related('loved_products')
+        return queryset
+
 
 class AdminUserDetailView(generics.RetrieveAPIView):
     serializer_class = UserDetailSerializer
@@ -292,6 +299,9 @@ class AdminUserDetailView(generics.RetrieveAPIView):
     queryset = User.objects.all()
     lookup_field = 'pk'
 
+    def get_queryset(self):
+        return with_financial_totals(super().get_queryset())
+
 
 
 
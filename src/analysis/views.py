@@ -49,11 +49,9 @@ class ProductAnalyticsFilter(django_filters.FilterSet):
     
     def filter_is_low_stock(self, queryset, name, value):
         """
-        Filters the queryset based on the annotated 'is_low_stock' field.
-        The annotation (total_available <= threshold) is performed in the view.
+        Filters the queryset on the maintained Product.is_low_stock column
+        (stock_total <= threshold).
         """
-        # The `is_low_stock` annotation is already added in the view's get_queryset.
-        # This method will now correctly filter on that pre-calculated value.
         if value in (True, 'true', 'True', 1):
             return queryset.filter(is_low_stock=True)
         if value in (False, 'false', 'False', 0):
@@ -77,13 +75,6 @@ class ProductPerformanceView(generics.ListAPIView):
 
         # --- Subquery Definitions ---
 
-        # 1. Subquery for total available stock
-        avail_sq = Subquery(
-            ProductAvailability.objects.filter(
-                product=OuterRef('pk')
-            ).values('product').annotate(total=Sum('quantity')).values('total')
-        )
-
         # 2. Subquery for stock added within a date range
         added_filter = Q(product=OuterRef('pk'))
         if start_date_str and end_date_str:
@@ -114,10 +105,14 @@ class ProductPerformanceView(generics.ListAPIView):
             total=Sum(F('quantity') * F('price_at_sale'))
         ).values('total')
         
-        # 4. Subqueries for ratings
-        ratings_sq = Rating.objects.filter(product=OuterRef('pk')).values('product')
-        avg_rating_sq = ratings_sq.annotate(avg=Avg('star_number')).values('avg')
-        total_ratings_sq = ratings_sq.annotate(count=Count('id')).values('count')
+        # 4. Ratings come from the denormalized counters on Product
+        avg_rating = Case(
+            When(rating_count__gt=0, then=ExpressionWrapper(
+                F('rating_sum') * 1.0 / F('rating_count'), output_field=FloatField()
+            )),
+            default=0.0,
+            output_field=FloatField()
+        )
 
         # 5. Subquery for current discount
         now = timezone.now()
@@ -132,12 +127,12 @@ class ProductPerformanceView(generics.ListAPIView):
 
         # --- Main Annotation ---
         queryset = base_queryset.annotate(
-            total_available=Coalesce(avail_sq, 0, output_field=IntegerField()),
+            total_available=F('stock_total'),
             total_added=Coalesce(added_sq, 0, output_field=IntegerField()),
             total_sold=Coalesce(total_sold_sq, 0, output_field=IntegerField()),
             revenue=Coalesce(revenue_sq, 0.0, output_field=FloatField()),
-            average_rating=Coalesce(avg_rating_sq, 0.0, output_field=FloatField()),
-            total_ratings=Coalesce(total_ratings_sq, 0, output_field=IntegerField()),
+            average_rating=avg_rating,
+            total_ratings=F('rating_count'),
             current_discount=Coalesce(current_discount_sq, 0.0, output_field=FloatField()),
         ).annotate(
             price_after_discount=Case(
@@ -149,11 +144,6 @@ class ProductPerformanceView(generics.ListAPIView):
                 When(current_discount__gt=0, then=True),
                 default=False,
                 output_field=BooleanField()
-            ),
-            is_low_stock=Case(
-                When(total_available__lte=F('threshold'), then=True),
-                default=False,
-                output_field=BooleanField()
             )
         )
 
@@ -177,7 +167,7 @@ class CategoryPerformanceView(generics.ListAPIView):
             Product.objects.filter(
                 category=OuterRef('pk')
             ).values('category').annotate(
-                total=Sum('availabilities__quantity')
+                total=Sum('stock_total')
             ).values('total')
         )
 
@@ -282,16 +272,10 @@ class ProductInventoryView(APIView):
     """
     def get(self, request):
         # 1. Low stock products
-        total_quantity = ProductAvailability.objects.filter(
-            product=OuterRef('pk')
-        ).values('product').annotate(
-            total=Sum('quantity')
-        ).values('total')
-        
-        low_stock = Product.objects.annotate(
-            current_quantity=Subquery(total_quantity)
-        ).filter(
-            current_quantity__lte=F('threshold')
+        low_stock = Product.objects.filter(
+            is_low_stock=True
+        ).annotate(
+            current_quantity=F('stock_total')
         ).values('id', 'name', 'threshold', 'current_quantity')
         
         # 2. Special products count
@@ -275,6 +275,14 @@ KHAZENLY_REFRESH_TOKEN = os.getenv('KHAZENLY_REFRESH_TOKEN', '')
 # Khazenly Webhook Configuration
 KHAZENLY_WEBHOOK_SECRET = os.getenv('KHAZENLY_WEBHOOK_SECRET', '')  # Will be provided by Khazenly
 
+# Base (0-999) of this host's pill number node ids; each worker adds its own index to it, so only
+# hosts sharing the database need different, well-spaced bases (see products.pill_numbers)
+PILL_NUMBER_NODE_ID = os.getenv('PILL_NUMBER_NODE_ID')
+
+# How long checkout holds a pill's stock while it is unpaid. Expired holds are only given back by
+# the release_expired_stock_holds command, which must be scheduled (see README)
+STOCK_RESERVATION_TTL_MINUTES = int(os.getenv('STOCK_RESERVATION_TTL_MINUTES', 30))
+
 
 # Fawaterak Configuration - with fallbacks and validation
 # Site URL
@@ -0,0 +1,7 @@
+"""Gunicorn settings, read from the working directory: run `gunicorn core.wsgi` from src/."""
+import os
+
+
+def post_fork(server, worker):
+    # Every worker gets its own pill number node id (products.pill_numbers)
+    os.environ['PILL_NUMBER_WORKER'] = str(worker.age)
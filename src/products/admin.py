@@ -7,7 +7,7 @@ from .models import (
     Color, ProductAvailability, Shipping, PillItem, Pill, PillAddress,
     PillStatusLog, CouponDiscount, Rating, Discount, PayRequest, LovedProduct,
     StockAlert, PriceDropAlert, SpecialProduct, SpinWheelDiscount,
-    SpinWheelResult, SpinWheelSettings, PillGift
+    SpinWheelResult, SpinWheelSettings, PillGift, StockReservation
 )
 
 
@@ -107,7 +107,7 @@ class ProductAdmin(admin.ModelAdmin):
             return format_html('<img src="{}" width="50" height="50" />', obj.base_image.url)
         return "No Image"
     
-    @admin.display(description='Total Quantity', ordering='total_quantity')
+    @admin.display(description='Total Quantity', ordering='stock_total')
     def get_total_quantity(self, obj):
         return obj.total_quantity()
 
@@ -412,6 +412,7 @@ admin.site.register(ProductDescription)
 admin.site.register(PillItem)
 # admin.site.register(PillAddress)
 admin.site.register(PillStatusLog)
+admin.site.register(StockReservation)
 admin.site.register(PriceDropAlert)
 admin.site.register(SpinWheelResult)
 admin.site.register(SpinWheelSettings)
\ No newline at end of file
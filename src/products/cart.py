@@ -0,0 +1,56 @@
+"""
+Cart snapshots: what the cart endpoints show about a set of cart lines.
+
+The lines' products get their availabilities in one query and any stale
+materialized price recomputed in one batch (Product.prefetch_listing_data),
+then max quantities, line totals and the cart total are worked out in
+memory. The PillItem serializers read max_quantity and total_price from one
+snapshot per list instead of querying once per line.
+"""
+from collections import namedtuple
+
+from django.db import models
+
+from .models import PillItem, Product
+
+# has_variant: the product has an inventory record for the line's size and color
+CartLine = namedtuple('CartLine', ['item', 'unit_price', 'total_price', 'max_quantity', 'has_variant'])
+SNAPSHOT_FIELDS = {'availabilities', 'discounted_price'}
+
+
+class CartSnapshot:
+    def __init__(self, items):
+        self.items = list(items)
+        # Every instance, not one per product: rows selected together carry their own copies
+        products = [item.product for item in self.items if item.product_id]
+        Product.prefetch_listing_data(products, SNAPSHOT_FIELDS)
+        models.prefetch_related_objects(self.items, 'color')
+        self.lines = [self._line_for(item) for item in self.items]
+        self._by_pk = {line.item.pk: line for line in self.lines if line.item.pk is not None}
+        self.total = sum(line.total_price for line in self.lines)
+
+    @classmethod
+    def for_user(cls, user):
+        """The user's cart: the lines not yet in a pill, newest first."""
+        return cls(
+            PillItem.objects.filter(user=user, status__isnull=True)
+            .select_related('product', 'color').order_by('-date_added')
+        )
+
+    @staticmethod
+    def _line_for(item):
+        product = item.product if item.product_id else None
+        if product is None:
+            return CartLine(item, 0, 0, 0, False)
+        unit_price = product.discounted_price()
+        has_variant = any(
+            a.size == item.size and a.color_id == item.color_id for a in product.availabilities.all()
+        )
+        return CartLine(
+            item, unit_price, unit_price * item.quantity, product.available_quantity(item.size, item.color), has_variant
+        )
+
+    def line(self, item):
+        """The CartLine of one of the snapshot's items; any other item is looked up on its own."""
+        line = self._by_pk.get(item.pk) if item.pk is not None else None
+        return line if line is not None else CartSnapshot([item]).lines[0]
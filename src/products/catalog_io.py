@@ -0,0 +1,341 @@
+"""
+Bulk catalog import and export, used by the catalog_import / catalog_export
+commands and the dashboard import/export endpoints.
+
+Rows are streamed as CSV or JSON Lines and written CHUNK_SIZE at a time with
+bulk_create / bulk_update, so memory stays flat whatever the file size.
+Taxonomy columns hold names (natural keys) resolved through in-memory maps,
+and product ids are reserved before the INSERT so product_number is written
+with the row instead of by a second UPDATE. Bulk writes send no signals, so
+effective prices, search documents and the catalog version are refreshed here.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import NotSupportedError, connection, transaction
+from django.db.models import Max
+from django.db.transaction import TransactionManagementError
+from django.utils import timezone
+
+from .models import Brand, CatalogVersion, Category, Product, SubCategory, Subject, Teacher
+from .search import build_document, index_documents
+
+CHUNK_SIZE = 1000
+FORMATS = ['csv', 'jsonl']
+COLUMNS = [
+    'product_number', 'name', 'type', 'year', 'category', 'sub_category', 'subject', 'teacher', 'brand',
+    'price', 'threshold', 'description', 'is_important',
+]
+VALUE_FIELDS = ['name', 'type', 'year', 'price', 'threshold', 'description', 'is_important']
+RELATION_FIELDS = ['category', 'sub_category', 'subject', 'teacher', 'brand']
+MAX_REPORTED_ERRORS = 100
+BOOLEAN_STRINGS = {'true': True, 't': True, 'yes': True, '1': True, 'false': False, 'f': False, 'no': False, '0': False}
+
+
+def guess_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    return default
+
+
+def product_number_for(product_id):
+    return f"Bookefy-{product_id}"
+
+
+def reserve_product_ids(count):
+    """
+    Allocate `count` new Product ids before inserting the rows. Ids are never
+    reused, not even those of deleted products, since product numbers are
+    built from them and sent to Khazenly. Outside PostgreSQL this must run in
+    the transaction that inserts them.
+    """
+    if not count:
+        return []
+    table = Product._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, count]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    # Elsewhere the auto-increment counter moves past explicit ids on its own, so the
+    # ids follow the counter, read under a lock held until the rows are inserted
+    if not connection.in_atomic_block:
+        raise TransactionManagementError('reserve_product_ids must run inside the transaction inserting the rows.')
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # SQLite ignores SELECT ... FOR UPDATE; any write statement takes its database write lock
+            cursor.execute(f'UPDATE {connection.ops.quote_name(table)} SET id = id WHERE 0')
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            last = row[0] if row else 0
+        elif connection.vendor == 'mysql':
+            # Locks the newest row and the gap after it, so concurrent inserts wait
+            Product.objects.select_for_update().order_by('-id').values_list('id', flat=True).first()
+            if not connection.mysql_is_mariadb:
+                # MySQL 8 caches information_schema table statistics by default
+                cursor.execute('SET SESSION information_schema_stats_expiry = 0')
+            cursor.execute(
+                'SELECT AUTO_INCREMENT FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [table]
+            )
+            last = (cursor.fetchone()[0] or 1) - 1
+        else:
+            raise NotSupportedError(f'reserve_product_ids does not support {connection.vendor}.')
+    # A table created without AUTOINCREMENT keeps no counter: fall back to the highest id
+    last = max(last, Product.objects.aggregate(last=Max('id'))['last'] or 0)
+    start = last + 1
+    return list(range(start, start + count))
+
+
+class TaxonomyResolver:
+    """Name <-> id maps for the taxonomy tables, creating missing entries on first use."""
+
+    def __init__(self):
+        # id -> name per product foreign key, also used to build search documents
+        self.names_by_id = {'category_id': {}, 'brand_id': {}, 'subject_id': {}, 'teacher_id': {}}
+        self.categories = self._load(Category, 'category_id')
+        self.brands = self._load(Brand, 'brand_id')
+        self.subjects = self._load(Subject, 'subject_id')
+        self.sub_categories = {
+            (category_id, name): pk
+            for pk, category_id, name in SubCategory.objects.order_by('-id').values_list('id', 'category_id', 'name')
+        }
+        self.teachers = {}
+        self.teachers_by_name = {}
+        for pk, subject_id, name in Teacher.objects.order_by('-id').values_list('id', 'subject_id', 'name'):
+            self.teachers[(subject_id, name)] = pk
+            self.teachers_by_name[name] = pk
+            self.names_by_id['teacher_id'][pk] = name
+
+    def _load(self, model, field):
+        # Newest first, so the oldest row wins when names repeat
+        names = {}
+        for pk, name in model.objects.order_by('-id').values_list('id', 'name'):
+            names[name] = pk
+            self.names_by_id[field][pk] = name
+        return names
+
+    def resolve(self, row):
+        """Return {field_id: pk} for the taxonomy columns present in a row (None for empty ones)."""
+        names = {field: str(row.get(field) or '').strip() for field in RELATION_FIELDS}
+        ids = dict.fromkeys((f'{field}_id' for field in RELATION_FIELDS if field in row))
+        if names['category']:
+            ids['category_id'] = self._get_or_create(self.categories, names['category'], Category, 'category_id')
+        if names['brand']:
+            ids['brand_id'] = self._get_or_create(self.brands, names['brand'], Brand, 'brand_id')
+        if names['subject']:
+            ids['subject_id'] = self._get_or_create(self.subjects, names['subject'], Subject, 'subject_id')
+
+        if names['sub_category']:
+            if not ids.get('category_id'):
+                raise ValidationError("sub_category needs a category.")
+            key = (ids['category_id'], names['sub_category'])
+            if key not in self.sub_categories:
+                self.sub_categories[key] = SubCategory.objects.create(
+                    category_id=ids['category_id'], name=names['sub_category']
+                ).pk
+            ids['sub_category_id'] = self.sub_categories[key]
+
+        if names['teacher']:
+            key = (ids.get('subject_id'), names['teacher'])
+            if key in self.teachers:
+                ids['teacher_id'] = self.teachers[key]
+            elif not ids.get('subject_id') and names['teacher'] in self.teachers_by_name:
+                ids['teacher_id'] = self.teachers_by_name[names['teacher']]
+            elif ids.get('subject_id'):
+                teacher = Teacher.objects.create(subject_id=ids['subject_id'], name=names['teacher'])
+                self.teachers[key] = self.teachers_by_name[teacher.name] = teacher.pk
+                self.names_by_id['teacher_id'][teacher.pk] = teacher.name
+                ids['teacher_id'] = teacher.pk
+            else:
+                raise ValidationError(f"Unknown teacher '{names['teacher']}' (give a subject to create it).")
+        return ids
+
+    def _get_or_create(self, names, name, model, field):
+        if name not in names:
+            names[name] = model.objects.create(name=name).pk
+            self.names_by_id[field][names[name]] = name
+        return names[name]
+
+    def taxonomy_names(self, product):
+        """Category, brand, subject and teacher names of a product, for its search document."""
+        return [
+            by_id.get(getattr(product, field), '')
+            for field, by_id in self.names_by_id.items()
+            if getattr(product, field) is not None
+        ]
+
+
+class CatalogImporter:
+    """
+    Import catalog rows: a row whose product_number matches an existing product
+    updates it, every other row creates a new product. An update only touches
+    the columns present in its row; an empty cell or null clears the field.
+    Invalid rows are skipped and reported in ``errors`` as (line, message).
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors = []
+        self.taxonomy = None
+
+    def run(self, stream, file_format):
+        self.taxonomy = TaxonomyResolver()
+        rows = self._clean_rows(read_rows(stream, file_format))
+        while chunk := list(islice(rows, self.chunk_size)):
+            self._write_chunk(chunk)
+        if self.created or self.updated:
+            CatalogVersion.bump(structure=True)
+        return self
+
+    def _error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def _clean_rows(self, rows):
+        for line, row in rows:
+            if isinstance(row, ValidationError):
+                self._error(line, '; '.join(row.messages))
+                continue
+            try:
+                values = self._clean_values(row, [name for name in VALUE_FIELDS if name in row])
+                values.update(self.taxonomy.resolve(row))
+            except ValidationError as e:
+                self._error(line, '; '.join(e.messages))
+                continue
+            yield line, str(row.get('product_number') or '').strip(), values
+
+    @staticmethod
+    def _clean_values(row, names):
+        values = {}
+        for name in names:
+            field = Product._meta.get_field(name)
+            value = row.get(name)
+            if value is None or value == '':
+                # Empty CSV cells mean "not set", like a JSON null
+                if field.null:
+                    value = None
+                elif field.has_default():
+                    value = field.get_default()
+            elif isinstance(value, str) and field.get_internal_type() == 'BooleanField':
+                value = BOOLEAN_STRINGS.get(value.strip().lower(), value)
+            try:
+                values[name] = field.clean(value, None)
+            except ValidationError as e:
+                raise ValidationError(f"{name}: {'; '.join(e.messages)}")
+        return values
+
+    def _write_chunk(self, chunk):
+        numbers = [number for _, number, _ in chunk if number]
+        existing = {product.product_number: product for product in Product.objects.filter(product_number__in=numbers)}
+        now = timezone.now()
+        to_create, to_update = [], []
+        for line, number, values in chunk:
+            product = existing.get(number)
+            if product is None:
+                # New products take the defaults of the columns the row leaves out
+                try:
+                    missing = self._clean_values({}, [name for name in VALUE_FIELDS if name not in values])
+                except ValidationError as e:
+                    self._error(line, '; '.join(e.messages))
+                    continue
+                to_create.append(Product(**missing, **values))
+            else:
+                for name, value in values.items():
+                    setattr(product, name, value)
+                product.updated_at = now
+                to_update.append(product)
+
+        products = to_create + to_update
+        with transaction.atomic():
+            for product, product_id in zip(to_create, reserve_product_ids(len(to_create))):
+                product.pk = product_id
+                product.product_number = product_number_for(product_id)
+                product.is_low_stock = product.stock_total <= product.threshold
+
+            by_product, by_category = Product._pending_discounts(products, now)
+            for product in products:
+                product._set_effective_price(
+                    by_product.get(product.pk, []), by_category.get(product.category_id, []), now
+                )
+
+            Product.objects.bulk_create(to_create, batch_size=self.chunk_size)
+            if to_update:
+                # An upsert on id: bulk_update's per-row CASE expressions cost milliseconds a row to build
+                Product.objects.bulk_create(
+                    to_update,
+                    batch_size=self.chunk_size,
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=VALUE_FIELDS + RELATION_FIELDS + Product.EFFECTIVE_PRICE_FIELDS + ['updated_at'],
+                )
+                # Thresholds may have changed; evaluated in SQL against the live stock_total
+                Product.objects.filter(pk__in=[p.pk for p in to_update]).update(
+                    is_low_stock=Product._low_stock_expression()
+                )
+        index_documents([build_document(product, self.taxonomy.taxonomy_names(product)) for product in products])
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+
+def read_rows(stream, file_format):
+    """Yield (line number, row dict) from a text stream; malformed JSON lines yield the error instead."""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, ValidationError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line_number, ValidationError("Each line must be a JSON object.")
+            continue
+        yield line_number, row
+
+
+def export_rows(queryset=None):
+    queryset = Product.objects.all() if queryset is None else queryset
+    queryset = queryset.select_related('category', 'sub_category', 'subject', 'teacher', 'brand').order_by('id')
+    for product in queryset.iterator(chunk_size=CHUNK_SIZE):
+        row = {name: getattr(product, name) for name in ['product_number'] + VALUE_FIELDS}
+        for name in RELATION_FIELDS:
+            related = getattr(product, name)
+            row[name] = related.name if related else None
+        yield {column: row[column] for column in COLUMNS}
+
+
+def export_chunks(file_format, queryset=None):
+    """Yield the export as text, one block of rows at a time."""
+    if file_format == 'jsonl':
+        rows = (json.dumps(row, ensure_ascii=False) + '\n' for row in export_rows(queryset))
+        while block := list(islice(rows, CHUNK_SIZE)):
+            yield ''.join(block)
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, COLUMNS)
+    writer.writeheader()
+    for count, row in enumerate(export_rows(queryset), start=1):
+        writer.writerow(row)
+        if count % CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,22 @@
+import os
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+from .pill_numbers import NODE_DIGITS
+
+
+@register()
+def check_pill_number_node(app_configs, **kwargs):
+    """A malformed node id would otherwise only surface when the first pill is created."""
+    errors = []
+    configured = os.environ.get('PILL_NUMBER_NODE_ID') or getattr(settings, 'PILL_NUMBER_NODE_ID', None)
+    if configured not in (None, '') and not (str(configured).isdigit() and int(configured) < 10 ** NODE_DIGITS):
+        errors.append(Error(
+            f'PILL_NUMBER_NODE_ID must be a whole number from 0 to {10 ** NODE_DIGITS - 1}, got {configured!r}.',
+            id='products.E001',
+        ))
+    worker = os.environ.get('PILL_NUMBER_WORKER')
+    if worker and not worker.isdigit():
+        errors.append(Error(f'PILL_NUMBER_WORKER must be a whole number, got {worker!r}.', id='products.E002'))
+    return errors
@@ -0,0 +1,63 @@
+from calendar import timegm
+
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import CatalogVersion, Product
+
+
+def catalog_validators(include_prices=False):
+    """
+    Strong ETag and Last-Modified of the current catalog, from the CatalogVersion
+    row (plus one indexed aggregate when include_prices is set).
+    """
+    version, last_modified = CatalogVersion.current()
+    tag = f'catalog-{version}'
+    if include_prices:
+        # Effective prices also change without a write, when a discount starts or ends
+        boundary = Product.objects.filter(
+            effective_price_valid_until__lte=timezone.now()
+        ).aggregate(latest=Max('effective_price_valid_until'))['latest']
+        if boundary is not None:
+            tag = f'{tag}-{int(boundary.timestamp())}'
+            last_modified = max(last_modified, boundary)
+    return f'"{tag}"', last_modified
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+    # Clients may keep the payload but must revalidate it before every use
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """The 304 (or 412) response when the request's validators still match, else None."""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timegm(last_modified.utctimetuple())
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+class ConditionalCatalogMixin:
+    """
+    Answers GETs on a catalog view with 304 Not Modified when the client's
+    If-None-Match / If-Modified-Since still match the catalog version, before
+    the view's queryset is evaluated or anything is serialized.
+    """
+    conditional_include_prices = False
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = catalog_validators(self.conditional_include_prices)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_validators(response, etag, last_modified)
+        return response
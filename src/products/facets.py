@@ -0,0 +1,148 @@
+"""
+In-memory facet index for the storefront filter sidebar.
+
+Every facet value maps to a bitset (a Python int, one bit per product), so the
+counts of all facets for a result set come from ANDs and popcounts instead of
+one GROUP BY per facet. The index is loaded with two queries and rebuilt by
+the first request that sees a new catalog structure version
+(CatalogVersion.structure_version): product, inventory record, image and
+taxonomy writes, not stock or price changes.
+"""
+import threading
+
+from .models import CatalogVersion, Product, ProductAvailability
+
+# facet -> (Product value field, label field or None for choice labels)
+PRODUCT_FACETS = {
+    'category': ('category_id', 'category__name'),
+    'sub_category': ('sub_category_id', 'sub_category__name'),
+    'subject': ('subject_id', 'subject__name'),
+    'teacher': ('teacher_id', 'teacher__name'),
+    'brand': ('brand_id', 'brand__name'),
+    'year': ('year', None),
+    'type': ('type', None),
+}
+# Matched case-insensitively, like ProductFilter's color/size filters
+AVAILABILITY_FACETS = ['color', 'size']
+FACETS = list(PRODUCT_FACETS) + AVAILABILITY_FACETS
+FLAGS = ['is_important', 'has_images']
+
+
+class FacetIndex:
+    def __init__(self, version):
+        self.version = version
+        self.positions = {}
+        self.all = 0
+        self.bitsets = {facet: {} for facet in FACETS}
+        self.labels = {facet: {} for facet in FACETS}
+        self.flags = dict.fromkeys(FLAGS, 0)
+
+    @classmethod
+    def build(cls, version):
+        index = cls(version)
+        choice_labels = {
+            facet: dict(Product._meta.get_field(facet).flatchoices)
+            for facet, (_, label_field) in PRODUCT_FACETS.items() if label_field is None
+        }
+        fields = [field for pair in PRODUCT_FACETS.values() for field in pair if field]
+        rows = Product.objects.order_by().values('id', 'is_important', 'primary_image_name', *fields)
+        for position, row in enumerate(rows.iterator(chunk_size=2000)):
+            bit = 1 << position
+            index.positions[row['id']] = position
+            index.all |= bit
+            if row['is_important']:
+                index.flags['is_important'] |= bit
+            if row['primary_image_name']:
+                index.flags['has_images'] |= bit
+            for facet, (value_field, label_field) in PRODUCT_FACETS.items():
+                key = row[value_field]
+                if key is None:
+                    continue
+                label = row[label_field] if label_field else choice_labels[facet].get(key, key)
+                index._add(facet, key, label, bit)
+
+        availabilities = ProductAvailability.objects.order_by().values_list(
+            'product_id', 'color__name', 'size'
+        ).distinct()
+        for product_id, color, size in availabilities.iterator(chunk_size=2000):
+            position = index.positions.get(product_id)
+            if position is None:
+                continue
+            bit = 1 << position
+            for facet, value in (('color', color), ('size', size)):
+                if value:
+                    index._add(facet, value.lower(), value, bit)
+        return index
+
+    def _add(self, facet, key, label, bit):
+        bitsets = self.bitsets[facet]
+        if key not in bitsets:
+            bitsets[key] = 0
+            self.labels[facet][key] = label
+        bitsets[key] |= bit
+
+    def mask_for_ids(self, product_ids):
+        mask = 0
+        for product_id in product_ids:
+            position = self.positions.get(product_id)
+            if position is not None:
+                mask |= 1 << position
+        return mask
+
+    def facet_mask(self, facet, key):
+        if facet in AVAILABILITY_FACETS:
+            key = key.lower()
+        return self.bitsets[facet].get(key, 0)
+
+    def flag_mask(self, flag, value):
+        return self.flags[flag] if value else self.all & ~self.flags[flag]
+
+    def counts(self, selected, flags=None, restrict=None):
+        """
+        Count every facet value within the products matching ``selected``
+        ({facet: key}), ``flags`` ({flag: bool}) and the ``restrict`` bitset.
+
+        A facet's own selection is left out of its counts, so the sidebar can
+        still show how many products each alternative value would give.
+        Returns (total, {facet: [{'value', 'label', 'count'}, ...]}).
+        """
+        base = self.all if restrict is None else self.all & restrict
+        for flag, value in (flags or {}).items():
+            base &= self.flag_mask(flag, value)
+        masks = {facet: self.facet_mask(facet, key) for facet, key in selected.items()}
+
+        total = base
+        for mask in masks.values():
+            total &= mask
+
+        facets = {}
+        for facet in FACETS:
+            scope = base
+            for other, mask in masks.items():
+                if other != facet:
+                    scope &= mask
+            values = [
+                {'value': key, 'label': self.labels[facet][key], 'count': (bitset & scope).bit_count()}
+                for key, bitset in self.bitsets[facet].items()
+            ]
+            values = [value for value in values if value['count']]
+            values.sort(key=lambda value: (-value['count'], str(value['label'])))
+            facets[facet] = values
+        return total.bit_count(), facets
+
+
+_index = None
+_build_lock = threading.Lock()
+
+
+def get_facet_index():
+    """The facet index of the current structure version, rebuilding it at most once per version."""
+    global _index
+    version = CatalogVersion.current_structure()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _build_lock:
+        if _index is None or _index.version != version:
+            _index = FacetIndex.build(version)
+        return _index
@@ -4,6 +4,15 @@ from django_filters import rest_framework as filters
 from django.db.models import Q, F, FloatField, Case, When,Exists, OuterRef
 from django.utils import timezone
 from .models import Product, CouponDiscount
+from .search import search_products
+
+class FinalPriceOrderingFilter(filters.OrderingFilter):
+    """OrderingFilter that adds the final_price annotation when ordering by it."""
+
+    def filter(self, qs, value):
+        if value and any(param.lstrip('-') == 'final_price' for param in value):
+            qs = Product.annotate_final_price(qs)
+        return super().filter(qs, value)
 
 class ProductFilter(filters.FilterSet):
     price_min = filters.NumberFilter(method='filter_by_discounted_price_min')
@@ -11,82 +20,18 @@ class ProductFilter(filters.FilterSet):
     color = filters.CharFilter(method='filter_by_color')
     size = filters.CharFilter(method='filter_by_size')
     has_images = filters.BooleanFilter(method='filter_has_images')
+    search = filters.CharFilter(method='filter_search')
+    ordering = FinalPriceOrderingFilter(fields=('final_price', 'price', 'date_added', 'name'))
 
     class Meta:
         model = Product
         fields = ['category', 'sub_category', 'subject', 'teacher' ,'brand', 'has_images','is_important','type','year']
 
     def filter_by_discounted_price_min(self, queryset, name, value):
-        now = timezone.now()
-
-        # Annotate the queryset with product discounts
-        queryset = queryset.annotate(
-            product_discount_price=Case(
-                When(
-                    Q(discounts__discount_start__lte=now) &
-                    Q(discounts__discount_end__gte=now),
-                    then=F('price') * (1 - F('discounts__discount') / 100)
-                ),
-                default=F('price'),
-                output_field=FloatField()
-            ),
-            category_discount_price=Case(
-                When(
-                    Q(category__discounts__discount_start__lte=now) &
-                    Q(category__discounts__discount_end__gte=now),
-                    then=F('price') * (1 - F('category__discounts__discount') / 100)
-                ),
-                default=F('price'),
-                output_field=FloatField()
-            )
-        ).annotate(
-            final_price=Case(
-                When(
-                    product_discount_price__lt=F('category_discount_price'),
-                    then=F('product_discount_price')
-                ),
-                default=F('category_discount_price'),
-                output_field=FloatField()
-            )
-        )
-
-        return queryset.filter(final_price__gte=value).distinct()
+        return Product.annotate_final_price(queryset).filter(final_price__gte=value)
 
     def filter_by_discounted_price_max(self, queryset, name, value):
-        now = timezone.now()
-
-        # Same annotation logic as above
-        queryset = queryset.annotate(
-            product_discount_price=Case(
-                When(
-                    Q(discounts__discount_start__lte=now) &
-                    Q(discounts__discount_end__gte=now),
-                    then=F('price') * (1 - F('discounts__discount') / 100)
-                ),
-                default=F('price'),
-                output_field=FloatField()
-            ),
-            category_discount_price=Case(
-                When(
-                    Q(category__discounts__discount_start__lte=now) &
-                    Q(category__discounts__discount_end__gte=now),
-                    then=F('price') * (1 - F('category__discounts__discount') / 100)
-                ),
-                default=F('price'),
-                output_field=FloatField()
-            )
-        ).annotate(
-            final_price=Case(
-                When(
-                    product_discount_price__lt=F('category_discount_price'),
-                    then=F('product_discount_price')
-                ),
-                default=F('category_discount_price'),
-                output_field=FloatField()
-            )
-        )
-
-        return queryset.filter(final_price__lte=value).distinct()
+        return Product.annotate_final_price(queryset).filter(final_price__lte=value)
 
     def filter_by_color(self, queryset, name, value):
         return queryset.filter(availabilities__color__name__iexact=value).distinct()
@@ -102,12 +47,24 @@ class ProductFilter(filters.FilterSet):
             # Filter products that do not have any related images
             return queryset.filter(~Exists(ProductImage.objects.filter(product=OuterRef('pk'))))
 
+    def filter_search(self, queryset, name, value):
+        return search_products(queryset, value)
+
     def filter_queryset(self, queryset):
         # Apply all filters (including search)
         queryset = super().filter_queryset(queryset)
-        # Simply order the results without slicing
+        # An explicit ?ordering= wins; otherwise best matches first when searching, newest first
+        if self.form.cleaned_data.get('ordering'):
+            return queryset.order_by(*queryset.query.order_by, '-date_added')
+        if 'search_rank' in queryset.query.annotations:
+            return queryset.order_by('-search_rank', '-date_added')
         return queryset.order_by('-date_added')
-    
+
+
+class DashboardProductFilter(ProductFilter):
+    # The dashboard lists keep DRF's SearchFilter over their own search_fields
+    search = None
+
     
     
     
@@ -0,0 +1,68 @@
+import time
+
+from django.core.cache import cache
+
+from .conditional import catalog_validators
+from .models import CatalogVersion
+
+# Entries are served as-is for FRESH_SECONDS, then served stale (while one request
+# rebuilds them) until STALE_SECONDS, after which they are dropped from the cache.
+FRESH_SECONDS = 60
+STALE_SECONDS = 60 * 60
+REBUILD_LOCK_SECONDS = 30
+COLD_MISS_WAIT_SECONDS = 2
+
+
+def get_version():
+    """Entries are keyed by the catalog ETag, so any catalog write or price boundary makes them stale."""
+    return catalog_validators(include_prices=True)[0]
+
+
+def invalidate(structure=False):
+    """
+    Mark every cached homepage response stale; they are rebuilt on their next hit.
+    ``structure`` also rebuilds the facet and suggest indexes.
+    """
+    CatalogVersion.bump(structure=structure)
+
+
+def get_or_build(request, name, limit, build, version=None):
+    """
+    Return (payload, version) for (endpoint, limit), calling build() when the
+    cached payload is missing or stale. Only the request holding the rebuild
+    lock calls build(); everyone else gets the stale payload, or waits briefly
+    on a cold miss. version is the catalog version the payload was built at.
+    """
+    # ?fields= / ?omit= change the serialized shape, so they are part of the key
+    selection = f"{request.query_params.get('fields', '')}:{request.query_params.get('omit', '')}"
+    key = f'homepage:{name}:{request.scheme}:{request.get_host()}:{limit}:{selection}'
+    lock_key = f'{key}:lock'
+    if version is None:
+        version = get_version()
+
+    entry = cache.get(key)
+    if entry and entry['version'] == version and entry['fresh_until'] > time.time():
+        return entry['data'], version
+
+    locked = cache.add(lock_key, 1, timeout=REBUILD_LOCK_SECONDS)
+    if not locked:
+        if entry:
+            return entry['data'], entry['version']
+        deadline = time.time() + COLD_MISS_WAIT_SECONDS
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry:
+                return entry['data'], entry['version']
+
+    try:
+        data = build()
+        cache.set(key, {
+            'version': version,
+            'fresh_until': time.time() + FRESH_SECONDS,
+            'data': data,
+        }, timeout=STALE_SECONDS)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return data, version
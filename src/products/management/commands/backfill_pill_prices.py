@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.models import Pill
+
+
+class Command(BaseCommand):
+    help = 'Store the price breakdown of pills priced before breakdowns were stored (run once after upgrading)'
+
+    def handle(self, *args, **kwargs):
+        count = 0
+        for pill in Pill.objects.filter(price_final__isnull=True).iterator(chunk_size=500):
+            pill.refresh_price_breakdown()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Stored price breakdowns for {count} pills.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from products.catalog_io import FORMATS, export_chunks, guess_format
+
+
+class Command(BaseCommand):
+    help = 'Export every product as CSV or JSON Lines, streamed to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file (default: stdout)')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension, else csv)')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or guess_format(options['path'])
+        if options['path'] == '-':
+            for chunk in export_chunks(file_format):
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['path'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in export_chunks(file_format):
+                output.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f'Exported the catalog to {options["path"]}.'))
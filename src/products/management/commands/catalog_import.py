@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.catalog_io import CHUNK_SIZE, FORMATS, CatalogImporter, guess_format
+
+
+class Command(BaseCommand):
+    help = 'Import products from a CSV or JSON Lines file (see products.catalog_io for the columns)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file extension, else csv)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows written per bulk query')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or guess_format(options['path'])
+        try:
+            stream = open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f'Cannot open {options["path"]}: {e}')
+
+        with stream:
+            importer = CatalogImporter(chunk_size=options['chunk_size']).run(stream, file_format)
+
+        for line, message in importer.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {importer.created} products, updated {importer.updated}, skipped {importer.skipped}.'
+        ))
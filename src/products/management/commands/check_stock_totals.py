@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Check Product.stock_total/is_low_stock against ProductAvailability and optionally repair them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Write the recomputed totals for every mismatched product')
+
+    def handle(self, *args, **options):
+        mismatches = Product.recount_stock(commit=options['fix'])
+        for product, old_total, new_total in mismatches:
+            self.stdout.write(f'{product.pk} {product.name}: stock_total {old_total} -> {new_total}')
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('All stock totals are consistent.'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {len(mismatches)} products.'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(mismatches)} products are out of sync. Run with --fix to repair them.'))
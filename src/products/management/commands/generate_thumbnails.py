@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from products.models import Product, ProductImage, SpecialProduct
+from products.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Generate missing WebP/JPEG thumbnails and refresh the primary image of every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate thumbnails that already exist')
+
+    def handle(self, *args, **options):
+        force = options['force']
+        count = 0
+        for product in Product.objects.exclude(base_image='').exclude(base_image__isnull=True).only('id', 'base_image').iterator():
+            count += generate_thumbnails(product.base_image, force=force)
+        for product_image in ProductImage.objects.only('id', 'image').iterator():
+            count += generate_thumbnails(product_image.image, force=force)
+        for special in SpecialProduct.objects.exclude(special_image='').exclude(special_image__isnull=True).only('id', 'special_image').iterator():
+            count += generate_thumbnails(special.special_image, force=force)
+
+        Product.refresh_primary_images(Product.objects.values('pk'))
+        self.stdout.write(self.style.SUCCESS(f'Generated {count} thumbnails.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.search import get_search_backend, index_products
+
+
+class Command(BaseCommand):
+    help = 'Create the product full-text index if needed and rebuild every search document'
+
+    def handle(self, *args, **kwargs):
+        backend = get_search_backend()
+        backend.setup()
+        backend.clear()
+        index_products(Product.objects.all())
+        self.stdout.write(self.style.SUCCESS(f'Indexed {Product.objects.count()} products.'))
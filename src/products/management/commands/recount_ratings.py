@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized rating count, sum and per-star histogram on every product'
+
+    def handle(self, *args, **kwargs):
+        count = Product.recount_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Recounted ratings for {count} products.'))
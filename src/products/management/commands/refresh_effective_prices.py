@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from products.models import Product
+
+class Command(BaseCommand):
+    help = 'Recompute materialized product prices whose discount window has started or ended'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute every product (use once to backfill)')
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if not options['all']:
+            products = products.filter(
+                Q(effective_price_valid_until__lt=timezone.now()) |
+                Q(effective_price__isnull=True, price__isnull=False)
+            )
+        count = Product.refresh_effective_prices(products.iterator(chunk_size=500))
+        self.stdout.write(self.style.SUCCESS(f'Refreshed effective prices for {count} products.'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.models import StockReservation
+
+
+class Command(BaseCommand):
+    help = 'Release the stock held by unpaid pills whose checkout hold has expired (run every few minutes)'
+
+    def handle(self, *args, **options):
+        released = StockReservation.release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired stock holds.'))
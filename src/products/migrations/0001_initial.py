@@ -0,0 +1,591 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:58
+
+import django.core.validators
+import django.db.models.deletion
+import django.db.models.functions.comparison
+import django.utils.timezone
+import products.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Brand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('logo', models.ImageField(blank=True, null=True, upload_to='brands/')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=1)),
+                ('structure_version', models.BigIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='categories/')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('type', models.CharField(choices=[('book', 'Book'), ('product', 'Product')], default='product', help_text='Type of the product', max_length=20)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Color',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('degree', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PillGift',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('discount_value', models.FloatField(help_text='Discount percentage (0-100)', validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('start_date', models.DateTimeField(blank=True, help_text='Start date the gift becomes available (null means always available until end_date)', null=True)),
+                ('end_date', models.DateTimeField(blank=True, help_text='End date of the gift (null means available indefinitely from start_date)', null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('min_order_value', models.FloatField(default=0, help_text='Minimum order value to apply the gift', validators=[django.core.validators.MinValueValidator(0)])),
+                ('max_order_value', models.FloatField(blank=True, help_text='Maximum order value to apply the gift (optional)', null=True, validators=[django.core.validators.MinValueValidator(0)])),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Pill Gift',
+                'verbose_name_plural': 'Pill Gifts',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_number', models.CharField(blank=True, editable=False, max_length=20, null=True)),
+                ('name', models.CharField(max_length=100)),
+                ('price', models.FloatField(blank=True, null=True)),
+                ('threshold', models.PositiveIntegerField(default=10, help_text='Minimum quantity threshold for low stock alerts')),
+                ('description', models.TextField(blank=True, max_length=1000, null=True)),
+                ('is_important', models.BooleanField(default=False, help_text='Mark if this product is important/special')),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('base_image', models.ImageField(blank=True, help_text='Main image for the product', null=True, upload_to='products/')),
+                ('primary_image_name', models.CharField(blank=True, editable=False, help_text='Storage name of the newest ProductImage, used when there is no base image', max_length=100, null=True)),
+                ('type', models.CharField(choices=[('book', 'Book'), ('product', 'Product')], default='product', help_text='Type of the product', max_length=20)),
+                ('year', models.CharField(blank=True, choices=[('first-secondary', 'First Secondary'), ('second-secondary', 'Second Secondary'), ('third-secondary', 'Third Secondary')], max_length=20, null=True)),
+                ('effective_price', models.FloatField(blank=True, editable=False, null=True)),
+                ('effective_discount_value', models.FloatField(blank=True, editable=False, null=True)),
+                ('effective_discount_expiry', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('effective_price_valid_until', models.DateTimeField(blank=True, editable=False, help_text='Next discount start/end boundary at which the effective price must be recomputed', null=True)),
+                ('rating_count', models.IntegerField(default=0, editable=False)),
+                ('rating_sum', models.IntegerField(default=0, editable=False)),
+                ('rating_1_count', models.IntegerField(default=0, editable=False)),
+                ('rating_2_count', models.IntegerField(default=0, editable=False)),
+                ('rating_3_count', models.IntegerField(default=0, editable=False)),
+                ('rating_4_count', models.IntegerField(default=0, editable=False)),
+                ('rating_5_count', models.IntegerField(default=0, editable=False)),
+                ('stock_total', models.IntegerField(default=0, editable=False)),
+                ('is_low_stock', models.BooleanField(default=True, editable=False)),
+                ('stock_reserved', models.IntegerField(default=0, editable=False)),
+                ('brand', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='products.brand')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='products.category')),
+            ],
+            options={
+                'ordering': ['-date_added'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Shipping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('government', models.CharField(choices=[('1', 'Cairo'), ('2', 'Alexandria'), ('3', 'Kafr El Sheikh'), ('4', 'Dakahlia'), ('5', 'Sharqia'), ('6', 'Gharbia'), ('7', 'Monufia'), ('8', 'Qalyubia'), ('9', 'Giza'), ('10', 'Beni Suef'), ('11', 'Fayoum'), ('12', 'Minya'), ('13', 'Assiut'), ('14', 'Sohag'), ('15', 'Qena'), ('16', 'Luxor'), ('17', 'Aswan'), ('18', 'Red Sea'), ('19', 'Beheira'), ('20', 'Ismailia'), ('21', 'Suez'), ('22', 'Port Said'), ('23', 'Damietta'), ('24', 'Matruh'), ('25', 'New Valley'), ('26', 'North Sinai'), ('27', 'South Sinai')], max_length=2)),
+                ('shipping_price', models.FloatField(default=0.0)),
+            ],
+            options={
+                'ordering': ['government'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SpinWheelDiscount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('discount_value', models.FloatField(default=0.0, help_text='Discount value for the coupon created upon winning')),
+                ('probability', models.FloatField(default=0.1, help_text='Probability of winning (0 to 1)', validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(1)])),
+                ('is_active', models.BooleanField(default=True)),
+                ('start_date', models.DateTimeField()),
+                ('end_date', models.DateTimeField()),
+                ('min_order_value', models.FloatField(default=0, help_text='Minimum order value to claim the prize')),
+                ('max_winners', models.PositiveIntegerField(default=100, help_text='Maximum number of users who can win this discount')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SpinWheelSettings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('daily_spin_limit', models.PositiveIntegerField(default=1, help_text='Maximum spins per user per day')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Spin Wheel Settings',
+                'verbose_name_plural': 'Spin Wheel Settings',
+            },
+        ),
+        migrations.CreateModel(
+            name='Subject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CouponDiscount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('coupon', models.CharField(blank=True, editable=False, max_length=100, null=True)),
+                ('discount_value', models.FloatField(blank=True, null=True)),
+                ('coupon_start', models.DateTimeField(blank=True, null=True)),
+                ('coupon_end', models.DateTimeField(blank=True, null=True)),
+                ('available_use_times', models.PositiveIntegerField(default=1)),
+                ('is_wheel_coupon', models.BooleanField(default=False)),
+                ('min_order_value', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Discount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('discount', models.FloatField(validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('discount_start', models.DateTimeField()),
+                ('discount_end', models.DateTimeField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='discounts', to='products.category')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Pill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('i', 'initiated'), ('w', 'Waiting'), ('p', 'Paid'), ('bp', 'Being Prepared'), ('re', 'ready for delivery'), ('u', 'Under Delivery'), ('d', 'Delivered'), ('r', 'Refused'), ('c', 'Canceled')], default='i', max_length=2)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('paid', models.BooleanField(default=False)),
+                ('coupon_discount', models.FloatField(default=0.0)),
+                ('price_subtotal', models.FloatField(blank=True, editable=False, null=True)),
+                ('price_gift_discount', models.FloatField(blank=True, editable=False, null=True)),
+                ('price_coupon_discount', models.FloatField(blank=True, editable=False, null=True)),
+                ('price_shipping', models.FloatField(blank=True, editable=False, null=True)),
+                ('price_final', models.FloatField(blank=True, editable=False, null=True)),
+                ('tracking_number', models.CharField(blank=True, max_length=50, null=True)),
+                ('pill_number', models.CharField(default=products.models.generate_pill_number, editable=False, max_length=20, unique=True)),
+                ('is_shipped', models.BooleanField(default=False)),
+                ('khazenly_data', models.JSONField(blank=True, null=True)),
+                ('khazenly_order_id', models.CharField(blank=True, help_text='Khazenly internal order ID', max_length=100, null=True)),
+                ('khazenly_sales_order_number', models.CharField(blank=True, help_text='Khazenly sales order number (KH-BOOKIFAY-xxxxx)', max_length=100, null=True)),
+                ('khazenly_created_at', models.DateTimeField(blank=True, help_text='When the Khazenly order was created', null=True)),
+                ('shakeout_invoice_id', models.CharField(blank=True, help_text='Shake-out invoice ID', max_length=100, null=True)),
+                ('shakeout_invoice_ref', models.CharField(blank=True, help_text='Shake-out invoice reference', max_length=100, null=True)),
+                ('shakeout_data', models.JSONField(blank=True, help_text='Shake-out invoice response data', null=True)),
+                ('shakeout_created_at', models.DateTimeField(blank=True, help_text='When the Shake-out invoice was created', null=True)),
+                ('coupon', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pills', to='products.coupondiscount')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pills', to=settings.AUTH_USER_MODEL)),
+                ('gift_discount', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pills', to='products.pillgift')),
+            ],
+            options={
+                'verbose_name_plural': 'Bills',
+                'ordering': ['-date_added'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PayRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='pay_requests/')),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('is_applied', models.BooleanField(default=False)),
+                ('pill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pay_requests', to='products.pill')),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PillAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=150, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('phone', models.CharField(blank=True, max_length=15, null=True)),
+                ('address', models.CharField(blank=True, max_length=255, null=True)),
+                ('government', models.CharField(blank=True, choices=[('1', 'Cairo'), ('2', 'Alexandria'), ('3', 'Kafr El Sheikh'), ('4', 'Dakahlia'), ('5', 'Sharqia'), ('6', 'Gharbia'), ('7', 'Monufia'), ('8', 'Qalyubia'), ('9', 'Giza'), ('10', 'Beni Suef'), ('11', 'Fayoum'), ('12', 'Minya'), ('13', 'Assiut'), ('14', 'Sohag'), ('15', 'Qena'), ('16', 'Luxor'), ('17', 'Aswan'), ('18', 'Red Sea'), ('19', 'Beheira'), ('20', 'Ismailia'), ('21', 'Suez'), ('22', 'Port Said'), ('23', 'Damietta'), ('24', 'Matruh'), ('25', 'New Valley'), ('26', 'North Sinai'), ('27', 'South Sinai')], max_length=2, null=True)),
+                ('city', models.CharField(blank=True, max_length=100, null=True)),
+                ('pay_method', models.CharField(choices=[('c', 'cash'), ('v', 'visa')], default='c', max_length=2)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('pill', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pilladdress', to='products.pill')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PillItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('size', models.CharField(blank=True, choices=[('s', 'S'), ('xs', 'XS'), ('m', 'M'), ('l', 'L'), ('xl', 'XL'), ('xxl', 'XXL'), ('xxxl', 'XXXL'), ('xxxxl', 'XXXXL'), ('xxxxxl', 'XXXXXL')], max_length=10, null=True)),
+                ('status', models.CharField(blank=True, choices=[('i', 'initiated'), ('w', 'Waiting'), ('p', 'Paid'), ('bp', 'Being Prepared'), ('re', 'ready for delivery'), ('u', 'Under Delivery'), ('d', 'Delivered'), ('r', 'Refused'), ('c', 'Canceled')], max_length=2, null=True)),
+                ('date_added', models.DateTimeField(auto_now_add=True, null=True)),
+                ('native_price_at_sale', models.FloatField(blank=True, null=True)),
+                ('price_at_sale', models.FloatField(blank=True, null=True)),
+                ('date_sold', models.DateTimeField(blank=True, null=True)),
+                ('color', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.color')),
+                ('pill', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pill_items', to='products.pill')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pill_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date_added'],
+            },
+        ),
+        migrations.AddField(
+            model_name='pill',
+            name='items',
+            field=models.ManyToManyField(related_name='pills', to='products.pillitem'),
+        ),
+        migrations.CreateModel(
+            name='PillStatusLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('i', 'initiated'), ('w', 'Waiting'), ('p', 'Paid'), ('bp', 'Being Prepared'), ('re', 'ready for delivery'), ('u', 'Under Delivery'), ('d', 'Delivered'), ('r', 'Refused'), ('c', 'Canceled')], max_length=2)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+                ('pill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_logs', to='products.pill')),
+            ],
+            options={
+                'ordering': ['-changed_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='products.product')),
+                ('name', models.TextField(blank=True, default='')),
+                ('taxonomy', models.TextField(blank=True, default='')),
+                ('body', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_discount',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.discount'),
+        ),
+        migrations.AddField(
+            model_name='pillitem',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pill_items', to='products.product'),
+        ),
+        migrations.CreateModel(
+            name='LovedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='loved_products', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='discount',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='discounts', to='products.product'),
+        ),
+        migrations.CreateModel(
+            name='BestProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order', models.PositiveIntegerField(default=0, help_text='Ordering priority (higher numbers come first)')),
+                ('is_active', models.BooleanField(default=True, help_text='Show this product')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='best_products', to='products.product')),
+            ],
+            options={
+                'ordering': ['-order', '-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(blank=True, max_length=50, null=True)),
+                ('quantity', models.PositiveIntegerField()),
+                ('reserved', models.PositiveIntegerField(default=0, editable=False)),
+                ('native_price', models.FloatField(default=0.0, help_text='The original price the owner paid for this product batch')),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('color', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='products.color')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availabilities', to='products.product')),
+            ],
+            options={
+                'ordering': ['-date_added'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductDescription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('order', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descriptions', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'Product Description',
+                'verbose_name_plural': 'Product Descriptions',
+                'ordering': ['order', 'created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='product_images/')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='products.product')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Rating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('star_number', models.IntegerField()),
+                ('review', models.CharField(default='No review comment', max_length=300)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date_added'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SpecialProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('special_image', models.ImageField(blank=True, null=True, upload_to='special_products/')),
+                ('order', models.PositiveIntegerField(default=0, help_text='Ordering priority (higher numbers come first)')),
+                ('is_active', models.BooleanField(default=True, help_text='Show this special product')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='special_products', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'Special Product',
+                'verbose_name_plural': 'Special Products',
+                'ordering': ['-order', '-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SpinWheelResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spin_date_time', models.DateTimeField(auto_now_add=True)),
+                ('coupon', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='products.coupondiscount')),
+                ('spin_wheel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.spinwheeldiscount')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-spin_date_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_notified', models.BooleanField(default=False)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('h', 'held'), ('c', 'committed'), ('r', 'released')], default='h', max_length=1)),
+                ('expires_at', models.DateTimeField(blank=True, help_text='Null means held until delivery or cancellation', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('availability', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.productavailability')),
+                ('pill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.pill')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SubCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subcategories', to='products.category')),
+            ],
+            options={
+                'verbose_name_plural': 'Sub Categories',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sub_category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='products.subcategory'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='subject',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='products.subject'),
+        ),
+        migrations.CreateModel(
+            name='Teacher',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150)),
+                ('bio', models.TextField(blank=True, null=True)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='teachers/')),
+                ('facebook', models.CharField(blank=True, max_length=200, null=True)),
+                ('instagram', models.CharField(blank=True, max_length=200, null=True)),
+                ('twitter', models.CharField(blank=True, max_length=200, null=True)),
+                ('linkedin', models.CharField(blank=True, max_length=200, null=True)),
+                ('youtube', models.CharField(blank=True, max_length=200, null=True)),
+                ('whatsapp', models.CharField(blank=True, max_length=200, null=True)),
+                ('tiktok', models.CharField(blank=True, max_length=200, null=True)),
+                ('telegram', models.CharField(blank=True, max_length=200, null=True)),
+                ('website', models.CharField(blank=True, max_length=200, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='teachers', to='products.subject')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='teacher',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='products.teacher'),
+        ),
+        migrations.CreateModel(
+            name='PriceDropAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('last_price', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_notified', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='products.product')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'unique_together': {('product', 'email'), ('product', 'user')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pillitem',
+            index=models.Index(fields=['status'], name='products_pi_status_8a6332_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pillitem',
+            index=models.Index(fields=['date_sold'], name='products_pi_date_so_be4745_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pillitem',
+            index=models.Index(fields=['product', 'status'], name='products_pi_product_75d58c_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pillitem',
+            constraint=models.UniqueConstraint(models.F('user'), models.F('product'), django.db.models.functions.comparison.Coalesce('size', models.Value('')), django.db.models.functions.comparison.Coalesce('color', models.Value(0)), condition=models.Q(('status__isnull', True)), name='unique_cart_line'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pillitem',
+            unique_together={('user', 'product', 'size', 'color', 'status', 'pill')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='lovedproduct',
+            unique_together={('user', 'product')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='productavailability',
+            unique_together={('product', 'size', 'color')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='spinwheelresult',
+            unique_together={('user', 'spin_wheel', 'spin_date_time')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockalert',
+            unique_together={('product', 'email'), ('product', 'user')},
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['status', 'expires_at'], name='products_st_status_657db7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price'], name='products_pr_effecti_8ce082_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price_valid_until'], name='products_pr_effecti_7d2d91_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_low_stock', 'stock_total'], name='products_pr_is_low__2c3047_idx'),
+        ),
+    ]
@@ -1,9 +1,14 @@
 import random
 import string
-from django.db import models, transaction
+from collections import Counter, defaultdict, namedtuple
+from datetime import timedelta
+from itertools import islice
+from django.db import IntegrityError, connection, models, transaction
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Sum
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import Coalesce, Greatest
+from products.pill_numbers import generate_pill_numbers
 from products.utils import send_whatsapp_message
 from accounts.models import YEAR_CHOICES, User
 from core import settings
@@ -72,12 +77,13 @@ PAYMENT_CHOICES = [
     ('v', 'visa'),
 ]
 
+PILL_NUMBER_ATTEMPTS = 5
+
 def generate_pill_number():
-    """Generate a unique 20-digit pill number."""
-    while True:
-        pill_number = ''.join(random.choices(string.digits, k=20))
-        if not Pill.objects.filter(pill_number=pill_number).exists():
-            return pill_number
+    """Generate a 20-digit pill number (see products.pill_numbers)."""
+    return generate_pill_numbers(1)[0]
+
+PriceBreakdown = namedtuple('PriceBreakdown', ['subtotal', 'gift', 'coupon', 'shipping', 'final'])
 
 def create_random_coupon():
     letters = string.ascii_lowercase
@@ -93,6 +99,7 @@ class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     image = models.ImageField(upload_to='categories/', null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)  
+    updated_at = models.DateTimeField(auto_now=True)
     type = models.CharField(
         max_length=20,
         choices=product_type,
@@ -109,6 +116,7 @@ class SubCategory(models.Model):
     name = models.CharField(max_length=100)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='subcategories')
     created_at = models.DateTimeField(default=timezone.now)  
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']  
@@ -121,6 +129,7 @@ class Brand(models.Model):
     name = models.CharField(max_length=100, unique=True)
     logo = models.ImageField(upload_to='brands/', null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)  
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']  
@@ -131,6 +140,7 @@ class Brand(models.Model):
 class Subject(models.Model):
     name = models.CharField(max_length=150)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     def __str__(self):
         return self.name
     
@@ -149,6 +159,7 @@ class Teacher(models.Model):
     telegram = models.CharField(max_length=200, null=True, blank=True)
     website = models.CharField(max_length=200, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -176,12 +187,20 @@ class Product(models.Model):
         help_text="Mark if this product is important/special"
     )
     date_added = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     base_image = models.ImageField(
         upload_to='products/',
         null=True,
         blank=True,
         help_text="Main image for the product"
     )
+    primary_image_name = models.CharField(
+        max_length=100,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Storage name of the newest ProductImage, used when there is no base image"
+    )
 
     type = models.CharField(
         max_length=20,
@@ -195,27 +214,66 @@ class Product(models.Model):
         null=True,
         blank=True,
     )
-    
+
+    # Materialized pricing, kept in sync with Discount changes (see refresh_effective_prices)
+    effective_price = models.FloatField(null=True, blank=True, editable=False)
+    effective_discount = models.ForeignKey(
+        'Discount',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+'
+    )
+    effective_discount_value = models.FloatField(null=True, blank=True, editable=False)
+    effective_discount_expiry = models.DateTimeField(null=True, blank=True, editable=False)
+    effective_price_valid_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Next discount start/end boundary at which the effective price must be recomputed"
+    )
+
+    # Rating aggregates, kept in sync by the Rating signals (see recount_ratings)
+    rating_count = models.IntegerField(default=0, editable=False)
+    rating_sum = models.IntegerField(default=0, editable=False)
+    rating_1_count = models.IntegerField(default=0, editable=False)
+    rating_2_count = models.IntegerField(default=0, editable=False)
+    rating_3_count = models.IntegerField(default=0, editable=False)
+    rating_4_count = models.IntegerField(default=0, editable=False)
+    rating_5_count = models.IntegerField(default=0, editable=False)
+
+    # Stock aggregates, kept in sync with ProductAvailability changes (see check_stock_totals)
+    stock_total = models.IntegerField(default=0, editable=False)
+    is_low_stock = models.BooleanField(default=True, editable=False)
+    # Units of stock_total held by StockReservations
+    stock_reserved = models.IntegerField(default=0, editable=False)
+
+    # Columns maintained by UPDATE queries from signals; a plain save() must not overwrite them
+    MAINTAINED_FIELDS = [
+        'rating_count', 'rating_sum', 'rating_1_count', 'rating_2_count',
+        'rating_3_count', 'rating_4_count', 'rating_5_count',
+        'stock_total', 'is_low_stock', 'stock_reserved', 'primary_image_name',
+    ]
+
+    EFFECTIVE_PRICE_FIELDS = [
+        'effective_price', 'effective_discount', 'effective_discount_value',
+        'effective_discount_expiry', 'effective_price_valid_until',
+    ]
+
     def get_current_discount(self):
         """Returns the best active discount (either product or category level)"""
-        now = timezone.now()
-        product_discount = self.discounts.filter(
-            is_active=True,
-            discount_start__lte=now,
-            discount_end__gte=now
-        ).order_by('-discount').first()
+        self._ensure_effective_price()
+        return self.effective_discount
 
-        category_discount = None
-        if self.category:
-            category_discount = self.category.discounts.filter(
-                is_active=True,
-                discount_start__lte=now,
-                discount_end__gte=now
-            ).order_by('-discount').first()
+    def current_discount_value(self):
+        self._ensure_effective_price()
+        return self.effective_discount_value
 
-        if product_discount and category_discount:
-            return max(product_discount, category_discount, key=lambda d: d.discount)
-        return product_discount or category_discount
+    def discount_expiry(self):
+        """End date of the latest-ending active discount, product discounts first."""
+        self._ensure_effective_price()
+        return self.effective_discount_expiry
 
     def price_after_product_discount(self):
         last_product_discount = self.discounts.last()
@@ -231,42 +289,312 @@ class Product(models.Model):
         return self.price
 
     def discounted_price(self):
-        discount = self.get_current_discount()
-        if discount:
-            return self.price * (1 - discount.discount / 100)
-        return self.price
+        self._ensure_effective_price()
+        return self.effective_price
 
     def has_discount(self):
-        return self.get_current_discount() is not None
+        self._ensure_effective_price()
+        return self.effective_discount_id is not None
+
+    def effective_price_is_stale(self, now=None):
+        if self.effective_price is None:
+            return self.price is not None
+        if self.effective_price_valid_until is None:
+            return False
+        return (now or timezone.now()) > self.effective_price_valid_until
+
+    def _ensure_effective_price(self):
+        # Worked out in memory: reads never write (refresh_effective_prices stores it)
+        if self.effective_price_is_stale():
+            Product.compute_effective_prices([self])
+
+    def _set_effective_price(self, product_discounts, category_discounts, now):
+        """
+        Pick the winning discount from the product's and its category's
+        not-yet-ended discounts and store the resulting price on the instance.
+        """
+        active_product = [d for d in product_discounts if d.discount_start <= now]
+        active_category = [d for d in category_discounts if d.discount_start <= now]
+        product_discount = max(active_product, key=lambda d: d.discount, default=None)
+        category_discount = max(active_category, key=lambda d: d.discount, default=None)
+        if product_discount and category_discount:
+            discount = max(product_discount, category_discount, key=lambda d: d.discount)
+        else:
+            discount = product_discount or category_discount
+        expiring = max(active_product or active_category, key=lambda d: d.discount_end, default=None)
+
+        self.effective_discount = discount
+        self.effective_discount_value = discount.discount if discount else None
+        if discount and self.price is not None:
+            self.effective_price = self.price * (1 - discount.discount / 100)
+        else:
+            self.effective_price = self.price
+        self.effective_discount_expiry = expiring.discount_end if expiring else None
+        self.effective_price_valid_until = min(
+            (d.discount_start if d.discount_start > now else d.discount_end
+             for d in product_discounts + category_discounts),
+            default=None
+        )
+
+    @staticmethod
+    def annotate_final_price(queryset, now=None):
+        """
+        Annotate final_price computed live in SQL: the price after the best active
+        discount of the product or its category, found with one correlated subquery.
+        Applying it twice to the same queryset is a no-op.
+        """
+        if 'final_price' in queryset.query.annotations:
+            return queryset
+        now = now or timezone.now()
+        best_discount = Discount.objects.filter(
+            models.Q(product=models.OuterRef('pk')) | models.Q(category=models.OuterRef('category')),
+            is_active=True,
+            discount_start__lte=now,
+            discount_end__gte=now
+        ).order_by('-discount').values('discount')[:1]
+        return queryset.annotate(
+            final_price=models.ExpressionWrapper(
+                models.F('price') * (1 - Coalesce(
+                    models.Subquery(best_discount), models.Value(0.0)
+                ) / 100),
+                output_field=models.FloatField()
+            )
+        )
+
+    @staticmethod
+    def _pending_discounts(products, now):
+        """Active discounts that have not ended yet, grouped by product and by category."""
+        product_ids = [product.pk for product in products if product.pk]
+        category_ids = {product.category_id for product in products if product.category_id}
+        by_product, by_category = defaultdict(list), defaultdict(list)
+        if not product_ids and not category_ids:
+            return by_product, by_category
+        discounts = Discount.objects.filter(
+            models.Q(product_id__in=product_ids) | models.Q(category_id__in=category_ids),
+            is_active=True,
+            discount_end__gte=now
+        )
+        for discount in discounts:
+            if discount.product_id:
+                by_product[discount.product_id].append(discount)
+            else:
+                by_category[discount.category_id].append(discount)
+        return by_product, by_category
+
+    @classmethod
+    def compute_effective_prices(cls, products, now=None):
+        """
+        Work out the current pricing of ``products`` on the instances only, with
+        one discount query and no writes. Used on read paths, where a stale
+        stored price must not turn a GET into a write and a catalog version bump.
+        """
+        products = list(products)
+        if products:
+            now = now or timezone.now()
+            by_product, by_category = cls._pending_discounts(products, now)
+            for product in products:
+                product._set_effective_price(
+                    by_product.get(product.pk, []),
+                    by_category.get(product.category_id, []),
+                    now
+                )
+        return products
+
+    @classmethod
+    def refresh_effective_prices(cls, products, batch_size=500):
+        """
+        Recompute and store the materialized pricing for ``products`` with one
+        discount query and one bulk update per batch. Unsaved products are only
+        priced in memory. Returns the number refreshed.
+        """
+        products = iter(products)
+        refreshed = 0
+        while batch := list(islice(products, batch_size)):
+            cls.compute_effective_prices(batch)
+            saved = [product for product in batch if product.pk is not None]
+            cls.objects.bulk_update(saved, cls.EFFECTIVE_PRICE_FIELDS)
+            refreshed += len(saved)
+        if refreshed:
+            # bulk_update sends no signals, and served prices just changed
+            CatalogVersion.bump()
+        return refreshed
 
     def main_image(self):
         if self.base_image:
             return self.base_image  # This should return a FileField/ImageField object
 
-        images = self.images.all()
-        if images.exists():
-            # Make sure this returns a FileField/ImageField object
-            return random.choice(images).image
+        if self.primary_image_name:
+            # Same FieldFile a ProductImage.image would give, without loading the row
+            image_field = ProductImage._meta.get_field('image')
+            return image_field.attr_class(self, image_field, self.primary_image_name)
 
         return None  # Explicitly return None if no image is found
 
+    @classmethod
+    def refresh_primary_images(cls, product_ids):
+        """Point primary_image_name at each product's newest ProductImage (or NULL)."""
+        newest_image = ProductImage.objects.filter(
+            product=models.OuterRef('pk')
+        ).order_by('-created_at', '-id').values('image')[:1]
+        cls.objects.filter(pk__in=product_ids).update(primary_image_name=models.Subquery(newest_image))
+
     def images(self):
         return self.images.all()
 
     def number_of_ratings(self):
-        return self.ratings.count()
+        return self.rating_count
 
     def average_rating(self):
-        ratings = self.ratings.all()
-        if ratings.exists():
-            return round(sum(rating.star_number for rating in ratings) / ratings.count(), 1)
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 1)
         return 0.0
 
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+
+    @classmethod
+    def adjust_rating_counters(cls, product_id, star_number, delta):
+        """Add (delta=1) or remove (delta=-1) one rating from a product's aggregates."""
+        counters = {
+            'rating_count': models.F('rating_count') + delta,
+            'rating_sum': models.F('rating_sum') + delta * star_number,
+        }
+        if 1 <= star_number <= 5:
+            field = f'rating_{star_number}_count'
+            counters[field] = models.F(field) + delta
+        cls.objects.filter(pk=product_id).update(**counters)
+
+    @classmethod
+    def recount_ratings(cls, products=None):
+        """Rebuild the rating aggregates from the Rating table. Returns the number of products updated."""
+        ratings = Rating.objects.order_by().values('product')
+        if products is not None:
+            ratings = ratings.filter(product__in=products)
+        stats = {
+            row['product']: row
+            for row in ratings.annotate(
+                count=Count('id'),
+                total=Sum('star_number'),
+                **{f'star_{star}': Count('id', filter=models.Q(star_number=star)) for star in range(1, 6)}
+            )
+        }
+        queryset = cls.objects.all() if products is None else cls.objects.filter(pk__in=[p.pk for p in products])
+        fields = ['rating_count', 'rating_sum'] + [f'rating_{star}_count' for star in range(1, 6)]
+        updated = []
+        for product in queryset.only('id', *fields).iterator(chunk_size=500):
+            row = stats.get(product.pk, {})
+            product.rating_count = row.get('count', 0)
+            product.rating_sum = row.get('total') or 0
+            for star in range(1, 6):
+                setattr(product, f'rating_{star}_count', row.get(f'star_{star}', 0))
+            updated.append(product)
+        cls.objects.bulk_update(updated, fields, batch_size=500)
+        return len(updated)
+
+    def _prefetched_availabilities(self):
+        return getattr(self, '_prefetched_objects_cache', {}).get('availabilities')
+
     def total_quantity(self):
-        return self.availabilities.aggregate(total=Sum('quantity'))['total'] or 0
+        """Units in stock and not held by a reservation."""
+        return max(0, self.stock_total - self.stock_reserved)
+
+    @staticmethod
+    def _low_stock_expression(delta=0):
+        # Evaluated by the database against the row's stock_total *before* adding delta
+        return models.Case(
+            models.When(stock_total__lte=models.F('threshold') - delta, then=models.Value(True)),
+            default=models.Value(False),
+            output_field=models.BooleanField()
+        )
+
+    @classmethod
+    def adjust_reserved(cls, product_id, delta):
+        if delta:
+            cls.objects.filter(pk=product_id).update(stock_reserved=models.F('stock_reserved') + delta)
+
+    @classmethod
+    def adjust_stock(cls, product_id, delta, reserved_delta=0):
+        """
+        Move a product's stock_total by delta (and stock_reserved by reserved_delta)
+        and re-evaluate is_low_stock in the same UPDATE.
+        """
+        values = {}
+        if delta:
+            values.update(stock_total=models.F('stock_total') + delta, is_low_stock=cls._low_stock_expression(delta))
+        if reserved_delta:
+            values['stock_reserved'] = models.F('stock_reserved') + reserved_delta
+        if values:
+            cls.objects.filter(pk=product_id).update(**values)
+
+    @classmethod
+    def adjust_stock_many(cls, deltas):
+        """
+        adjust_stock for {product id: (delta, reserved_delta)} as one CASE UPDATE,
+        once the rows are locked in primary key order.
+        """
+        deltas = {pk: delta for pk, delta in deltas.items() if any(delta)}
+        if len(deltas) <= 1:
+            for product_id, (delta, reserved_delta) in deltas.items():
+                cls.adjust_stock(product_id, delta, reserved_delta)
+            return
+        with transaction.atomic():
+            list(cls.objects.select_for_update().filter(pk__in=deltas).order_by('pk').values_list('pk', flat=True))
+
+            def per_product(index):
+                return models.Case(
+                    *[models.When(pk=pk, then=models.Value(delta[index])) for pk, delta in deltas.items()],
+                    default=models.Value(0)
+                )
+
+            cls.objects.filter(pk__in=deltas).update(
+                stock_total=models.F('stock_total') + per_product(0),
+                stock_reserved=models.F('stock_reserved') + per_product(1),
+                # As in _low_stock_expression, compared before the delta is added
+                is_low_stock=models.Case(
+                    *[
+                        models.When(pk=pk, stock_total__lte=models.F('threshold') - delta, then=models.Value(True))
+                        for pk, (delta, _) in deltas.items()
+                    ],
+                    default=models.Value(False),
+                    output_field=models.BooleanField()
+                )
+            )
+
+    @classmethod
+    def recount_stock(cls, products=None, commit=True):
+        """
+        Compare stock_total/is_low_stock with the ProductAvailability rows and
+        return the mismatched products as (product, old_total, new_total).
+        The mismatches are repaired unless commit is False.
+        """
+        availabilities = ProductAvailability.objects.order_by().values('product')
+        queryset = cls.objects.all()
+        if products is not None:
+            availabilities = availabilities.filter(product__in=products)
+            queryset = queryset.filter(pk__in=[p.pk for p in products])
+        totals = {
+            row['product']: row['total']
+            for row in availabilities.annotate(total=Sum('quantity'))
+        }
+        mismatches = []
+        for product in queryset.only('id', 'name', 'threshold', 'stock_total', 'is_low_stock').iterator(chunk_size=500):
+            total = totals.get(product.pk) or 0
+            low_stock = total <= product.threshold
+            if product.stock_total != total or product.is_low_stock != low_stock:
+                mismatches.append((product, product.stock_total, total))
+                product.stock_total = total
+                product.is_low_stock = low_stock
+        if commit:
+            cls.objects.bulk_update([m[0] for m in mismatches], ['stock_total', 'is_low_stock'], batch_size=500)
+        return mismatches
 
     def available_colors(self):
         """Returns a list of unique colors available for this product."""
+        availabilities = self._prefetched_availabilities()
+        if availabilities is not None:
+            colors = {a.color.id: a.color for a in availabilities if a.color is not None}
+            colors = sorted(colors.values(), key=lambda color: color.created_at, reverse=True)
+            return [{"color_id": color.id, "color_name": color.name} for color in colors]
         colors = Color.objects.filter(
             productavailability__product=self,
             productavailability__color__isnull=False
@@ -274,18 +602,88 @@ class Product(models.Model):
         return [{"color_id": color['id'], "color_name": color['name']} for color in colors]
 
     def available_sizes(self):
+        availabilities = self._prefetched_availabilities()
+        if availabilities is not None:
+            # Mirrors the DISTINCT below, which also covers the date_added ordering column
+            seen = set()
+            sizes = []
+            for availability in availabilities:
+                key = (availability.size, availability.date_added)
+                if availability.size is not None and key not in seen:
+                    seen.add(key)
+                    sizes.append(availability.size)
+            return sizes
         return self.availabilities.filter(size__isnull=False).values_list('size', flat=True).distinct()
 
-    def is_low_stock(self):
-        return self.total_quantity() <= self.threshold
+    def available_quantity(self, size, color):
+        """Unreserved units in stock for one size/color combination (color None means no color)."""
+        availabilities = self._prefetched_availabilities()
+        color_id = color.id if color else None
+        if availabilities is None:
+            availabilities = self.availabilities.filter(size=size, color_id=color_id).only('quantity', 'reserved')
+        return sum(a.available for a in availabilities if a.size == size and a.color_id == color_id)
+
+    # ProductSerializer fields that read each related lookup / the materialized price
+    LISTING_PREFETCHES = {
+        'category': {'category_id', 'category_name'},
+        'sub_category': {'sub_category_id', 'sub_category_name'},
+        'subject': {'subject_id', 'subject_name'},
+        'teacher': {'teacher_id', 'teacher_name', 'teacher_image'},
+        'brand': {'brand_id', 'brand_name'},
+        'images': {'images'},
+        'descriptions': {'descriptions'},
+        'availabilities': {'availabilities', 'available_colors', 'available_sizes'},
+    }
+    LISTING_PRICE_FIELDS = {'discounted_price', 'has_discount', 'current_discount', 'discount_expiry'}
+
+    @classmethod
+    def prefetch_listing_data(cls, products, fields=None):
+        """
+        Load everything ProductSerializer reads for a list of products in a fixed
+        number of queries instead of several queries per product. When fields is
+        given, only the data those serializer fields need is loaded.
+        """
+        if fields is None or cls.LISTING_PRICE_FIELDS & fields:
+            now = timezone.now()
+            cls.compute_effective_prices((p for p in products if p.effective_price_is_stale(now)), now)
+        lookups = [
+            lookup for lookup, needed_by in cls.LISTING_PREFETCHES.items()
+            if fields is None or needed_by & fields
+        ]
+        if 'availabilities' in lookups:
+            lookups[lookups.index('availabilities')] = models.Prefetch(
+                'availabilities', queryset=ProductAvailability.objects.select_related('color')
+            )
+        models.prefetch_related_objects(products, *lookups)
+        return products
     
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'price', 'category', 'category_id'} & set(update_fields):
+            now = timezone.now()
+            by_product, by_category = Product._pending_discounts([self], now)
+            self._set_effective_price(by_product.get(self.pk, []), by_category.get(self.category_id, []), now)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | set(self.EFFECTIVE_PRICE_FIELDS)
+
+        if self._state.adding:
+            self.is_low_stock = self.stock_total <= self.threshold
+        elif kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
+
         # Save first to get the ID if this is a new product
         is_new = not self.pk
         super().save(*args, **kwargs)
+
+        if not is_new and 'threshold' in (kwargs.get('update_fields') or ()):
+            Product.objects.filter(pk=self.pk).update(is_low_stock=self._low_stock_expression())
+            self.is_low_stock = self.stock_total <= self.threshold
         
         # Generate product_number after saving to ensure we have an ID
         if is_new and not self.product_number:
@@ -295,7 +693,86 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-date_added']
+        indexes = [
+            models.Index(fields=['effective_price']),
+            models.Index(fields=['effective_price_valid_until']),
+            models.Index(fields=['is_low_stock', 'stock_total']),
+        ]
         
+class ProductSearchDocument(models.Model):
+    """Normalized, denormalized text of a product, indexed by products.search."""
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document'
+    )
+    name = models.TextField(blank=True, default='')
+    taxonomy = models.TextField(blank=True, default='')
+    body = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for product {self.product_id}"
+
+class CatalogVersion(models.Model):
+    """
+    Single-row stamp of the catalog. ``version`` goes up by one after every
+    committed catalog write (see products.signals); it validates conditional
+    GETs on the catalog endpoints (products.conditional) and keys the homepage cache.
+    ``structure_version`` only goes up with writes that change which products
+    exist and how they are classified (STRUCTURE_MODELS in products.signals);
+    it keys the in-memory facet and suggestion indexes, which stock, price
+    and rating writes leave valid.
+    """
+    version = models.BigIntegerField(default=1)
+    structure_version = models.BigIntegerField(default=1)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def current(cls):
+        """Return (version, updated_at), creating the row on first use."""
+        stamp = cls.objects.filter(pk=1).values_list('version', 'updated_at').first()
+        if stamp is None:
+            # Start from the newest catalog edit rather than the first request's time
+            edits = [
+                model.objects.aggregate(latest=models.Max('updated_at'))['latest']
+                for model in (Category, SubCategory, Brand, Subject, Teacher, Product)
+            ]
+            edits = [edit for edit in edits if edit is not None]
+            row, _ = cls.objects.get_or_create(pk=1, defaults={'updated_at': max(edits, default=timezone.now())})
+            stamp = (row.version, row.updated_at)
+        return stamp
+
+    @classmethod
+    def current_structure(cls):
+        """Return structure_version, creating the row on first use."""
+        structure_version = cls.objects.filter(pk=1).values_list('structure_version', flat=True).first()
+        if structure_version is None:
+            cls.current()
+            structure_version = cls.objects.values_list('structure_version', flat=True).get(pk=1)
+        return structure_version
+
+    @classmethod
+    def bump(cls, structure=False):
+        """
+        Advance the version once the current transaction commits, so a reader
+        never sees the new version paired with the old data. ``structure``
+        advances structure_version too.
+        """
+        transaction.on_commit(lambda: cls._advance(structure))
+
+    @classmethod
+    def _advance(cls, structure=False):
+        changes = {'version': models.F('version') + 1, 'updated_at': timezone.now()}
+        if structure:
+            changes['structure_version'] = models.F('structure_version') + 1
+        if not cls.objects.filter(pk=1).update(**changes):
+            cls.current()
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
 class SpecialProduct(models.Model):
     product = models.ForeignKey(
         Product,
@@ -408,6 +885,8 @@ class ProductAvailability(models.Model):
         blank=True
     )
     quantity = models.PositiveIntegerField()
+    # Units of quantity held by StockReservations, maintained by UPDATE queries
+    reserved = models.PositiveIntegerField(default=0, editable=False)
     native_price = models.FloatField(
         default=0.0,
         help_text="The original price the owner paid for this product batch"
@@ -421,6 +900,57 @@ class ProductAvailability(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.size} - {self.color.name if self.color else 'No Color'}"
 
+    @property
+    def available(self):
+        return max(0, self.quantity - self.reserved)
+
+    def save(self, *args, **kwargs):
+        # A plain save() must not overwrite a reserved count moved since this row was loaded
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'reserved'
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def apply_stock_changes(cls, quantity=None, reserved=None, labels=None, check_available=True):
+        """
+        Move quantity and reserved of many rows at once ({availability id: delta}).
+
+        The rows are locked by one SELECT ... FOR UPDATE in primary key order, so
+        two pills touching the same rows queue up instead of deadlocking, checked
+        in memory and written by one bulk_update. If a row would go below zero
+        stock, or (with check_available) reserve more than it has, nothing is
+        written and ValidationError names it by labels[id]. bulk_update sends no
+        signals: the product aggregates and the catalog version are moved here.
+        """
+        quantity, reserved = quantity or {}, reserved or {}
+        ids = {pk for pk, delta in quantity.items() if delta} | {pk for pk, delta in reserved.items() if delta}
+        if not ids:
+            return
+        with transaction.atomic():
+            rows = list(cls.objects.select_for_update().filter(pk__in=ids).order_by('pk'))
+            product_deltas = defaultdict(lambda: [0, 0])
+            for row in rows:
+                quantity_delta, reserved_delta = quantity.get(row.pk, 0), reserved.get(row.pk, 0)
+                new_quantity = row.quantity + quantity_delta
+                new_reserved = max(0, row.reserved + reserved_delta)
+                if new_quantity < 0 or (check_available and reserved_delta > 0 and new_reserved > new_quantity):
+                    required, available = (-quantity_delta, row.quantity) if new_quantity < 0 else (reserved_delta, row.available)
+                    raise ValidationError(
+                        f"Not enough inventory for {(labels or {}).get(row.pk, row)}. "
+                        f"Required: {required}, Available: {available}"
+                    )
+                product_deltas[row.product_id][0] += quantity_delta
+                product_deltas[row.product_id][1] += new_reserved - row.reserved
+                row.quantity, row.reserved = new_quantity, new_reserved
+            cls.objects.bulk_update(rows, ['quantity', 'reserved'])
+
+            Product.adjust_stock_many(product_deltas)
+            # Served stock is quantity - reserved, so holds and releases change it too
+            CatalogVersion.bump()
+
 # class ProductSales(models.Model):
 #     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales')
 #     quantity = models.PositiveIntegerField()
@@ -462,12 +992,74 @@ class PillItem(models.Model):
     class Meta:
         ordering = ['-date_added']
         unique_together = ['user', 'product', 'size', 'color', 'status', 'pill']
+        constraints = [
+            # One cart line per variant: NULL size/color would never clash in unique_together
+            models.UniqueConstraint(
+                models.F('user'), models.F('product'), Coalesce('size', models.Value('')), Coalesce('color', models.Value(0)),
+                condition=models.Q(status__isnull=True),
+                name='unique_cart_line'
+            ),
+        ]
         indexes = [
             models.Index(fields=['status']),
             models.Index(fields=['date_sold']),
             models.Index(fields=['product', 'status']),
         ]
 
+    @classmethod
+    def add_to_cart(cls, user, product, size, color, quantity):
+        """
+        Add quantity units of a variant to the user's cart in one statement: a new
+        cart line, or, on the unique_cart_line index, quantity added to the
+        existing one. Both are capped by the variant's unreserved stock, read by a
+        subquery of the same statement. Returns the line's id, or None when the
+        line would go over the stock.
+        """
+        stock = ProductAvailability.objects.filter(product=product, size=size, color=color).order_by().values(
+            'product'
+        ).annotate(
+            total=Sum(Greatest(models.F('quantity') - models.F('reserved'), models.Value(0)))
+        ).values('total')
+        stock_sql, stock_params = stock.query.sql_with_params()
+        table = connection.ops.quote_name(cls._meta.db_table)
+        sql = (
+            f"INSERT INTO {table} (user_id, product_id, size, color_id, quantity, date_added) "
+            f"SELECT %s, %s, %s, %s, %s, %s WHERE %s <= ({stock_sql}) "
+            "ON CONFLICT (user_id, product_id, (COALESCE(size, '')), (COALESCE(color_id, 0))) WHERE status IS NULL "
+            f"DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity "
+            f"WHERE {table}.quantity + EXCLUDED.quantity <= ({stock_sql}) "
+            "RETURNING id"
+        )
+        params = [
+            user.pk, product.pk, size, color.pk if color else None, quantity, timezone.now(),
+            quantity, *stock_params, *stock_params
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def merge_duplicate_cart_lines(cls, using='default'):
+        """
+        Fold cart lines that repeat a user's variant into the oldest of them,
+        summing the quantities; returns how many lines were removed. The
+        unique_cart_line index can't be built while such duplicates exist, so
+        this runs before migrations (see products.signals).
+        """
+        cart = cls.objects.using(using).filter(status__isnull=True)
+        duplicates = cart.order_by().values('user', 'product', 'size', 'color').annotate(
+            keep=Min('id'), total=Sum('quantity'), lines=Count('id')
+        ).filter(lines__gt=1)
+        removed = 0
+        with transaction.atomic(using=using):
+            for line in duplicates:
+                cart.filter(pk=line['keep']).update(quantity=line['total'])
+                removed += cart.filter(
+                    user=line['user'], product=line['product'], size=line['size'], color=line['color']
+                ).exclude(pk=line['keep']).delete()[1].get(cls._meta.label, 0)
+        return removed
+
     def save(self, *args, **kwargs):
         # Set date_sold when status changes to 'paid' or 'delivered'
         if self.status in ['p', 'd'] and not self.date_sold:
@@ -498,6 +1090,12 @@ class Pill(models.Model):
     coupon = models.ForeignKey('CouponDiscount', on_delete=models.SET_NULL, null=True, blank=True, related_name='pills')
     coupon_discount = models.FloatField(default=0.0)  # Stores discount amount
     gift_discount = models.ForeignKey('PillGift', on_delete=models.SET_NULL, null=True, blank=True, related_name='pills')
+    # Persisted PriceBreakdown, see refresh_price_breakdown(); null until first computed
+    price_subtotal = models.FloatField(null=True, blank=True, editable=False)
+    price_gift_discount = models.FloatField(null=True, blank=True, editable=False)
+    price_coupon_discount = models.FloatField(null=True, blank=True, editable=False)
+    price_shipping = models.FloatField(null=True, blank=True, editable=False)
+    price_final = models.FloatField(null=True, blank=True, editable=False)
     tracking_number = models.CharField(max_length=50, null=True, blank=True)
     pill_number = models.CharField(max_length=20, editable=False, unique=True, default=generate_pill_number)
     
@@ -515,68 +1113,163 @@ class Pill(models.Model):
     shakeout_data = models.JSONField(null=True, blank=True, help_text="Shake-out invoice response data")
     shakeout_created_at = models.DateTimeField(null=True, blank=True, help_text="When the Shake-out invoice was created")
     
+    # Load-time values of these fields are what save() compares against to detect transitions
+    TRACKED_FIELDS = ('status', 'paid', 'coupon_id', 'gift_discount_id')
+    PRICE_FIELDS = ['price_subtotal', 'price_gift_discount', 'price_coupon_discount', 'price_shipping', 'price_final']
+    SOLD_STATUSES = ['p', 'd']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_tracked_fields()
+        return instance
+
+    def _remember_tracked_fields(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {name: getattr(self, name) for name in self.TRACKED_FIELDS if name not in deferred}
+
+    def _original_values(self):
+        """Tracked field values as last loaded or saved; deferred ones are read in one query."""
+        values = dict(getattr(self, '_loaded_values', {}))
+        missing = [name for name in self.TRACKED_FIELDS if name not in values]
+        if missing and self.pk:
+            values.update(Pill.objects.filter(pk=self.pk).values(*missing).first() or {})
+        return values
+
     def save(self, *args, **kwargs):
         if not self.pill_number:
             self.pill_number = generate_pill_number()
 
-        # Track if paid status is being changed to True
-        is_newly_paid = False
-        if self.pk:
-            try:
-                old_pill = Pill.objects.get(pk=self.pk)
-                if not old_pill.paid and self.paid:
-                    is_newly_paid = True
-            except Pill.DoesNotExist:
-                pass
-        elif self.paid:
-            is_newly_paid = True
-
-        is_new = not self.pk
-        old_status = None if is_new else Pill.objects.get(pk=self.pk).status
+        is_new = self._state.adding
+        original = {} if is_new else self._original_values()
+        update_fields = kwargs.get('update_fields')
+        saves = lambda name: update_fields is None or name in update_fields or name.removesuffix('_id') in update_fields
 
-        super().save(*args, **kwargs)
+        # Track if paid status is being changed to True
+        is_newly_paid = self.paid and not original.get('paid', False) and saves('paid')
+        old_status = original.get('status')
+        status_changed = not is_new and saves('status') and old_status != self.status
 
+        # The gift discount is settled before the write instead of by a second save()
         if is_new:
-            PillStatusLog.objects.create(pill=self, status=self.status)
-            for item in self.items.all():
-                item.status = self.status
-                if self.status in ['p', 'd']:
-                    self._update_pill_item_prices(item)
-                item.save()
-            self.apply_gift_discount()
+            # A new pill has no items or address yet, so no gift applies and everything prices at zero
+            self.gift_discount = None
+            self._set_price_breakdown(PriceBreakdown(0.0, 0.0, 0.0, 0.0, 0.0))
         else:
-            if old_status != self.status:
-                status_log, created = PillStatusLog.objects.get_or_create(
-                    pill=self,
-                    status=self.status
-                )
-                if not created:
-                    status_log.changed_at = timezone.now()
-                    status_log.save()
+            extra_fields = set()
+            if status_changed and self.status != 'd' and not self.paid:
+                self.gift_discount = self._select_gift_discount()
+                extra_fields.add('gift_discount')
+            discounts_changed = any(
+                original.get(name) != getattr(self, name) for name in ('coupon_id', 'gift_discount_id')
+                if saves(name) or name.removesuffix('_id') in extra_fields
+            )
+            if discounts_changed and not self.price_breakdown_frozen:
+                self._set_price_breakdown(self.compute_price_breakdown())
+                extra_fields.update(self.PRICE_FIELDS)
+            elif update_fields is None:
+                # The stored breakdown is refreshed in place elsewhere; don't write back a stale copy
+                update_fields = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.PRICE_FIELDS
+                ]
+                kwargs['update_fields'] = update_fields
+            if update_fields is not None and extra_fields:
+                kwargs['update_fields'] = set(update_fields) | extra_fields
 
-                if self.status in ['c', 'r'] and old_status == 'd':
-                    self.restore_inventory()
+        with transaction.atomic():
+            if is_new:
+                self._insert(*args, **kwargs)
+                PillStatusLog.objects.create(pill=self, status=self.status)
+            else:
+                super().save(*args, **kwargs)
+                if is_newly_paid:
+                    # Paid pills keep their units until delivery or cancellation, even past the checkout hold
+                    StockReservation.hold(self, force=True)
+                if status_changed:
+                    self._run_status_transition(old_status)
+        self._remember_tracked_fields()
 
-                self.items.update(status=self.status)
+        if status_changed and self.paid and self.status != 'p':
+            self.send_payment_notification()
 
-                if self.status in ['p', 'd']:
-                    for item in self.items.all():
-                        self._update_pill_item_prices(item)
-                        item.save()
+        # Create Khazenly order if paid was just set to True
+        if is_newly_paid:
+            self._create_khazenly_order()
 
-                if self.status != 'd' and not self.paid:
-                    self.apply_gift_discount()
+    def _insert(self, *args, **kwargs):
+        # The unique index on pill_number has the last word: should it reject the
+        # number (e.g. two processes sharing a node id), draw new ones a few times
+        for attempt in range(PILL_NUMBER_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                last_attempt = attempt == PILL_NUMBER_ATTEMPTS - 1
+                if last_attempt or not Pill.objects.filter(pill_number=self.pill_number).exists():
+                    raise
+                self.pill_number = generate_pill_number()
+
+    def link_items(self, item_ids):
+        """Add PillItems to the pill with one bulk INSERT of the M2M rows, then re-price it."""
+        through = Pill.items.through
+        through.objects.bulk_create([through(pill_id=self.pk, pillitem_id=item_id) for item_id in item_ids])
+        # bulk_create sends no m2m_changed, which would otherwise refresh the breakdown
+        self.refresh_price_breakdown()
+
+    def _run_status_transition(self, old_status):
+        """Side effects of moving from old_status to self.status; runs once per change."""
+        logged = PillStatusLog.objects.filter(pill=self, status=self.status).update(changed_at=timezone.now())
+        if not logged:
+            PillStatusLog.objects.create(pill=self, status=self.status)
 
-                if old_status != 'd' and self.status == 'd':
-                    self.process_delivery()
+        if self.status in ['c', 'r'] and old_status == 'd':
+            self.restore_inventory()
+        if self.status in ['c', 'r']:
+            StockReservation.release(self.reservations.all())
 
-                if self.paid and self.status != 'p':
-                    super().save(*args, **kwargs)
-                    self.send_payment_notification()
+        items = self._sync_item_statuses()
 
-        # Create Khazenly order if paid was just set to True
-        if is_newly_paid:
-            self._create_khazenly_order()
+        if old_status != 'd' and self.status == 'd':
+            self.process_delivery(items)
+
+    def _sync_item_statuses(self):
+        """
+        Copy the pill status onto its items, recording the sale prices for sold
+        statuses. Returns the loaded items then, so delivery reuses them.
+        """
+        if self.status not in self.SOLD_STATUSES:
+            self.items.update(status=self.status)
+            return None
+        items = list(self.items.select_related('product', 'color'))
+        for item in items:
+            item.status = self.status
+        self._fill_sale_prices(items)
+        PillItem.objects.bulk_update(items, ['status', 'date_sold', 'price_at_sale', 'native_price_at_sale'])
+        return items
+
+    @staticmethod
+    def _fill_sale_prices(items):
+        """Set date_sold, price_at_sale and native_price_at_sale where missing, in a fixed number of queries."""
+        products = {item.product_id: item.product for item in items}
+        now = timezone.now()
+        Product.compute_effective_prices((p for p in products.values() if p.effective_price_is_stale(now)), now)
+
+        native_prices = {}
+        if any(not item.native_price_at_sale for item in items):
+            # Newest first, matching product.availabilities.filter(size=..., color=...).first()
+            availabilities = ProductAvailability.objects.filter(product_id__in=products).order_by('-date_added')
+            for availability in availabilities:
+                key = (availability.product_id, availability.size, availability.color_id)
+                native_prices.setdefault(key, availability.native_price)
+
+        for item in items:
+            if not item.date_sold:
+                item.date_sold = now
+            if not item.price_at_sale:
+                item.price_at_sale = item.product.discounted_price()
+            if not item.native_price_at_sale:
+                item.native_price_at_sale = native_prices.get((item.product_id, item.size, item.color_id), 0)
 
     def _create_khazenly_order(self):
         """Create Khazenly order when paid becomes True"""
@@ -785,110 +1478,136 @@ class Pill(models.Model):
         
         return False
 
-    def _update_pill_item_prices(self, item):
-        """Helper method to update prices and sale date on a pill item"""
-        if item.status in ['p', 'd']:
-            if not item.date_sold:
-                item.date_sold = timezone.now()
-
-            if not item.price_at_sale:
-                item.price_at_sale = item.product.discounted_price()
-
-            if not item.native_price_at_sale:
-                availability = item.product.availabilities.filter(
-                    size=item.size,
-                    color=item.color
-                ).first()
-                item.native_price_at_sale = availability.native_price if availability else 0
-
     def restore_inventory(self):
-        """Restore inventory quantities for all items in the pill"""
+        """Put the pill's items back into inventory; items without an inventory record are skipped"""
+        items = list(self.items.values_list('product_id', 'size', 'color_id', 'quantity'))
+        availability_ids = {
+            (product_id, size, color_id): pk
+            for pk, product_id, size, color_id in ProductAvailability.objects.filter(
+                product_id__in={item[0] for item in items}
+            ).values_list('pk', 'product_id', 'size', 'color_id')
+        }
+        returned = Counter()
+        for product_id, size, color_id, quantity in items:
+            pk = availability_ids.get((product_id, size, color_id))
+            if pk is not None:
+                returned[pk] += quantity
+        ProductAvailability.apply_stock_changes(quantity=returned)
+
+    def process_delivery(self, items=None):
+        """Take the delivered items out of inventory by committing the pill's stock holds"""
         with transaction.atomic():
-            for item in self.items.all():
-                try:
-                    availability = ProductAvailability.objects.select_for_update().get(
-                        product=item.product,
-                        size=item.size,
-                        color=item.color
-                    )
-                    availability.quantity += item.quantity
-                    availability.save()
-                except ProductAvailability.DoesNotExist:
-                    continue
-
-    def process_delivery(self):
-        """Process items when pill is marked as delivered"""
-        with transaction.atomic():
-            for item in self.items.all():
-                try:
-                    color = item.color if item.color else None
-                    availability = ProductAvailability.objects.select_for_update().get(
-                        product=item.product,
-                        size=item.size,
-                        color=color
-                    )
-                    if availability.quantity < item.quantity:
-                        raise ValidationError(
-                            f"Not enough inventory for {item.product.name} "
-                            f"(Size: {item.size}, Color: {item.color.name if item.color else 'N/A'}). "
-                            f"Required: {item.quantity}, Available: {availability.quantity}"
-                        )
-                    availability.quantity -= item.quantity
-                    availability.save()
-                    self._update_pill_item_prices(item)
-                    item.save()
-                except ProductAvailability.DoesNotExist:
-                    raise ValidationError(
-                        f"Inventory record for {item.product.name} "
-                        f"(Size: {item.size}, Color: {item.color.name if item.color else 'N/A'}) not found."
-                    )
+            # Items without a hold (expired, or pills from before holds existed) are held first
+            StockReservation.hold(self, items=items)
+            StockReservation.commit(self.reservations.all())
 
     def send_payment_notification(self):
         """Send payment confirmation if phone exists"""
         if hasattr(self, 'pilladdress') and self.pilladdress.phone:
             prepare_whatsapp_message(self.pilladdress.phone, self)
 
+    def compute_price_breakdown(self):
+        """Price the pill from its items, coupon, gift and address as of now; nothing is saved."""
+        now = timezone.now()
+        items = list(self.items.select_related('product'))
+        Product.compute_effective_prices((item.product for item in items if item.product.effective_price_is_stale(now)), now)
+        subtotal = sum(item.product.discounted_price() * item.quantity for item in items)
+
+        gift = 0.0
+        if self.gift_discount and self.gift_discount.is_available(subtotal):
+            gift = subtotal * (self.gift_discount.discount_value / 100)
+
+        coupon = 0.0
+        if self.coupon and self.coupon.coupon_start <= now <= self.coupon.coupon_end:
+            coupon = subtotal * (self.coupon.discount_value / 100)
+
+        shipping = 0.0
+        address = PillAddress.objects.filter(pill=self).only('government').first()
+        if address:
+            shipping = Shipping.objects.filter(government=address.government).values_list(
+                'shipping_price', flat=True
+            ).first() or 0.0
+
+        return PriceBreakdown(subtotal, gift, coupon, shipping, max(0, subtotal - gift - coupon) + shipping)
+
+    def _set_price_breakdown(self, breakdown):
+        for field, value in zip(self.PRICE_FIELDS, breakdown):
+            setattr(self, field, value)
+
+    @property
+    def price_breakdown_frozen(self):
+        """A paid pill keeps the prices it was paid at."""
+        return self.paid and self.price_final is not None
+
+    def refresh_price_breakdown(self):
+        """Recompute and store the breakdown, unless it is frozen. Call after items, coupon, gift or address change."""
+        if self.price_breakdown_frozen:
+            return self.price_breakdown()
+        breakdown = self.compute_price_breakdown()
+        self._set_price_breakdown(breakdown)
+        if self.pk:
+            Pill.objects.filter(pk=self.pk).update(**dict(zip(self.PRICE_FIELDS, breakdown)))
+        return breakdown
+
+    def price_breakdown(self):
+        """The stored PriceBreakdown, computed on first use for pills priced before it existed."""
+        if self.price_final is None:
+            return self.refresh_price_breakdown()
+        return PriceBreakdown(*(getattr(self, field) for field in self.PRICE_FIELDS))
+
     def price_without_coupons_or_gifts(self):
-        return sum(item.product.discounted_price() * item.quantity for item in self.items.all())
+        return self.price_breakdown().subtotal
 
     def calculate_coupon_discount(self):
-        if self.coupon:
-            now = timezone.now()
-            if self.coupon.coupon_start <= now <= self.coupon.coupon_end:
-                return self.price_without_coupons_or_gifts() * (self.coupon.discount_value / 100)
-        return 0.0
+        return self.price_breakdown().coupon
 
     def calculate_gift_discount(self):
-        if self.gift_discount and self.gift_discount.is_available(self.price_without_coupons_or_gifts()):
-            return self.price_without_coupons_or_gifts() * (self.gift_discount.discount_value / 100)
-        return 0.0
+        return self.price_breakdown().gift
 
     def shipping_price(self):
-        if hasattr(self, 'pilladdress'):
-            try:
-                shipping = Shipping.objects.filter(government=self.pilladdress.government).first()
-                return shipping.shipping_price if shipping else 0.0
-            except:
-                return 0.0
-        return 0.0
+        return self.price_breakdown().shipping
 
     def final_price(self):
-        base_price = self.price_without_coupons_or_gifts()
-        gift_discount = self.calculate_gift_discount()
-        coupon_discount = self.calculate_coupon_discount()
-        return max(0, base_price - gift_discount - coupon_discount) + self.shipping_price()
+        return self.price_breakdown().final
+
+    # PillDetailSerializer fields that read each related lookup
+    DETAIL_PREFETCHES = {
+        'user': {'user_name', 'user_username', 'user_phone', 'user_parent_phone'},
+        'coupon': {'coupon'},
+        'pilladdress': {'pilladdress'},
+        'status_logs': {'status_logs'},
+        'pay_requests': {'pay_requests'},
+        'items': {'items'},
+    }
 
-    def apply_gift_discount(self):
-        """Apply the best active PillGift discount based on total price."""
+    @classmethod
+    def prefetch_detail_data(cls, pills, fields=None):
+        """
+        Load everything PillDetailSerializer reads for a list of pills, including
+        each item's product with its listing data, in a fixed number of queries.
+        When fields is given, only the data those serializer fields need is loaded.
+        """
+        lookups = [
+            lookup for lookup, needed_by in cls.DETAIL_PREFETCHES.items()
+            if fields is None or needed_by & fields
+        ]
+        if 'items' in lookups:
+            lookups[lookups.index('items')] = models.Prefetch('items', queryset=PillItem.objects.select_related('color'))
+            # Prefetched rather than joined, so items of the same product share one instance
+            lookups.append('items__product')
+        models.prefetch_related_objects(pills, *lookups)
+        if 'items' in lookups or 'items__product' in lookups:
+            products = {item.product_id: item.product for pill in pills for item in pill.items.all()}
+            Product.prefetch_listing_data(list(products.values()))
+        return pills
+
+    def _select_gift_discount(self):
+        """The best active PillGift for the current total, or None; nothing is saved."""
         if self.paid or self.status == 'd':
-            self.gift_discount = None
-            self.save()
             return None
 
         total = self.price_without_coupons_or_gifts()
         if total <= 0:
-            self.gift_discount = None
-            self.save()
             return None
 
         applicable_gifts = PillGift.objects.filter(
@@ -902,17 +1621,14 @@ class Pill(models.Model):
             models.Q(end_date__isnull=True) | models.Q(end_date__gte=timezone.now())
         ).order_by('-discount_value', '-id')
 
-        if self.gift_discount and not self.gift_discount.is_available(total):
-            self.gift_discount = None
+        current = self.gift_discount if self.gift_discount and self.gift_discount.is_available(total) else None
+        return applicable_gifts.first() or current
 
-        gift = applicable_gifts.first()
-        if gift:
-            self.gift_discount = gift
-            self.save()
-            return gift
-        if not self.gift_discount:
-            self.save()
-        return None
+    def apply_gift_discount(self):
+        """Apply the best active PillGift discount based on total price."""
+        self.gift_discount = self._select_gift_discount()
+        self.save(update_fields=['gift_discount'])
+        return self.gift_discount
 
     class Meta:
         verbose_name_plural = 'Bills'
@@ -948,6 +1664,103 @@ class PillStatusLog(models.Model):
     def __str__(self):
         return f"{self.pill.id} - {self.get_status_display()} at {self.changed_at}"
     
+class StockReservation(models.Model):
+    """
+    Units of a ProductAvailability held for a pill between checkout and delivery.
+    While held they count in ProductAvailability.reserved (and Product.stock_reserved),
+    so other pills can't claim them; delivery commits the hold, cancellation or
+    expiry (release_expired_stock_holds) releases it.
+    """
+    HELD = 'h'
+    COMMITTED = 'c'
+    RELEASED = 'r'
+    STATUS_CHOICES = [(HELD, 'held'), (COMMITTED, 'committed'), (RELEASED, 'released')]
+
+    pill = models.ForeignKey(Pill, on_delete=models.CASCADE, related_name='reservations')
+    availability = models.ForeignKey(ProductAvailability, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(choices=STATUS_CHOICES, max_length=1, default=HELD)
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="Null means held until delivery or cancellation")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.pill_id} - {self.quantity} x {self.availability_id} ({self.get_status_display()})"
+
+    @staticmethod
+    def checkout_expiry():
+        return timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_TTL_MINUTES)
+
+    @classmethod
+    def hold(cls, pill, expires_at=None, force=False, items=None):
+        """
+        Hold the pill's items (or the given, already loaded ones). Units are only
+        taken while quantity - reserved covers them, else ValidationError is
+        raised; force holds them regardless, for pills that are already paid.
+        Items already held just get the new expiry.
+        """
+        with transaction.atomic():
+            held = set(pill.reservations.filter(status=cls.HELD).values_list('availability_id', flat=True))
+            pill.reservations.filter(status=cls.HELD).update(expires_at=expires_at)
+
+            if items is None:
+                items = list(pill.items.select_related('product', 'color'))
+            availabilities = {
+                (a.product_id, a.size, a.color_id): a
+                for a in ProductAvailability.objects.filter(product_id__in={item.product_id for item in items})
+            }
+            reservations = []
+            wanted = Counter()
+            labels = {}
+            for item in items:
+                availability = availabilities.get((item.product_id, item.size, item.color_id))
+                label = f"{item.product.name} (Size: {item.size}, Color: {item.color.name if item.color else 'N/A'})"
+                if availability is None:
+                    if force:
+                        continue
+                    raise ValidationError(f"Inventory record for {label} not found.")
+                if availability.pk in held:
+                    continue
+                wanted[availability.pk] += item.quantity
+                labels[availability.pk] = label
+                reservations.append(cls(pill=pill, availability=availability, quantity=item.quantity, expires_at=expires_at))
+            ProductAvailability.apply_stock_changes(reserved=wanted, labels=labels, check_available=not force)
+            cls.objects.bulk_create(reservations)
+
+    @classmethod
+    def _settle(cls, reservations, status):
+        """Move the held ones among reservations to status; returns how many, and {availability id: units} they held."""
+        held = list(reservations.filter(status=cls.HELD).select_for_update().values_list('pk', 'availability_id', 'quantity'))
+        cls.objects.filter(pk__in=[pk for pk, _, _ in held]).update(status=status)
+        units = Counter()
+        for _, availability_id, quantity in held:
+            units[availability_id] += quantity
+        return len(held), units
+
+    @classmethod
+    def release(cls, reservations):
+        """Give held units back to the available stock; returns how many holds were released."""
+        with transaction.atomic():
+            count, units = cls._settle(reservations, cls.RELEASED)
+            ProductAvailability.apply_stock_changes(reserved={pk: -quantity for pk, quantity in units.items()})
+        return count
+
+    @classmethod
+    def release_expired(cls, now=None):
+        return cls.release(cls.objects.filter(expires_at__lte=now or timezone.now()))
+
+    @classmethod
+    def commit(cls, reservations):
+        """Take held units out of stock for good, on delivery."""
+        with transaction.atomic():
+            _, units = cls._settle(reservations, cls.COMMITTED)
+            taken = {pk: -quantity for pk, quantity in units.items()}
+            ProductAvailability.apply_stock_changes(quantity=taken, reserved=taken)
+
 class CouponDiscount(models.Model):
     coupon = models.CharField(max_length=100, blank=True, null=True, editable=False)
     discount_value = models.FloatField(null=True, blank=True)
@@ -990,6 +1803,11 @@ class Rating(models.Model):
     def star_ranges(self):
         return range(int(self.star_number)), range(5 - int(self.star_number))
 
+    def save(self, *args, **kwargs):
+        # The product's rating counters are updated by signals inside the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-date_added'] 
 
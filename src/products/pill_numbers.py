@@ -0,0 +1,93 @@
+"""
+Pill numbers: 20 digits.
+
+    TTTTTTTTTT NNN SSS RRRR
+    |          |   |   random digits, so numbers can't be guessed from their neighbours
+    |          |   sequence within the second
+    |          node id of the generating process
+    seconds since EPOCH
+
+A process never hands out the same (second, sequence) pair twice: when a
+second's sequence is used up, numbers are taken from the following second
+rather than waiting for it, and a clock stepping backwards is ignored.
+
+Numbers from different processes are distinct as long as their node ids are.
+A process's node id is PILL_NUMBER_NODE_ID (a per-host base, 0 by default)
+plus its worker index, PILL_NUMBER_WORKER, which gunicorn.conf.py's post_fork
+hook sets to the worker's spawn counter. Processes started without a worker
+index (management commands, runserver) use their pid instead. Hosts sharing
+the database need bases far enough apart that their workers never meet.
+Either way the unique index on Pill.pill_number has the last word:
+Pill._insert draws a new number when it rejects one.
+"""
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+
+EPOCH = 1577836800  # 2020-01-01T00:00:00Z
+NODE_DIGITS = 3
+SEQUENCE_DIGITS = 3
+RANDOM_DIGITS = 4
+TIME_DIGITS = 20 - NODE_DIGITS - SEQUENCE_DIGITS - RANDOM_DIGITS
+
+_random = random.SystemRandom()
+
+
+def node_base():
+    """PILL_NUMBER_NODE_ID from the environment or settings, 0 when unset; validated at startup (products.checks)."""
+    configured = os.environ.get('PILL_NUMBER_NODE_ID') or getattr(settings, 'PILL_NUMBER_NODE_ID', None)
+    return int(configured) if configured not in (None, '') else 0
+
+
+def default_node_id():
+    worker = os.environ.get('PILL_NUMBER_WORKER')
+    offset = int(worker) if worker else os.getpid()
+    return (node_base() + offset) % 10 ** NODE_DIGITS
+
+
+class PillNumberGenerator:
+    def __init__(self, node_id=None):
+        self.node_id = node_id
+        self._lock = threading.Lock()
+        self._pid = None
+        self._node = None
+        self._second = 0
+        self._sequence = 0
+
+    def _reserve(self, count):
+        """Claim `count` (second, sequence) slots; returns (node id, slots)."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use, or a forked worker: it gets its own node id
+                self._pid = os.getpid()
+                self._node = self.node_id if self.node_id is not None else default_node_id()
+                self._second, self._sequence = 0, 0
+            now = int(time.time()) - EPOCH
+            if now > self._second:
+                self._second, self._sequence = now, 0
+            slots = []
+            for _ in range(count):
+                if self._sequence == 10 ** SEQUENCE_DIGITS:
+                    self._second, self._sequence = self._second + 1, 0
+                slots.append((self._second, self._sequence))
+                self._sequence += 1
+            return self._node, slots
+
+    def generate(self, count=1):
+        node, slots = self._reserve(count)
+        return [
+            f'{second % 10 ** TIME_DIGITS:0{TIME_DIGITS}d}{node:0{NODE_DIGITS}d}'
+            f'{sequence:0{SEQUENCE_DIGITS}d}{_random.randrange(10 ** RANDOM_DIGITS):0{RANDOM_DIGITS}d}'
+            for second, sequence in slots
+        ]
+
+
+_generator = PillNumberGenerator()
+
+
+def generate_pill_numbers(count):
+    """`count` distinct pill numbers, e.g. for a bulk_create of pills."""
+    return _generator.generate(count)
@@ -0,0 +1,201 @@
+"""
+Full-text product search.
+
+Every product has a ProductSearchDocument row holding its normalized name,
+taxonomy (category, brand, subject, teacher) and description. The active
+database backend indexes those rows: an FTS5 table on SQLite, a GIN
+tsvector expression index on PostgreSQL, and plain icontains lookups
+anywhere else.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import ProductSearchDocument
+
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي',
+    'ة': 'ه',
+    'ؤ': 'و',
+})
+TOKEN_RE = re.compile(r'\w+')
+# Product columns a search document is built from
+DOCUMENT_SOURCE_FIELDS = ['name', 'description', 'category_id', 'brand_id', 'subject_id', 'teacher_id']
+
+
+def normalize_text(text):
+    """Lowercase and fold Arabic letter variants and diacritics so spellings match."""
+    if not text:
+        return ''
+    text = ARABIC_DIACRITICS.sub('', text).translate(ARABIC_FOLDING).lower()
+    return ' '.join(TOKEN_RE.findall(text))
+
+
+def build_document(product, taxonomy_names=None):
+    """taxonomy_names defaults to the names of the product's category, brand, subject and teacher."""
+    if taxonomy_names is None:
+        taxonomy = [product.category, product.brand, product.subject, product.teacher]
+        taxonomy_names = [item.name for item in taxonomy if item]
+    return ProductSearchDocument(
+        product=product,
+        name=normalize_text(product.name),
+        taxonomy=normalize_text(' '.join(taxonomy_names)),
+        body=normalize_text(product.description),
+    )
+
+
+class FallbackSearchBackend:
+    """Substring search over the normalized documents, for databases without a full-text engine."""
+
+    def setup(self):
+        pass
+
+    def index(self, documents):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, queryset, tokens):
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(search_document__name__icontains=token) |
+                Q(search_document__taxonomy__icontains=token) |
+                Q(search_document__body__icontains=token)
+            )
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteSearchBackend(FallbackSearchBackend):
+    table = 'products_productsearch_fts'
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+                f"USING fts5(name, taxonomy, body, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def index(self, documents):
+        documents = list(documents)
+        self.remove([document.product_id for document in documents])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, name, taxonomy, body) VALUES (%s, %s, %s, %s)",
+                [(d.product_id, d.name, d.taxonomy, d.body) for d in documents]
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {self.table} WHERE rowid IN ({', '.join(['%s'] * len(product_ids))})",
+                    product_ids
+                )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, queryset, tokens):
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        product_table = queryset.model._meta.db_table
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match])
+        ).annotate(
+            # bm25() is lower for better matches; negate it so higher always ranks first
+            search_rank=RawSQL(
+                f"SELECT -bm25({self.table}, 10.0, 4.0, 1.0) FROM {self.table} "
+                f"WHERE {self.table} MATCH %s AND rowid = {product_table}.id",
+                [match]
+            )
+        )
+
+
+class PostgresSearchBackend(FallbackSearchBackend):
+    table = 'products_productsearchdocument'
+    vector = (
+        "setweight(to_tsvector('simple', name), 'A') || "
+        "setweight(to_tsvector('simple', taxonomy), 'B') || "
+        "setweight(to_tsvector('simple', body), 'C')"
+    )
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS products_search_vector_idx ON {self.table} USING GIN (({self.vector}))"
+            )
+
+    def search(self, queryset, tokens):
+        query = ' & '.join(f'{token}:*' for token in tokens)
+        product_table = queryset.model._meta.db_table
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT product_id FROM {self.table} WHERE {self.vector} @@ to_tsquery('simple', %s)",
+                [query]
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT ts_rank({self.vector}, to_tsquery('simple', %s)) FROM {self.table} "
+                f"WHERE product_id = {product_table}.id",
+                [query]
+            )
+        )
+
+
+def get_search_backend():
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return FallbackSearchBackend()
+
+
+def index_products(products, batch_size=500):
+    """(Re)build the search documents of the given products queryset."""
+    backend = get_search_backend()
+    products = products.select_related('category', 'brand', 'subject', 'teacher')
+    batch = []
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(build_document(product))
+        if len(batch) >= batch_size:
+            _write_documents(backend, batch)
+            batch = []
+    if batch:
+        _write_documents(backend, batch)
+
+
+def index_documents(documents):
+    """Store and index already built search documents."""
+    _write_documents(get_search_backend(), documents)
+
+
+def _write_documents(backend, documents):
+    # One transaction per batch; in autocommit SQLite would commit every FTS row separately
+    with transaction.atomic():
+        ProductSearchDocument.objects.bulk_create(
+            documents,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['name', 'taxonomy', 'body', 'updated_at']
+        )
+        backend.index(documents)
+
+
+def search_products(queryset, term):
+    """
+    Filter a Product queryset by a search term and annotate it with search_rank
+    (higher is better). A term with nothing searchable in it leaves the queryset as is.
+    """
+    tokens = normalize_text(term).split()
+    if not tokens:
+        return queryset
+    return get_search_backend().search(queryset, tokens)
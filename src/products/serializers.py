@@ -1,18 +1,28 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
 from collections import defaultdict
 from urllib.parse import urljoin
 from django.utils import timezone
-from django.db.models import Sum
-from django.db import transaction
+from django.db import models, transaction
 from accounts.models import User
+from accounts.sparse_fieldsets import SparseFieldsetsMixin
 from core import settings
 from .models import (
     BestProduct, Category, CouponDiscount, Discount, LovedProduct, PayRequest, PillAddress, PillGift,
     PillItem, PillStatusLog, PriceDropAlert, ProductDescription, Shipping,
-    SpecialProduct, SpinWheelDiscount, SpinWheelResult, SpinWheelSettings, StockAlert,
+    SpecialProduct, SpinWheelDiscount, SpinWheelResult, SpinWheelSettings, StockAlert, StockReservation,
     SubCategory, Brand, Product, ProductImage, ProductAvailability, Rating, Color, Pill, Subject, Teacher
 )
+from .cart import CartSnapshot
+from .thumbnails import thumbnail_urls
+
+
+def get_thumbnail_urls(field_file, request=None):
+    urls = thumbnail_urls(field_file)
+    if urls and request:
+        urls = {extension: request.build_absolute_uri(url) for extension, url in urls.items()}
+    return urls
 
 class SubCategorySerializer(serializers.ModelSerializer):
     category_name = serializers.SerializerMethodField()
@@ -72,10 +82,15 @@ class BulkProductDescriptionSerializer(serializers.ListSerializer):
         return ProductDescription.objects.bulk_create(descriptions)
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
         fields = '__all__'
 
+    def get_thumbnail(self, obj):
+        return get_thumbnail_urls(obj.image, self.context.get('request'))
+
 class ColorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Color
@@ -117,7 +132,7 @@ class ProductAvailabilityBreifedSerializer(serializers.Serializer):
     is_low_stock = serializers.SerializerMethodField()
 
     def get_is_low_stock(self, obj):
-        return obj.product.is_low_stock()
+        return obj.product.is_low_stock
     
 
 class RatingSerializer(serializers.ModelSerializer):
@@ -142,12 +157,21 @@ class ProductImageBulkUploadSerializer(serializers.Serializer):
         allow_empty=False
     )
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductListSerializer(serializers.ListSerializer):
+    """Serializes many products with their related data batch-loaded up front."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        products = Product.prefetch_listing_data(list(iterable), set(self.child.fields))
+        return [self.child.to_representation(product) for product in products]
+
+class ProductSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     availabilities = serializers.SerializerMethodField()
     discounted_price = serializers.SerializerMethodField()
     has_discount = serializers.SerializerMethodField()
     main_image = serializers.SerializerMethodField()
+    main_image_thumbnail = serializers.SerializerMethodField()
     number_of_ratings = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
     total_quantity = serializers.SerializerMethodField()
@@ -174,13 +198,14 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'product_number','name','type','year','category','sub_category','brand','subject' ,'teacher' , 'category_id', 'category_name', 'subject_id' ,'subject_name' , 'teacher_id' ,'teacher_name','teacher_image', 'sub_category_id', 'sub_category_name',
             'brand_id', 'brand_name', 'price', 'description', 'date_added', 'discounted_price',
-            'has_discount', 'current_discount', 'discount_expiry', 'main_image', 'images', 'number_of_ratings',
+            'has_discount', 'current_discount', 'discount_expiry', 'main_image', 'main_image_thumbnail', 'images', 'number_of_ratings',
             'average_rating', 'total_quantity', 'available_colors', 'available_sizes', 'availabilities',
             'descriptions', 'threshold', 'is_low_stock', 'is_important','base_image'
         ]
         read_only_fields = [
             'product_number'
         ]
+        list_serializer_class = ProductListSerializer
 
     def get_category_id(self, obj):
         return obj.category.id if obj.category else None
@@ -235,56 +260,26 @@ class ProductSerializer(serializers.ModelSerializer):
         return obj.discounted_price()
 
     def get_current_discount(self, obj):
-        now = timezone.now()
-        product_discount = obj.discounts.filter(
-            is_active=True,
-            discount_start__lte=now,
-            discount_end__gte=now
-        ).order_by('-discount').first()
-        category_discount = None
-        if obj.category:
-            category_discount = obj.category.discounts.filter(
-                is_active=True,
-                discount_start__lte=now,
-                discount_end__gte=now
-            ).order_by('-discount').first()
-        if product_discount and category_discount:
-            return max(product_discount.discount, category_discount.discount)
-        elif product_discount:
-            return product_discount.discount
-        elif category_discount:
-            return category_discount.discount
-        return None
+        return obj.current_discount_value()
 
     def get_discount_expiry(self, obj):
-        now = timezone.now()
-        discount = obj.discounts.filter(
-            is_active=True,
-            discount_start__lte=now,
-            discount_end__gte=now
-        ).order_by('-discount_end').first()
-        if not discount and obj.category:
-            discount = obj.category.discounts.filter(
-                is_active=True,
-                discount_start__lte=now,
-                discount_end__gte=now
-            ).order_by('-discount_end').first()
-        return discount.discount_end if discount else None
+        return obj.discount_expiry()
     
     def get_has_discount(self, obj):
         return obj.has_discount()
 
     def get_main_image(self, obj):
         main_image = obj.main_image()
-        print(f"Main image type: {type(main_image)}")  # Debug output
         if main_image and hasattr(main_image, 'url'):
-            print(f"Main image URL: {main_image.url}")  # Debug output
             request = self.context.get('request')
             if request:
                 return request.build_absolute_uri(main_image.url)
             return main_image.url
         return None
 
+    def get_main_image_thumbnail(self, obj):
+        return get_thumbnail_urls(obj.main_image(), self.context.get('request'))
+
     def get_number_of_ratings(self, obj):
         return obj.number_of_ratings()
 
@@ -301,7 +296,7 @@ class ProductSerializer(serializers.ModelSerializer):
         return obj.available_sizes()
 
     def get_is_low_stock(self, obj):
-        return obj.is_low_stock()
+        return obj.is_low_stock
 
 class ProductBreifedSerializer(serializers.ModelSerializer):
     class Meta:
@@ -320,6 +315,7 @@ class CouponCodeField(serializers.Field):
 
 class SpecialProductSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
+    special_image_thumbnail = serializers.SerializerMethodField()
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(),
         source='product',
@@ -329,11 +325,14 @@ class SpecialProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = SpecialProduct
         fields = [
-            'id', 'product', 'product_id', 'special_image',
+            'id', 'product', 'product_id', 'special_image', 'special_image_thumbnail',
             'order', 'is_active', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
 
+    def get_special_image_thumbnail(self, obj):
+        return get_thumbnail_urls(obj.special_image, self.context.get('request'))
+
 class BestProductSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
@@ -350,7 +349,38 @@ class BestProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
-class UserCartSerializer(serializers.ModelSerializer):
+class CartLineListSerializer(serializers.ListSerializer):
+    """Serializes many cart lines from one CartSnapshot, with nested products batch-loaded up front."""
+    cart_snapshot = None
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        items = list(iterable)
+        self.cart_snapshot = CartSnapshot(items)
+        product_field = self.child.fields.get('product')
+        if isinstance(product_field, ProductSerializer):
+            Product.prefetch_listing_data([item.product for item in items if item.product_id], set(product_field.fields))
+        return [self.child.to_representation(item) for item in items]
+
+class CartLineMixin:
+    """max_quantity (and total_price) of a cart line, read from the list's CartSnapshot when there is one."""
+
+    def cart_line(self, obj):
+        if not isinstance(obj, PillItem):
+            # The line being validated, before it is saved
+            obj = PillItem(
+                product=self.validated_data.get('product'),
+                size=self.validated_data.get('size'),
+                color=self.validated_data.get('color'),
+                quantity=self.validated_data.get('quantity', 1)
+            )
+        snapshot = getattr(self.parent, 'cart_snapshot', None)
+        return snapshot.line(obj) if snapshot else CartSnapshot([obj]).lines[0]
+
+    def get_max_quantity(self, obj):
+        return self.cart_line(obj).max_quantity
+
+class UserCartSerializer(CartLineMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     color = ColorSerializer(read_only=True)
     total_price = serializers.SerializerMethodField()
@@ -373,35 +403,11 @@ class UserCartSerializer(serializers.ModelSerializer):
             'max_quantity', # Added here
             'date_added'
         ]
+        list_serializer_class = CartLineListSerializer
 
     def get_total_price(self, obj):
         """Calculates the total price for the item based on its quantity and discounted price."""
-        if obj.product:
-            # Assuming product.discounted_price() method exists and returns the correct price
-            return obj.product.discounted_price() * obj.quantity
-        return 0
-
-    def _get_max_quantity(self, product, size, color):
-        if not product:
-            return 0
-
-        filters = {
-            'product': product,
-            'size': size,
-        }
-        
-        if color:
-            filters['color'] = color
-        else:
-            filters['color__isnull'] = True
-
-        availabilities = ProductAvailability.objects.filter(**filters)
-        total_available = availabilities.aggregate(total=Sum('quantity'))['total'] or 0
-        return total_available
-
-    # ADDED: Method to calculate the maximum available quantity
-    def get_max_quantity(self, obj):
-        return self._get_max_quantity(obj.product, obj.size, obj.color)
+        return self.cart_line(obj).total_price
 
 
 class PillCouponApplySerializer(serializers.ModelSerializer):
@@ -486,7 +492,7 @@ class PillAddressSerializer(serializers.ModelSerializer):
     def get_government(self, obj):
         return obj.get_government_display()
 
-class PillItemCreateUpdateSerializer(serializers.ModelSerializer):
+class PillItemCreateUpdateSerializer(CartLineMixin, serializers.ModelSerializer):
     product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
     color = serializers.PrimaryKeyRelatedField(
         queryset=Color.objects.all(), 
@@ -504,38 +510,8 @@ class PillItemCreateUpdateSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'max_quantity': {'read_only': True}
         }
+        list_serializer_class = CartLineListSerializer
 
-    def _get_max_quantity(self, product, size, color):
-        if not product:
-            return 0
-
-        filters = {'product': product}
-        
-        # Handle size (can be None)
-        if size is not None:
-            filters['size'] = size
-        else:
-            filters['size__isnull'] = True
-        
-        # Handle color (can be None)
-        if color is not None:
-            filters['color'] = color
-        else:
-            filters['color__isnull'] = True
-        
-        availabilities = ProductAvailability.objects.filter(**filters)
-        total_available = availabilities.aggregate(total=Sum('quantity'))['total'] or 0
-        return total_available
-
-    def get_max_quantity(self, obj):
-        if isinstance(obj, PillItem):
-            return self._get_max_quantity(obj.product, obj.size, obj.color)
-        else:
-            product = self.validated_data.get('product')
-            size = self.validated_data.get('size')
-            color = self.validated_data.get('color')
-            return self._get_max_quantity(product, size, color)
-        
     def to_internal_value(self, data):
         # Handle case where frontend might send full objects instead of just IDs
         if isinstance(data.get('product'), dict):
@@ -552,21 +528,37 @@ class PillItemCreateUpdateSerializer(serializers.ModelSerializer):
         quantity = data.get('quantity', getattr(instance, 'quantity', 1))
 
         self._validate_stock(product, size, color, quantity)
+        if instance is not None:
+            # New cart lines are merged by PillItem.add_to_cart; an edited one must not clash with another
+            self._validate_unique_cart_line(
+                data.get('user', instance.user), product, size, color, data.get('status', instance.status), instance
+            )
         return data
 
+    @staticmethod
+    def _validate_unique_cart_line(user, product, size, color, status, instance=None):
+        """The unique_cart_line index allows one cart line per user and variant; report a clash as a 400."""
+        if getattr(user, 'pk', None) is None or status is not None:
+            return
+        lines = PillItem.objects.filter(user=user, product=product, status__isnull=True)
+        lines = lines.filter(models.Q(size=size) if size else models.Q(size__isnull=True) | models.Q(size=''))
+        lines = lines.filter(color=color) if color else lines.filter(color__isnull=True)
+        if instance is not None:
+            lines = lines.exclude(pk=instance.pk)
+        if lines.exists():
+            raise serializers.ValidationError({
+                'non_field_errors': ["This variant is already in the cart; change the quantity of that line instead."]
+            })
+
     def _validate_stock(self, product, size, color, quantity):
         if quantity <= 0:
             raise serializers.ValidationError({
                 'quantity': 'Quantity must be greater than 0.'
             })
 
-        availabilities = ProductAvailability.objects.filter(
-            product=product,
-            size=size,
-            color=color
-        )
+        line = CartSnapshot([PillItem(product=product, size=size, color=color, quantity=quantity)]).lines[0]
 
-        if not availabilities.exists():
+        if not line.has_variant:
             color_name = color.name if color else 'N/A'
             raise serializers.ValidationError({
                 'non_field_errors': [
@@ -575,7 +567,7 @@ class PillItemCreateUpdateSerializer(serializers.ModelSerializer):
                 ]
             })
 
-        total_available = availabilities.aggregate(total=Sum('quantity'))['total'] or 0
+        total_available = line.max_quantity
 
         if total_available < quantity:
             color_name = color.name if color else 'N/A'
@@ -588,7 +580,7 @@ class PillItemCreateUpdateSerializer(serializers.ModelSerializer):
             })
 
 
-class PillItemSerializer(serializers.ModelSerializer):
+class PillItemSerializer(CartLineMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     color = ColorSerializer(read_only=True)
     max_quantity = serializers.SerializerMethodField(
@@ -599,32 +591,39 @@ class PillItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = PillItem
         fields = ['id', 'product', 'quantity', 'size', 'color', 'status', 'date_added', 'max_quantity']
+        list_serializer_class = CartLineListSerializer
 
-    def _get_max_quantity(self, product, size, color):
-        if not product:
-            return 0
 
-        filters = {
-            'product': product,
-            'size': size,
-        }
-        
-        if color:
-            filters['color'] = color
-        else:
-            filters['color__isnull'] = True
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Resolves ids from a preloaded {pk: instance} map when one is set, else queries as usual."""
+    preloaded = None
 
-        availabilities = ProductAvailability.objects.filter(**filters)
-        total_available = availabilities.aggregate(total=Sum('quantity'))['total'] or 0
-        return total_available
+    def to_internal_value(self, data):
+        if self.preloaded is not None and not isinstance(data, bool):
+            try:
+                return self.preloaded[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
 
-    def get_max_quantity(self, obj):
-        return self._get_max_quantity(obj.product, obj.size, obj.color)
+class PillItemCreateListSerializer(CartLineListSerializer):
+    """Validates many items with their products and colors loaded in one query each."""
 
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            for name in ('product', 'color'):
+                field = self.child.fields[name]
+                ids = set()
+                for row in data:
+                    value = row.get(name) if isinstance(row, dict) else None
+                    if isinstance(value, (int, str)) and str(value).isdigit():
+                        ids.add(int(value))
+                field.preloaded = field.get_queryset().in_bulk(ids)
+        return super().to_internal_value(data)
 
-class PillItemCreateSerializer(serializers.ModelSerializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
-    color = serializers.PrimaryKeyRelatedField(queryset=Color.objects.all(), required=False, allow_null=True)
+class PillItemCreateSerializer(CartLineMixin, serializers.ModelSerializer):
+    product = PreloadedPrimaryKeyRelatedField(queryset=Product.objects.all())
+    color = PreloadedPrimaryKeyRelatedField(queryset=Color.objects.all(), required=False, allow_null=True)
     status = serializers.CharField(read_only=True)
     max_quantity = serializers.SerializerMethodField(
         read_only=True,
@@ -634,30 +633,7 @@ class PillItemCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = PillItem
         fields = ['id', 'product', 'quantity', 'size', 'color', 'status','max_quantity']
-
-    def get_max_quantity(self, obj):
-        # For existing instances
-        if isinstance(obj, PillItem):
-            product = obj.product
-            size = obj.size
-            color = obj.color
-        # For new instances, get from validated data
-        else:
-            product = self.validated_data.get('product')
-            size = self.validated_data.get('size')
-            color = self.validated_data.get('color')
-
-        if not product:
-            return 0
-
-        availabilities = ProductAvailability.objects.filter(
-            product=product,
-            size=size,
-            color=color
-        )
-        
-        total_available = availabilities.aggregate(total=Sum('quantity'))['total'] or 0
-        return total_available
+        list_serializer_class = PillItemCreateListSerializer
 
 class AdminPillItemSerializer(PillItemCreateUpdateSerializer):
     user = serializers.PrimaryKeyRelatedField(
@@ -751,6 +727,12 @@ class AdminPillItemSerializer(PillItemCreateUpdateSerializer):
 
     def validate(self, data):
         data = super().validate(data)
+        if self.instance is None:
+            request = self.context.get('request')
+            self._validate_unique_cart_line(
+                data.get('user', getattr(request, 'user', None)), data['product'], data.get('size'),
+                data.get('color'), data.get('status')
+            )
         
         # Admin-specific validations
         if 'status' in data and data['status'] == 'd' and 'pill' not in data:
@@ -855,15 +837,16 @@ class PillCreateSerializer(serializers.ModelSerializer):
         user = validated_data['user']
         items_data = validated_data.pop('items', None)
         
+        # A fixed number of queries whatever the cart size. New pills are never
+        # paid or delivered, so there are no sale prices to record on the items.
         with transaction.atomic():
             # Create the pill first
             pill = Pill.objects.create(**validated_data)
             
             if items_data:
                 # Create new items specifically for this pill
-                pill_items = []
-                for item_data in items_data:
-                    item = PillItem.objects.create(
+                pill_items = [
+                    PillItem(
                         user=user,
                         product=item_data['product'],
                         quantity=item_data['quantity'],
@@ -872,21 +855,29 @@ class PillCreateSerializer(serializers.ModelSerializer):
                         status=pill.status,
                         pill=pill  # Link directly to the pill
                     )
-                    pill_items.append(item)
-                pill.items.set(pill_items)
+                    for item_data in items_data
+                ]
+                PillItem.objects.bulk_create(pill_items)
+                item_ids = [item.pk for item in pill_items]
             else:
                 # Move cart items (status=None) to this pill
                 cart_items = PillItem.objects.filter(user=user, status__isnull=True)
-                if not cart_items.exists():
+                item_ids = list(cart_items.values_list('id', flat=True))
+                if not item_ids:
                     raise ValidationError("No items provided in request and no items in cart to create a pill.")
-                
-                # Update cart items to belong to this pill
-                for item in cart_items:
-                    item.status = pill.status
-                    item.pill = pill
-                    item.save()
-                pill.items.set(cart_items)
-            
+                PillItem.objects.filter(pk__in=item_ids).update(status=pill.status, pill=pill)
+
+            pill.link_items(item_ids)
+            try:
+                StockReservation.hold(pill, expires_at=StockReservation.checkout_expiry())
+            except DjangoValidationError as e:
+                raise ValidationError(e.messages)
+            # Loaded once for the response, with what max_quantity reads
+            models.prefetch_related_objects(
+                [pill],
+                models.Prefetch('items', queryset=PillItem.objects.select_related('color')),
+                'items__product__availabilities',
+            )
             return pill
 
 class PillStatusLogSerializer(serializers.ModelSerializer):
@@ -977,7 +968,15 @@ class PillGiftSerializer(serializers.ModelSerializer):
             
         return data
 
-class PillDetailSerializer(serializers.ModelSerializer):
+class PillDetailListSerializer(serializers.ListSerializer):
+    """Serializes many pills with their items, products and other relations batch-loaded up front."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        pills = Pill.prefetch_detail_data(list(iterable), set(self.child.fields))
+        return [self.child.to_representation(pill) for pill in pills]
+
+class PillDetailSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     items = PillItemSerializer(many=True, read_only=True)
     coupon = CouponDiscountSerializer(read_only=True)
     pilladdress = PillAddressSerializer(read_only=True)
@@ -1005,6 +1004,7 @@ class PillDetailSerializer(serializers.ModelSerializer):
             'id','pill_number', 'tracking_number','user_name', 'user_username', 'items', 'status', 'status_display', 'date_added', 'paid', 'coupon', 'pilladdress', 'gift_discount',
             'price_without_coupons_or_gifts', 'coupon_discount', 'gift_discount', 'shipping_price', 'final_price', 'status_logs', 'pay_requests'
         ]
+        list_serializer_class = PillDetailListSerializer
 
     def get_user_name(self, obj):
         return obj.user.name
@@ -0,0 +1,258 @@
+from django.db.models import F, Q
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_migrate, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    BestProduct, Brand, Category, CatalogVersion, Color, Discount, Pill, PillAddress, PillItem, Product,
+    ProductAvailability, ProductDescription, ProductImage, Rating, SpecialProduct, StockReservation, SubCategory,
+    Subject, Teacher
+)
+from .search import DOCUMENT_SOURCE_FIELDS, get_search_backend, index_products
+from .thumbnails import generate_thumbnails
+
+
+def refresh_discount_targets(product_ids, category_ids):
+    """Recompute the materialized price of every product a discount applies to."""
+    product_ids = {pk for pk in product_ids if pk}
+    category_ids = {pk for pk in category_ids if pk}
+    if not product_ids and not category_ids:
+        return
+    products = Product.objects.filter(
+        Q(pk__in=product_ids) | Q(category_id__in=category_ids)
+    ).only('id', 'price', 'category_id', *Product.EFFECTIVE_PRICE_FIELDS)
+    Product.refresh_effective_prices(products.iterator(chunk_size=500))
+
+
+@receiver(pre_save, sender=Discount)
+def remember_discount_target(sender, instance, **kwargs):
+    # The discount may be moved to another product/category; refresh the old one too
+    instance._previous_target = None
+    if instance.pk:
+        instance._previous_target = Discount.objects.filter(pk=instance.pk).values_list(
+            'product_id', 'category_id'
+        ).first()
+
+
+@receiver(post_save, sender=Discount)
+def discount_saved(sender, instance, **kwargs):
+    previous_product_id, previous_category_id = getattr(instance, '_previous_target', None) or (None, None)
+    refresh_discount_targets(
+        [instance.product_id, previous_product_id],
+        [instance.category_id, previous_category_id]
+    )
+
+
+@receiver(post_delete, sender=Discount)
+def discount_deleted(sender, instance, **kwargs):
+    refresh_discount_targets([instance.product_id], [instance.category_id])
+
+
+@receiver(pre_save, sender=Rating)
+def remember_rating_state(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Rating.objects.filter(pk=instance.pk).values_list(
+            'product_id', 'star_number'
+        ).first()
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if previous == (instance.product_id, instance.star_number):
+        return
+    if previous:
+        Product.adjust_rating_counters(previous[0], previous[1], -1)
+    Product.adjust_rating_counters(instance.product_id, instance.star_number, 1)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    Product.adjust_rating_counters(instance.product_id, instance.star_number, -1)
+
+
+@receiver(pre_save, sender=ProductAvailability)
+def remember_availability_state(sender, instance, **kwargs):
+    instance._previous_stock = None
+    if instance.pk:
+        instance._previous_stock = ProductAvailability.objects.filter(pk=instance.pk).values_list(
+            'product_id', 'quantity'
+        ).first()
+
+
+@receiver(post_save, sender=ProductAvailability)
+def availability_saved(sender, instance, **kwargs):
+    previous_product_id, previous_quantity = getattr(instance, '_previous_stock', None) or (None, 0)
+    if previous_product_id and previous_product_id != instance.product_id:
+        Product.adjust_stock(previous_product_id, -previous_quantity)
+        previous_quantity = 0
+    Product.adjust_stock(instance.product_id, instance.quantity - previous_quantity)
+
+
+@receiver(post_delete, sender=ProductAvailability)
+def availability_deleted(sender, instance, **kwargs):
+    Product.adjust_stock(instance.product_id, -instance.quantity)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_state(sender, instance, **kwargs):
+    # Stored values of the columns the thumbnails and the search document are derived from
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = Product.objects.filter(pk=instance.pk).values(
+            'base_image', *DOCUMENT_SOURCE_FIELDS
+        ).first()
+
+
+def product_changed(instance, fields):
+    previous = getattr(instance, '_previous_state', None)
+    if previous is None:
+        return True
+    return any(previous[field] != getattr(instance, field) for field in fields)
+
+
+@receiver(post_save, sender=Product)
+def product_image_thumbnails(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+    if created or previous is None or previous['base_image'] != instance.base_image.name:
+        generate_thumbnails(instance.base_image)
+
+
+@receiver(pre_save, sender=ProductImage)
+def remember_image_product(sender, instance, **kwargs):
+    instance._previous_product_id = None
+    if instance.pk:
+        instance._previous_product_id = ProductImage.objects.filter(pk=instance.pk).values_list(
+            'product_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=ProductImage)
+def product_image_saved(sender, instance, **kwargs):
+    generate_thumbnails(instance.image)
+    Product.refresh_primary_images({instance.product_id, getattr(instance, '_previous_product_id', None)} - {None})
+
+
+@receiver(post_delete, sender=ProductImage)
+def product_image_deleted(sender, instance, **kwargs):
+    Product.refresh_primary_images([instance.product_id])
+
+
+@receiver(post_save, sender=SpecialProduct)
+def special_image_thumbnails(sender, instance, **kwargs):
+    generate_thumbnails(instance.special_image)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, **kwargs):
+    if sender.name == 'products':
+        get_search_backend().setup()
+        # Products from before the search index existed, or saved while it was missing
+        index_products(Product.objects.filter(search_document__isnull=True))
+
+
+@receiver(pre_migrate)
+def merge_duplicate_cart_lines(sender, using='default', **kwargs):
+    # The unique_cart_line index can't be built over duplicate cart lines
+    if sender.name == 'products' and PillItem._meta.db_table in connections[using].introspection.table_names():
+        PillItem.merge_duplicate_cart_lines(using)
+
+
+@receiver(post_save, sender=Product)
+def product_search_document(sender, instance, created, **kwargs):
+    if created or product_changed(instance, DOCUMENT_SOURCE_FIELDS):
+        index_products(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def product_search_document_deleted(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=Teacher)
+def taxonomy_renamed(sender, instance, created, **kwargs):
+    # Taxonomy names are part of the search document of every product using them
+    if not created:
+        field = {Category: 'category', Brand: 'brand', Subject: 'subject', Teacher: 'teacher'}[sender]
+        index_products(Product.objects.filter(**{field: instance}))
+
+
+def refresh_pill_prices(pills):
+    """Re-price the unpaid pills among ``pills``; paid ones keep the breakdown they were paid at."""
+    for pill in pills.filter(paid=False).select_related('coupon', 'gift_discount'):
+        pill.refresh_price_breakdown()
+
+
+@receiver(m2m_changed, sender=Pill.items.through)
+def pill_items_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # Re-priced in place, so the caller's pill sees the new breakdown
+        instance.refresh_price_breakdown()
+    elif pk_set:
+        refresh_pill_prices(Pill.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=PillItem)
+def pill_item_saved(sender, instance, created, **kwargs):
+    # A new item only counts once it is added to a pill, which m2m_changed covers
+    if not created:
+        refresh_pill_prices(Pill.objects.filter(items=instance))
+
+
+@receiver(post_delete, sender=PillItem)
+def pill_item_deleted(sender, instance, **kwargs):
+    if instance.pill_id:
+        refresh_pill_prices(Pill.objects.filter(pk=instance.pill_id))
+
+
+@receiver(post_save, sender=PillAddress)
+def pill_address_saved(sender, instance, **kwargs):
+    # The government decides the shipping price
+    instance.pill.refresh_price_breakdown()
+
+
+@receiver(post_delete, sender=PillAddress)
+def pill_address_deleted(sender, instance, **kwargs):
+    refresh_pill_prices(Pill.objects.filter(pk=instance.pill_id))
+
+
+@receiver(post_delete, sender=StockReservation)
+def stock_reservation_deleted(sender, instance, **kwargs):
+    # A hold deleted with its pill no longer reserves anything
+    if instance.status == StockReservation.HELD:
+        ProductAvailability.objects.filter(pk=instance.availability_id).update(
+            reserved=F('reserved') - instance.quantity
+        )
+        product_id = ProductAvailability.objects.filter(pk=instance.availability_id).values_list(
+            'product_id', flat=True
+        ).first()
+        if product_id:
+            Product.adjust_reserved(product_id, -instance.quantity)
+        CatalogVersion.bump()
+
+
+# Every write to these bumps the catalog version, which drives both the
+# conditional GETs (products.conditional) and products.homepage_cache
+CATALOG_MODELS = [
+    Product, Discount, SpecialProduct, BestProduct, ProductAvailability, ProductImage, ProductDescription, Rating,
+    Category, SubCategory, Brand, Subject, Teacher, Color,
+]
+# Writes to these also bump the structure version behind products.facets and products.suggest
+STRUCTURE_MODELS = {
+    Product, ProductAvailability, ProductImage, Category, SubCategory, Brand, Subject, Teacher, Color,
+}
+
+
+def bump_catalog_version(sender, **kwargs):
+    CatalogVersion.bump(structure=sender in STRUCTURE_MODELS)
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_version_save_{model.__name__}')
+    post_delete.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_version_delete_{model.__name__}')
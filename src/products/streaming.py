@@ -0,0 +1,54 @@
+import json
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class StreamingListMixin:
+    """
+    Adds a streaming export mode to a ListAPIView.
+
+    ?stream=1 (or json) streams the filtered queryset as one JSON array and
+    ?stream=jsonl as JSON Lines. Rows are read with .iterator() and serialized
+    stream_chunk_size at a time, so memory stays flat and pagination is skipped.
+    """
+    stream_query_param = 'stream'
+    stream_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        mode = request.query_params.get(self.stream_query_param, '').lower()
+        if mode in ('1', 'true', 'json'):
+            return self.streaming_response(jsonl=False)
+        if mode == 'jsonl':
+            return self.streaming_response(jsonl=True)
+        return super().list(request, *args, **kwargs)
+
+    def iter_serialized(self):
+        rows = self.filter_queryset(self.get_queryset()).iterator(chunk_size=self.stream_chunk_size)
+        while True:
+            chunk = list(islice(rows, self.stream_chunk_size))
+            if not chunk:
+                return
+            yield from self.get_serializer(chunk, many=True).data
+
+    def streaming_response(self, jsonl):
+        def dumps(row):
+            return json.dumps(row, cls=JSONEncoder, ensure_ascii=False)
+
+        def json_lines():
+            for row in self.iter_serialized():
+                yield dumps(row) + '\n'
+
+        def json_array():
+            # The opening bracket goes out before the first query runs
+            yield '['
+            separator = ''
+            for row in self.iter_serialized():
+                yield separator + dumps(row)
+                separator = ','
+            yield ']'
+
+        if jsonl:
+            return StreamingHttpResponse(json_lines(), content_type='application/x-ndjson')
+        return StreamingHttpResponse(json_array(), content_type='application/json')
@@ -0,0 +1,133 @@
+"""
+Typeahead suggestions for the search box.
+
+Product, teacher, subject and brand names are normalized like the search
+index (products.search.normalize_text, plus Latin accent stripping) and kept
+in one sorted array of word-start keys, so a prefix lookup is two bisects
+and a scan of the matching slice, entirely in memory. Results are ranked by
+popularity: units sold (paid and delivered pill items) and rating count,
+summed over their products for teachers, subjects and brands.
+
+The index is rebuilt per process once the catalog structure version
+(CatalogVersion.structure_version) has moved, so stock and price writes do
+not trigger rebuilds and popularity is refreshed with the next product or
+taxonomy write. The version itself is checked at most every
+VERSION_CHECK_SECONDS, so most lookups do not touch the database at all.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db.models import Sum
+
+from .models import Brand, CatalogVersion, PillItem, Product, Subject, Teacher
+from .search import normalize_text
+
+VERSION_CHECK_SECONDS = 5
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+# Shortest prefixes match too much of the index to scan; their top results are precomputed
+PRECOMPUTED_PREFIX_LENGTH = 2
+SOLD_STATUSES = ['p', 'd']
+
+
+def suggest_key(text):
+    text = unicodedata.normalize('NFKD', normalize_text(text))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+class SuggestIndex:
+    def __init__(self, version, entries):
+        """entries: (kind, id, name, weight) tuples."""
+        self.version = version
+        self.entries = entries
+        keyed = []
+        for position, (kind, object_id, name, weight) in enumerate(entries):
+            words = suggest_key(name).split()
+            # Every word start is a key, so "math" also finds "advanced math"
+            for start in range(len(words)):
+                keyed.append((' '.join(words[start:]), position))
+        keyed.sort()
+        self.keys = [key for key, _ in keyed]
+        self.positions = [position for _, position in keyed]
+
+        self.precomputed = {}
+        groups = defaultdict(set)
+        for key, position in keyed:
+            for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+                if len(key) >= length:
+                    groups[key[:length]].add(position)
+        for prefix, positions in groups.items():
+            self.precomputed[prefix] = self._top(positions, MAX_LIMIT)
+
+    @classmethod
+    def build(cls, version):
+        sold = dict(
+            PillItem.objects.filter(status__in=SOLD_STATUSES).order_by()
+            .values('product').annotate(total=Sum('quantity')).values_list('product', 'total')
+        )
+        entries = []
+        related_weight = {'teacher': defaultdict(int), 'subject': defaultdict(int), 'brand': defaultdict(int)}
+        products = Product.objects.order_by().values_list(
+            'id', 'name', 'rating_count', 'teacher_id', 'subject_id', 'brand_id'
+        )
+        for product_id, name, rating_count, teacher_id, subject_id, brand_id in products.iterator(chunk_size=2000):
+            weight = (sold.get(product_id) or 0) + rating_count
+            entries.append(('product', product_id, name, weight))
+            for kind, related_id in (('teacher', teacher_id), ('subject', subject_id), ('brand', brand_id)):
+                if related_id is not None:
+                    related_weight[kind][related_id] += weight
+        for kind, model in (('teacher', Teacher), ('subject', Subject), ('brand', Brand)):
+            for object_id, name in model.objects.order_by().values_list('id', 'name'):
+                entries.append((kind, object_id, name, related_weight[kind][object_id]))
+        return cls(version, entries)
+
+    def _top(self, positions, limit):
+        entries = self.entries
+        # Most popular first, then shorter (closer) names
+        return heapq.nsmallest(
+            limit, positions, key=lambda position: (-entries[position][3], len(entries[position][2]), position)
+        )
+
+    def lookup(self, query, limit=DEFAULT_LIMIT):
+        prefix = suggest_key(query)
+        if not prefix:
+            return []
+        if prefix in self.precomputed:
+            positions = self.precomputed[prefix][:limit]
+        elif len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            positions = []
+        else:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + '\U0010ffff', start)
+            positions = self._top(set(self.positions[start:end]), limit)
+        return [
+            {'type': kind, 'id': object_id, 'name': name}
+            for kind, object_id, name, _ in (self.entries[position] for position in positions)
+        ]
+
+
+_index = None
+_checked_at = 0.0
+_build_lock = threading.Lock()
+
+
+def get_suggest_index():
+    """The suggestion index, rebuilt when the structure version it was built from is outdated."""
+    global _index, _checked_at
+    index = _index
+    if index is not None and time.monotonic() - _checked_at < VERSION_CHECK_SECONDS:
+        return index
+    version = CatalogVersion.current_structure()
+    with _build_lock:
+        if _index is None or _index.version != version:
+            _index = SuggestIndex.build(version)
+        _checked_at = time.monotonic()
+        return _index
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    return get_suggest_index().lookup(query, max(1, min(limit, MAX_LIMIT)))
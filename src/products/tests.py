@@ -1,3 +1,1202 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.db.transaction import TransactionManagementError
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts.models import User
+from accounts.pagination import CustomPageNumberPagination, DateAddedCursorPagination
+from . import homepage_cache, pill_numbers
+from .catalog_io import CatalogImporter, export_chunks, reserve_product_ids
+from .checks import check_pill_number_node
+from .models import (
+    PILL_NUMBER_ATTEMPTS, Brand, Category, Color, CouponDiscount, Discount, PayRequest, Pill, PillAddress, PillItem,
+    Product, ProductAvailability, ProductDescription, ProductImage, ProductSearchDocument, Rating, StockReservation,
+    Subject, Teacher
+)
+from .serializers import PillDetailSerializer, ProductSerializer, UserCartSerializer
+from .search import FallbackSearchBackend, SQLiteSearchBackend, get_search_backend, normalize_text, search_products
+from .signals import create_search_index
+from .suggest import SuggestIndex
+from .views import PillListCreateView, ProductListView
+
+
+class DiscountRepricingTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.category = Category.objects.create(name='Books')
+        self.product = Product.objects.create(name='Algebra', price=100, category=self.category)
+
+    def at(self, moment):
+        return mock.patch('django.utils.timezone.now', return_value=moment)
+
+    def test_discount_applies_once_it_starts(self):
+        start = self.now + timedelta(hours=1)
+        Discount.objects.create(
+            product=self.product, discount=20, discount_start=start, discount_end=start + timedelta(days=1)
+        )
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.discounted_price(), 100)
+        self.assertEqual(product.effective_price_valid_until, start)
+
+        with self.at(start + timedelta(minutes=1)):
+            product = Product.objects.get(pk=self.product.pk)
+            self.assertEqual(product.discounted_price(), 80)
+            self.assertTrue(product.has_discount())
+
+    def test_discount_stops_applying_once_it_ends(self):
+        end = self.now + timedelta(hours=1)
+        Discount.objects.create(
+            category=self.category, discount=25, discount_start=self.now - timedelta(hours=1), discount_end=end
+        )
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.discounted_price(), 75)
+        self.assertEqual(product.discount_expiry(), end)
+
+        with self.at(end + timedelta(minutes=1)):
+            product = Product.objects.get(pk=self.product.pk)
+            self.assertEqual(product.discounted_price(), 100)
+            self.assertFalse(product.has_discount())
+
+    def test_reads_leave_the_stored_price_to_refresh_effective_prices(self):
+        start = self.now + timedelta(hours=1)
+        Discount.objects.create(
+            product=self.product, discount=20, discount_start=start, discount_end=start + timedelta(days=1)
+        )
+        with self.at(start + timedelta(minutes=1)):
+            Product.objects.get(pk=self.product.pk).discounted_price()
+            self.assertEqual(Product.objects.values_list('effective_price', flat=True).get(pk=self.product.pk), 100)
+
+            call_command('refresh_effective_prices', stdout=mock.Mock())
+        self.assertEqual(Product.objects.values_list('effective_price', flat=True).get(pk=self.product.pk), 80)
+
+    def test_best_discount_wins(self):
+        Discount.objects.create(
+            product=self.product, discount=10,
+            discount_start=self.now - timedelta(hours=1), discount_end=self.now + timedelta(hours=1)
+        )
+        Discount.objects.create(
+            category=self.category, discount=30,
+            discount_start=self.now - timedelta(hours=1), discount_end=self.now + timedelta(hours=1)
+        )
+        self.assertEqual(Product.objects.get(pk=self.product.pk).discounted_price(), 70)
+
+
+class RatingCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='x')
+        self.product = Product.objects.create(name='Algebra', price=100)
+        self.other = Product.objects.create(name='Geometry', price=100)
+
+    def assertCounters(self, product):
+        """The stored aggregates match a recount from the Rating table."""
+        product.refresh_from_db()
+        stored = (product.rating_count, product.rating_sum, product.rating_histogram())
+        Product.recount_ratings([product])
+        product.refresh_from_db()
+        self.assertEqual(stored, (product.rating_count, product.rating_sum, product.rating_histogram()))
+        return product
+
+    def test_create_and_update(self):
+        rating = Rating.objects.create(product=self.product, user=self.user, star_number=2)
+        Rating.objects.create(product=self.product, user=self.user, star_number=5)
+        rating.star_number = 4
+        rating.save()
+
+        product = self.assertCounters(self.product)
+        self.assertEqual(product.number_of_ratings(), 2)
+        self.assertEqual(product.average_rating(), 4.5)
+        self.assertEqual(product.rating_histogram(), {1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+
+    def test_delete(self):
+        rating = Rating.objects.create(product=self.product, user=self.user, star_number=3)
+        rating.delete()
+
+        product = self.assertCounters(self.product)
+        self.assertEqual(product.rating_count, 0)
+        self.assertEqual(product.average_rating(), 0.0)
+
+    def test_move_to_another_product(self):
+        rating = Rating.objects.create(product=self.product, user=self.user, star_number=3)
+        rating.product = self.other
+        rating.star_number = 1
+        rating.save()
+
+        self.assertEqual(self.assertCounters(self.product).rating_count, 0)
+        other = self.assertCounters(self.other)
+        self.assertEqual((other.rating_count, other.rating_sum, other.rating_1_count), (1, 1, 1))
+
+
+class StockCounterTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Algebra', price=100, threshold=5)
+        self.other = Product.objects.create(name='Geometry', price=100, threshold=5)
+
+    def assertInSync(self):
+        self.assertEqual(Product.recount_stock(commit=False), [])
+
+    def test_create_and_update(self):
+        availability = ProductAvailability.objects.create(product=self.product, size='s', quantity=3)
+        ProductAvailability.objects.create(product=self.product, size='m', quantity=4)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_total, self.product.is_low_stock), (7, False))
+
+        availability.quantity = 1
+        availability.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_total, self.product.is_low_stock), (5, True))
+        self.assertInSync()
+
+    def test_delete(self):
+        availability = ProductAvailability.objects.create(product=self.product, size='s', quantity=3)
+        availability.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_total, 0)
+        self.assertInSync()
+
+    def test_move_to_another_product(self):
+        availability = ProductAvailability.objects.create(product=self.product, size='s', quantity=8)
+        availability.product = self.other
+        availability.quantity = 6
+        availability.save()
+        self.product.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.product.stock_total, self.product.is_low_stock), (0, True))
+        self.assertEqual((self.other.stock_total, self.other.is_low_stock), (6, False))
+        self.assertInSync()
+
+    def test_threshold_change_reevaluates_low_stock(self):
+        ProductAvailability.objects.create(product=self.product, size='s', quantity=8)
+        self.product.refresh_from_db()
+        self.product.threshold = 10
+        self.product.save()
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.is_low_stock)
+        self.assertInSync()
+
+
+class InventoryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='x')
+        self.product = Product.objects.create(name='Algebra', price=100, threshold=1)
+        self.availability = ProductAvailability.objects.create(product=self.product, size='s', quantity=5)
+
+    def make_pill(self, quantity, **fields):
+        pill = Pill.objects.create(user=self.user, **fields)
+        item = PillItem.objects.create(
+            user=self.user, pill=pill, product=self.product, size='s', quantity=quantity, status=pill.status
+        )
+        pill.items.add(item)
+        return pill
+
+    def assertStock(self, quantity, reserved):
+        """Inventory, the product aggregates and the held reservations all agree."""
+        self.availability.refresh_from_db()
+        self.product.refresh_from_db()
+        held = StockReservation.objects.filter(
+            availability=self.availability, status=StockReservation.HELD
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertEqual((self.availability.quantity, self.availability.reserved, held), (quantity, reserved, reserved))
+        self.assertEqual((self.product.stock_total, self.product.stock_reserved), (quantity, reserved))
+        self.assertEqual(self.product.available_quantity('s', None), quantity - reserved)
+
+
+class StockReservationTests(InventoryTestCase):
+    def test_hold_reserves_units(self):
+        pill = self.make_pill(2)
+        StockReservation.hold(pill, expires_at=StockReservation.checkout_expiry())
+        self.assertStock(5, 2)
+
+        # Holding again only moves the expiry
+        StockReservation.hold(pill)
+        self.assertStock(5, 2)
+
+    def test_hold_beyond_available_stock_is_refused(self):
+        StockReservation.hold(self.make_pill(4))
+        with self.assertRaises(ValidationError):
+            StockReservation.hold(self.make_pill(2))
+        self.assertStock(5, 4)
+
+    def test_commit_takes_units_out_of_stock(self):
+        pill = self.make_pill(2)
+        StockReservation.hold(pill)
+        StockReservation.commit(pill.reservations.all())
+        self.assertStock(3, 0)
+        self.assertEqual(pill.reservations.get().status, StockReservation.COMMITTED)
+
+    def test_release_gives_units_back(self):
+        pill = self.make_pill(2)
+        StockReservation.hold(pill)
+        self.assertEqual(StockReservation.release(pill.reservations.all()), 1)
+        self.assertStock(5, 0)
+        # Settled holds are not released twice
+        self.assertEqual(StockReservation.release(pill.reservations.all()), 0)
+        self.assertStock(5, 0)
+
+    def test_release_expired(self):
+        expired, current = self.make_pill(1), self.make_pill(2)
+        StockReservation.hold(expired, expires_at=timezone.now() - timedelta(minutes=1))
+        StockReservation.hold(current, expires_at=timezone.now() + timedelta(minutes=10))
+        StockReservation.release_expired()
+        self.assertStock(5, 2)
+
+    def test_deleting_a_pill_releases_its_holds(self):
+        pill = self.make_pill(2)
+        StockReservation.hold(pill)
+        pill.delete()
+        self.assertStock(5, 0)
+
+    def test_batched_changes_are_all_or_nothing(self):
+        other = ProductAvailability.objects.create(product=self.product, size='m', quantity=1)
+        rows = ProductAvailability.objects.filter(product=self.product).order_by('pk')
+        with self.assertRaises(ValidationError):
+            ProductAvailability.apply_stock_changes(reserved={self.availability.pk: 2, other.pk: 2})
+        self.assertEqual(list(rows.values_list('quantity', 'reserved')), [(5, 0), (1, 0)])
+
+        ProductAvailability.apply_stock_changes(quantity={self.availability.pk: -1, other.pk: 1})
+        self.assertEqual(list(rows.values_list('quantity', 'reserved')), [(4, 0), (2, 0)])
+        self.assertEqual(Product.recount_stock(commit=False), [])
+
+
+
+class CheckoutTests(InventoryTestCase):
+    def checkout(self, quantity):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        line = {'product': self.product.pk, 'size': 's', 'quantity': quantity}
+        return client.post('/pills/init/', {'items': [line]}, format='json')
+
+    def test_checkout_prices_and_holds_the_items(self):
+        response = self.checkout(2)
+        self.assertEqual(response.status_code, 201)
+        pill = Pill.objects.get(pk=response.json()['id'])
+        self.assertEqual(list(pill.items.values_list('quantity', 'status')), [(2, 'i')])
+        self.assertEqual(pill.price_final, 200)
+        self.assertStock(5, 2)
+
+    def test_checkout_over_the_stock_holds_nothing(self):
+        self.checkout(4)
+        response = self.checkout(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Pill.objects.count(), 1)
+        self.assertStock(5, 4)
+
+@mock.patch.object(Pill, '_create_khazenly_order')
+class PillRestockingTests(InventoryTestCase):
+    def pay(self, pill):
+        pill.paid = True
+        pill.status = 'p'
+        pill.save()
+
+    def set_status(self, pill, status):
+        pill.status = status
+        pill.save()
+
+    def test_paid_pill_holds_and_delivery_commits(self, create_order):
+        pill = self.make_pill(2)
+        self.pay(pill)
+        create_order.assert_called_once_with()
+        self.assertStock(5, 2)
+        self.set_status(pill, 'd')
+        self.assertStock(3, 0)
+        self.assertEqual(set(pill.items.values_list('status', flat=True)), {'d'})
+
+    def test_cancel_before_delivery_releases_the_hold(self, create_order):
+        pill = self.make_pill(2)
+        self.pay(pill)
+        self.set_status(pill, 'c')
+        self.assertStock(5, 0)
+
+    def test_cancel_after_delivery_restocks(self, create_order):
+        pill = self.make_pill(2)
+        self.pay(pill)
+        self.set_status(pill, 'd')
+        self.set_status(pill, 'c')
+        self.assertStock(5, 0)
+
+    def test_refused_after_delivery_restocks_once(self, create_order):
+        pill = self.make_pill(2)
+        self.pay(pill)
+        self.set_status(pill, 'd')
+        self.set_status(pill, 'r')
+        self.assertStock(5, 0)
+        # Saving the same status again is not another transition
+        pill.save()
+        self.set_status(pill, 'c')
+        self.assertStock(5, 0)
+
+    def test_delivery_without_a_hold_takes_stock(self, create_order):
+        pill = self.make_pill(2)
+        self.set_status(pill, 'd')
+        self.assertStock(3, 0)
+
+
+class AddToCartTests(InventoryTestCase):
+    def cart_quantities(self):
+        return list(PillItem.objects.filter(user=self.user, status__isnull=True).values_list('quantity', flat=True))
+
+    def test_lines_merge_up_to_the_stock(self):
+        first = PillItem.add_to_cart(self.user, self.product, 's', None, 2)
+        self.assertEqual(PillItem.add_to_cart(self.user, self.product, 's', None, 3), first)
+        self.assertIsNone(PillItem.add_to_cart(self.user, self.product, 's', None, 1))
+        self.assertEqual(self.cart_quantities(), [5])
+
+    def test_new_line_over_the_stock_is_not_inserted(self):
+        self.assertIsNone(PillItem.add_to_cart(self.user, self.product, 's', None, 6))
+        self.assertEqual(self.cart_quantities(), [])
+
+    def test_reserved_units_are_not_available(self):
+        StockReservation.hold(self.make_pill(4))
+        self.assertIsNone(PillItem.add_to_cart(self.user, self.product, 's', None, 2))
+        self.assertIsNotNone(PillItem.add_to_cart(self.user, self.product, 's', None, 1))
+
+    def test_endpoint_reports_over_stock(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        line = {'product': self.product.pk, 'size': 's', 'quantity': 4}
+        self.assertEqual(client.post('/cart/add/', line, format='json').status_code, 201)
+
+        response = client.post('/cart/add/', line, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.json())
+        self.assertEqual(self.cart_quantities(), [4])
+
+
+    def test_editing_a_line_into_another_is_refused(self):
+        ProductAvailability.objects.create(product=self.product, size='m', quantity=5)
+        small = PillItem.objects.get(pk=PillItem.add_to_cart(self.user, self.product, 's', None, 1))
+        PillItem.add_to_cart(self.user, self.product, 'm', None, 1)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        line = {'product': self.product.pk, 'size': 'm', 'quantity': 1}
+        response = client.put(f'/cart/update/{small.pk}/', line, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.json())
+        small.refresh_from_db()
+        self.assertEqual(small.size, 's')
+
+        line['size'] = 's'
+        self.assertEqual(client.put(f'/cart/update/{small.pk}/', line, format='json').status_code, 200)
+
+    def test_dashboard_create_of_a_second_cart_line_is_refused(self):
+        PillItem.add_to_cart(self.user, self.product, 's', None, 1)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='staff', password='x', is_staff=True))
+
+        line = {'user': self.user.pk, 'product': self.product.pk, 'size': 's', 'color': None, 'quantity': 1}
+        response = client.post('/dashboard/pill-items/', line, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.json())
+        self.assertEqual(self.cart_quantities(), [1])
+
+        # Lines already in a pill are not cart lines
+        line['status'] = 'i'
+        self.assertEqual(client.post('/dashboard/pill-items/', line, format='json').status_code, 201)
+
+
+@mock.patch.object(Pill, '_create_khazenly_order')
+class PriceBreakdownTests(InventoryTestCase):
+    def stored_final(self, pill):
+        return Pill.objects.values_list('price_final', flat=True).get(pk=pill.pk)
+
+    def test_unpaid_pill_is_repriced(self, create_order):
+        pill = self.make_pill(2)
+        self.assertEqual(self.stored_final(pill), 200)
+        self.product.price = 150
+        self.product.save()
+        pill.refresh_price_breakdown()
+        self.assertEqual(self.stored_final(pill), 300)
+
+    def test_breakdown_is_frozen_after_payment(self, create_order):
+        pill = self.make_pill(2)
+        pill.paid = True
+        pill.save()
+        self.assertTrue(pill.price_breakdown_frozen)
+
+        self.product.price = 150
+        self.product.save()
+        Discount.objects.create(
+            product=self.product, discount=50,
+            discount_start=timezone.now() - timedelta(hours=1), discount_end=timezone.now() + timedelta(hours=1)
+        )
+        pill.items.add(PillItem.objects.create(user=self.user, pill=pill, product=self.product, size='m', quantity=1))
+        pill.coupon = CouponDiscount.objects.create(
+            discount_value=10, coupon_start=timezone.now() - timedelta(hours=1),
+            coupon_end=timezone.now() + timedelta(hours=1)
+        )
+        pill.save()
+        pill.refresh_price_breakdown()
+
+        pill = Pill.objects.get(pk=pill.pk)
+        self.assertEqual(tuple(pill.price_breakdown()), (200, 0, 0, 0, 200))
+
+
+class PillNumberTests(TestCase):
+    def test_layout(self):
+        number = pill_numbers.PillNumberGenerator(node_id=42).generate()[0]
+        self.assertRegex(number, r'^\d{20}$')
+        elapsed = int(time.time()) - pill_numbers.EPOCH
+        self.assertLessEqual(abs(int(number[:10]) - elapsed), 1)
+        self.assertEqual(number[10:13], '042')
+        self.assertEqual(number[13:16], '000')
+
+    def test_numbers_are_unique_within_and_across_nodes(self):
+        first = pill_numbers.PillNumberGenerator(node_id=1).generate(1500)
+        second = pill_numbers.PillNumberGenerator(node_id=2).generate(1500)
+        self.assertEqual(len(set(first)), 1500)
+        # The sequence rolls over into the next second instead of repeating
+        self.assertEqual(len({number[:16] for number in first}), 1500)
+        self.assertFalse({number[:16] for number in first} & {number[:16] for number in second})
+
+    def test_node_id_is_base_plus_worker_index(self):
+        with override_settings(PILL_NUMBER_NODE_ID='100'), mock.patch.dict('os.environ', {'PILL_NUMBER_WORKER': '7'}):
+            os.environ.pop('PILL_NUMBER_NODE_ID', None)
+            self.assertEqual(pill_numbers.default_node_id(), 107)
+        with mock.patch.dict('os.environ', {'PILL_NUMBER_NODE_ID': '998', 'PILL_NUMBER_WORKER': '5'}):
+            self.assertEqual(pill_numbers.default_node_id(), 3)
+        with mock.patch.dict('os.environ', {'PILL_NUMBER_NODE_ID': ''}):
+            os.environ.pop('PILL_NUMBER_WORKER', None)
+            self.assertEqual(pill_numbers.default_node_id(), os.getpid() % 1000)
+
+    def test_malformed_node_id_fails_the_system_check(self):
+        with mock.patch.dict('os.environ', {'PILL_NUMBER_NODE_ID': 'web-1'}):
+            self.assertEqual([error.id for error in check_pill_number_node(None)], ['products.E001'])
+        with mock.patch.dict('os.environ', {'PILL_NUMBER_NODE_ID': '12'}):
+            self.assertEqual(check_pill_number_node(None), [])
+
+
+class PillNumberCollisionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='x')
+        self.taken = Pill.objects.create(user=self.user).pill_number
+
+    def test_rejected_number_is_redrawn(self):
+        with mock.patch('products.models.generate_pill_number', side_effect=['1' * 20]):
+            pill = Pill.objects.create(user=self.user, pill_number=self.taken)
+        self.assertEqual(pill.pill_number, '1' * 20)
+        self.assertEqual(Pill.objects.count(), 2)
+
+    def test_retries_are_bounded(self):
+        with mock.patch('products.models.generate_pill_number', return_value=self.taken) as generate:
+            with self.assertRaises(IntegrityError):
+                Pill.objects.create(user=self.user, pill_number=self.taken)
+        self.assertEqual(generate.call_count, PILL_NUMBER_ATTEMPTS - 1)
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Books')
+        subject = Subject.objects.create(name='Math')
+        self.product = Product.objects.create(
+            name='Algebra', price=100, description='Linear equations', category=self.category,
+            subject=subject, teacher=Teacher.objects.create(name='Sara', subject=subject),
+            brand=Brand.objects.create(name='Nile'), year='first-secondary', is_important=True,
+        )
+
+    def run_import(self, text, file_format='jsonl'):
+        return CatalogImporter().run(io.StringIO(text), file_format)
+
+    def jsonl(self, *rows):
+        return ''.join(json.dumps(row) + '\n' for row in rows)
+
+    def test_round_trip(self):
+        for file_format in ['csv', 'jsonl']:
+            exported = ''.join(export_chunks(file_format))
+            importer = self.run_import(exported, file_format)
+            self.assertEqual((importer.created, importer.updated, importer.skipped), (0, 1, 0))
+            self.assertEqual(''.join(export_chunks(file_format)), exported)
+
+        exported = ''.join(export_chunks('jsonl'))
+        row = json.loads(exported)
+        row['product_number'] = ''
+        importer = self.run_import(self.jsonl(row))
+        self.assertEqual(importer.created, 1)
+        copy = Product.objects.exclude(pk=self.product.pk).get()
+        for field in ['name', 'price', 'description', 'category', 'subject', 'teacher', 'brand', 'year', 'is_important']:
+            self.assertEqual(getattr(copy, field), getattr(self.product, field), field)
+        self.assertEqual(copy.product_number, f'Bookefy-{copy.pk}')
+
+    def test_bad_rows_are_skipped_and_reported(self):
+        text = (
+            self.jsonl({'name': 'Geometry', 'price': 50})
+            + '{not json\n'
+            + '[1, 2]\n'
+            + self.jsonl({'name': 'Physics', 'price': 'cheap'}, {'price': 10}, {'name': 'Chemistry', 'sub_category': 'Labs'})
+        )
+        importer = self.run_import(text)
+        self.assertEqual((importer.created, importer.updated, importer.skipped), (1, 0, 5))
+        self.assertEqual([line for line, _ in importer.errors], [2, 3, 4, 6, 5])
+        self.assertTrue(Product.objects.filter(name='Geometry', price=50).exists())
+
+    def test_partial_row_leaves_other_columns_alone(self):
+        number = self.product.product_number
+        importer = self.run_import(self.jsonl({'product_number': number, 'price': 80, 'brand': None}))
+        self.assertEqual(importer.updated, 1)
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.price, product.brand), (80, None))
+        self.assertEqual(
+            (product.name, product.description, product.category, product.teacher, product.is_important),
+            ('Algebra', 'Linear equations', self.category, self.product.teacher, True)
+        )
+
+    def test_ids_of_deleted_products_are_not_reused(self):
+        deleted = Product.objects.create(name='Old edition', price=10)
+        Product.objects.filter(pk=deleted.pk).delete()
+        self.run_import(self.jsonl({'name': 'New edition', 'price': 10}))
+        product = Product.objects.get(name='New edition')
+        self.assertGreater(product.pk, deleted.pk)
+        self.assertNotEqual(product.product_number, deleted.product_number)
+        self.assertGreater(Product.objects.create(name='Later', price=1).pk, product.pk)
+
+    def test_reserving_ids_needs_the_inserting_transaction(self):
+        with mock.patch('products.catalog_io.connection.in_atomic_block', False):
+            with self.assertRaises(TransactionManagementError):
+                reserve_product_ids(1)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Books')
+        self.teacher = Teacher.objects.create(name='أحمد', subject=Subject.objects.create(name='Biology'))
+        self.algebra = Product.objects.create(
+            name='Algebra workbook', price=100, category=self.category, description='Linear equations'
+        )
+        self.arabic = Product.objects.create(name='كتاب الأحياء', price=80, teacher=self.teacher)
+        self.client = APIClient()
+
+    def search(self, term):
+        return set(search_products(Product.objects.all(), term).values_list('pk', flat=True))
+
+    def listed(self, term):
+        response = self.client.get('/products/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return {item['id'] for item in data.get('results', data)}
+
+    def test_normalize_text_folds_arabic_spellings(self):
+        self.assertEqual(normalize_text('الأحْيَاء'), 'الاحياء')
+        self.assertEqual(normalize_text('مكتبةٌ إسلامى'), 'مكتبه اسلامي')
+        self.assertEqual(normalize_text('Algebra, Vol.2'), 'algebra vol 2')
+
+    def test_full_text_search_matches_prefixes_and_taxonomy(self):
+        self.assertIsInstance(get_search_backend(), SQLiteSearchBackend)
+        self.assertEqual(self.search('alg'), {self.algebra.pk})
+        self.assertEqual(self.search('books linear'), {self.algebra.pk})
+        self.assertEqual(self.search('الاحياء'), {self.arabic.pk})
+        self.assertEqual(self.search('احمد'), {self.arabic.pk})
+        self.assertEqual(self.search('chemistry'), set())
+
+    def test_full_text_search_ranks_name_matches_first(self):
+        described = Product.objects.create(name='Geometry', price=50, description='algebra revision')
+        ranked = search_products(Product.objects.all(), 'algebra').order_by('-search_rank')
+        self.assertEqual(list(ranked.values_list('pk', flat=True)), [self.algebra.pk, described.pk])
+
+    def test_fallback_backend_matches_every_token(self):
+        with mock.patch('products.search.get_search_backend', return_value=FallbackSearchBackend()):
+            self.assertEqual(self.search('algebra books'), {self.algebra.pk})
+            self.assertEqual(self.search('الأحياء'), {self.arabic.pk})
+            self.assertEqual(self.search('algebra chemistry'), set())
+
+    def test_list_view_searches_the_index(self):
+        self.assertEqual(self.listed('ALGEBRA'), {self.algebra.pk})
+        self.assertEqual(self.listed('الاحيآء'), {self.arabic.pk})
+
+    def test_document_follows_renames_and_taxonomy_changes(self):
+        self.algebra.name = 'Calculus workbook'
+        self.algebra.save()
+        self.assertEqual(self.search('calculus'), {self.algebra.pk})
+        self.assertEqual(self.search('algebra'), set())
+
+        Product.objects.filter(pk=self.arabic.pk).update(teacher=None)
+        self.arabic.refresh_from_db()
+        self.arabic.teacher = self.teacher
+        self.arabic.save(update_fields=['teacher'])
+        self.assertEqual(self.search('احمد'), {self.arabic.pk})
+
+    def test_saves_that_leave_the_document_alone_skip_reindexing(self):
+        with mock.patch('products.signals.index_products') as index:
+            self.algebra.price = 120
+            self.algebra.save()
+            self.algebra.save(update_fields=['price'])
+        index.assert_not_called()
+
+    def test_migrate_backfills_missing_documents(self):
+        ProductSearchDocument.objects.all().delete()
+        get_search_backend().clear()
+        self.assertEqual(self.search('algebra'), set())
+
+        create_search_index(sender=apps.get_app_config('products'))
+        self.assertEqual(ProductSearchDocument.objects.count(), 2)
+        self.assertEqual(self.search('algebra'), {self.algebra.pk})
+
+
+class ProductFacetsTests(TestCase):
+    def setUp(self):
+        # The index is cached per structure version, which the test transactions roll back
+        patcher = mock.patch('products.facets._index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.books = Category.objects.create(name='Books')
+        self.notes = Category.objects.create(name='Notes')
+        self.brand = Brand.objects.create(name='Nahda')
+        self.algebra = Product.objects.create(name='Algebra', price=100, category=self.books, brand=self.brand)
+        self.geometry = Product.objects.create(name='Geometry', price=90, category=self.books, is_important=True)
+        self.summary = Product.objects.create(name='Algebra summary', price=30, category=self.notes, brand=self.brand)
+        ProductAvailability.objects.create(product=self.algebra, size='A4', quantity=5)
+        ProductAvailability.objects.create(product=self.summary, size='a4', quantity=5)
+        self.client = APIClient()
+
+    def facets(self, **params):
+        response = self.client.get('/products/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['count'], {
+            facet: {value['label']: value['count'] for value in values} for facet, values in data['facets'].items()
+        }
+
+    def test_counts_every_product_without_filters(self):
+        count, facets = self.facets()
+        self.assertEqual(count, 3)
+        self.assertEqual(facets['category'], {'Books': 2, 'Notes': 1})
+        self.assertEqual(facets['brand'], {'Nahda': 2})
+        self.assertEqual(facets['size'], {'A4': 2})
+
+    def test_counts_follow_the_active_filters(self):
+        count, facets = self.facets(category=self.books.pk)
+        self.assertEqual(count, 2)
+        # A facet's own selection leaves its alternatives countable
+        self.assertEqual(facets['category'], {'Books': 2, 'Notes': 1})
+        self.assertEqual(facets['brand'], {'Nahda': 1})
+
+        count, facets = self.facets(is_important='true')
+        self.assertEqual((count, facets['category'], facets['brand']), (1, {'Books': 1}, {}))
+
+        count, facets = self.facets(search='algebra', size='a4')
+        self.assertEqual(count, 2)
+        self.assertEqual(facets['category'], {'Books': 1, 'Notes': 1})
+
+    def test_invalid_filter_is_refused(self):
+        self.assertEqual(self.client.get('/products/facets/', {'category': 'x'}).status_code, 400)
+
+    def test_index_is_rebuilt_after_a_catalog_change(self):
+        self.assertEqual(self.facets()[0], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Physics', price=70, category=self.notes)
+        count, facets = self.facets()
+        self.assertEqual(count, 4)
+        self.assertEqual(facets['category'], {'Books': 2, 'Notes': 2})
+
+    def test_bulk_image_upload_rebuilds_the_has_images_facet(self):
+        self.assertEqual(self.facets(has_images='true')[0], 0)
+        image = io.BytesIO()
+        PILImage.new('RGB', (4, 4)).save(image, 'PNG')
+        self.client.force_authenticate(User.objects.create_user(username='staff', password='x', is_staff=True))
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/dashboard/product-images/bulk-upload/', {
+                    'product': self.algebra.pk,
+                    'images': [SimpleUploadedFile('cover.png', image.getvalue(), content_type='image/png')],
+                }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.facets(has_images='true')[0], 1)
+
+
+class ListQueryCountTests(TestCase):
+    """Serializing a list costs a fixed number of queries, however long the list is."""
+
+    def setUp(self):
+        # The images below have no files behind them
+        patcher = mock.patch('products.signals.generate_thumbnails')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = timezone.now()
+        self.user = User.objects.create_user(username='buyer', password='x')
+        self.category = Category.objects.create(name='Books')
+        self.subject = Subject.objects.create(name='Math')
+        self.teacher = Teacher.objects.create(name='Sara', subject=self.subject)
+        self.brand = Brand.objects.create(name='Nahda')
+        self.color = Color.objects.create(name='Red', degree='#f00')
+        Discount.objects.create(
+            category=self.category, discount=10,
+            discount_start=self.now - timedelta(days=1), discount_end=self.now + timedelta(days=1)
+        )
+        self.coupon = CouponDiscount.objects.create(
+            discount_value=5, coupon_start=self.now - timedelta(days=1), coupon_end=self.now + timedelta(days=1)
+        )
+        self.request = Request(APIRequestFactory().get('/'))
+
+    def make_products(self, count):
+        products = []
+        for number in range(count):
+            product = Product.objects.create(
+                name=f'Book {number}', price=100 + number, category=self.category, subject=self.subject,
+                teacher=self.teacher, brand=self.brand
+            )
+            ProductAvailability.objects.create(product=product, size='s', color=self.color, quantity=5)
+            ProductAvailability.objects.create(product=product, size='m', quantity=5)
+            ProductImage.objects.create(product=product, image=f'product_images/{number}.jpg')
+            ProductDescription.objects.create(product=product, title='Contents', description='Chapters')
+            Rating.objects.create(product=product, user=self.user, star_number=4)
+            products.append(product)
+        return products
+
+    def make_pills(self, count):
+        pills = []
+        for product in self.make_products(count):
+            pill = Pill.objects.create(user=self.user, coupon=self.coupon)
+            for size, color in (('s', self.color), ('m', None)):
+                pill.items.add(PillItem.objects.create(
+                    user=self.user, pill=pill, product=product, size=size, color=color, quantity=1, status=pill.status
+                ))
+            PillAddress.objects.create(pill=pill, name='Buyer', phone='01000000000')
+            PayRequest.objects.create(pill=pill, image='pay_requests/receipt.jpg')
+            pills.append(pill)
+        return pills
+
+    def make_cart(self, count):
+        products = self.make_products(count)
+        for product in products:
+            PillItem.objects.create(user=self.user, product=product, size='s', color=self.color, quantity=1)
+            PillItem.objects.create(user=self.user, product=product, size='m', quantity=2)
+        # The queryset of UserCartView
+        return PillItem.objects.filter(
+            user=self.user, status__isnull=True, product__in=products
+        ).select_related('product', 'color').order_by('-date_added')
+
+    def assertListQueries(self, queries, serializer_class, make):
+        for count in (1, 5):
+            with self.subTest(count=count):
+                objects = make(count)
+                expected = objects.count()
+                with self.assertNumQueries(queries):
+                    data = serializer_class(objects, many=True, context={'request': self.request}).data
+                self.assertEqual(len(data), expected)
+
+    def test_product_list(self):
+        self.assertListQueries(8, ProductSerializer, lambda count: Product.objects.filter(
+            pk__in=[product.pk for product in self.make_products(count)]
+        ))
+
+    def test_pill_list(self):
+        self.assertListQueries(15, PillDetailSerializer, lambda count: Pill.objects.filter(
+            pk__in=[pill.pk for pill in self.make_pills(count)]
+        ))
+
+    def test_cart_list(self):
+        self.assertListQueries(8, UserCartSerializer, self.make_cart)
+
+    def test_list_output_matches_per_object_output(self):
+        self.make_products(3)
+        products = Product.objects.all()
+        context = {'request': self.request}
+        listed = ProductSerializer(products, many=True, context=context).data
+        self.assertEqual(listed, [ProductSerializer(product, context=context).data for product in products])
+        self.assertEqual(listed[0]['discounted_price'], listed[0]['price'] * 0.9)
+
+
+class TeacherProductsTests(TestCase):
+    def setUp(self):
+        subject = Subject.objects.create(name='Math')
+        self.teacher = Teacher.objects.create(name='Sara', subject=subject)
+        other = Teacher.objects.create(name='Omar', subject=subject)
+        start = timezone.now() - timedelta(days=10)
+        for number, (name, kind, teacher, important) in enumerate([
+            ('Book 1', 'book', self.teacher, True),
+            ('Book 2', 'book', self.teacher, False),
+            ('Book 3', 'book', self.teacher, True),
+            ('Pen 1', 'product', self.teacher, False),
+            ('Pen 2', 'product', self.teacher, True),
+            ('Other book', 'book', other, True),
+        ]):
+            product = Product.objects.create(name=name, price=10, type=kind, teacher=teacher, is_important=important)
+            Product.objects.filter(pk=product.pk).update(date_added=start + timedelta(days=number))
+        self.client = APIClient()
+
+    def get(self, teacher_id, **params):
+        return self.client.get(f'/teacher-profile/{teacher_id}/', params)
+
+    def names(self, response):
+        data = response.json()
+        return [book['name'] for book in data['books']], [product['name'] for product in data['products']]
+
+    def test_newest_books_and_products_of_the_teacher(self):
+        response = self.get(self.teacher.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['teacher']['name'], 'Sara')
+        self.assertEqual(self.names(response), (['Book 3', 'Book 2', 'Book 1'], ['Pen 2', 'Pen 1']))
+
+    def test_limit_applies_to_each_type(self):
+        self.assertEqual(self.names(self.get(self.teacher.pk, limit=2)), (['Book 3', 'Book 2'], ['Pen 2', 'Pen 1']))
+        self.assertEqual(self.names(self.get(self.teacher.pk, limit=1)), (['Book 3'], ['Pen 2']))
+
+    def test_important_only(self):
+        response = self.get(self.teacher.pk, important='true', limit=1)
+        self.assertEqual(self.names(response), (['Book 3'], ['Pen 2']))
+        self.assertEqual(self.names(self.get(self.teacher.pk, important='true')), (['Book 3', 'Book 1'], ['Pen 2']))
+
+    def test_query_count(self):
+        # The teacher, both product lists in one windowed query, and their batch-loaded relations
+        with self.assertNumQueries(6):
+            self.get(self.teacher.pk)
+
+    def test_unknown_teacher_is_not_found(self):
+        response = self.get(self.teacher.pk + 100)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Teacher not found'})
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        start = timezone.now() - timedelta(days=10)
+        self.products = []
+        for number in range(5):
+            product = Product.objects.create(name=f'Book {number}', price=10)
+            # Two products share a timestamp, so the id breaks the tie
+            Product.objects.filter(pk=product.pk).update(date_added=start + timedelta(days=min(number, 3)))
+            self.products.append(product.pk)
+        self.newest_first = self.products[::-1]
+        self.client = APIClient()
+
+    def page(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [product['id'] for product in data['results']], data['next'], data['previous']
+
+    def test_cursor_pages_walk_forwards_and_backwards(self):
+        ids, next_link, previous_link = self.page('/products/', cursor='', per_page=2)
+        self.assertEqual((ids, previous_link), (self.newest_first[:2], None))
+        pages = [ids]
+        while next_link:
+            ids, next_link, previous_link = self.page(next_link)
+            pages.append(ids)
+        self.assertEqual(pages, [self.newest_first[:2], self.newest_first[2:4], self.newest_first[4:]])
+
+        ids, next_link, previous_link = self.page(previous_link)
+        self.assertEqual(ids, self.newest_first[2:4])
+        ids, next_link, previous_link = self.page(previous_link)
+        self.assertEqual((ids, previous_link), (self.newest_first[:2], None))
+        self.assertEqual(self.page(next_link)[0], self.newest_first[2:4])
+
+    def test_cursor_round_trip(self):
+        paginator = DateAddedCursorPagination()
+        request = Request(APIRequestFactory().get('/products/', {'cursor': '', 'per_page': 2}))
+        paginator.paginate_queryset(Product.objects.all(), request)
+        link = paginator.get_next_link()
+        cursor = parse_qs(urlparse(link).query)['cursor'][0]
+        self.assertEqual(parse_qs(urlparse(link).query)['per_page'], ['2'])
+
+        boundary = Product.objects.get(pk=self.newest_first[1])
+        request = Request(APIRequestFactory().get('/products/', {'cursor': cursor}))
+        self.assertEqual(paginator.decode_cursor(request), (boundary.date_added, boundary.pk, False))
+
+    def test_tampered_cursor_is_not_found(self):
+        valid = base64.urlsafe_b64encode(b'{"d":"2026-01-01T00:00:00+00:00","i":1}').decode()
+        self.assertEqual(self.client.get('/products/', {'cursor': valid}).status_code, 200)
+        for cursor in ['garbage', valid[:-4], base64.urlsafe_b64encode(b'{"d":"yesterday","i":1}').decode(),
+                       base64.urlsafe_b64encode(b'{"d":"2026-01-01T00:00:00","i":"x"}').decode()]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/products/', {'cursor': cursor}).status_code, 404)
+
+    def test_page_links(self):
+        ids, next_link, previous_link = self.page('/products/', per_page=2, page=2)
+        self.assertEqual(ids, self.newest_first[2:4])
+        self.assertEqual(parse_qs(urlparse(next_link).query)['page'], ['3'])
+        self.assertNotIn('page', parse_qs(urlparse(previous_link).query))
+
+    def test_page_size_cap(self):
+        for view, cap in [(ProductListView(), 100000), (PillListCreateView(), 1000)]:
+            with self.subTest(view=type(view).__name__):
+                paginator = CustomPageNumberPagination()
+                request = Request(APIRequestFactory().get('/', {'per_page': 200000}))
+                paginator.paginate_queryset(Product.objects.all(), request, view)
+                self.assertEqual(paginator.get_page_size(request), cap)
+
+
+class HomepageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.request = Request(APIRequestFactory().get('/combined-products/'))
+        self.build = mock.Mock(side_effect=['first', 'second'])
+
+    def get(self):
+        return homepage_cache.get_or_build(self.request, 'combined', 10, self.build)
+
+    def test_fresh_entry_is_served_without_rebuilding(self):
+        self.assertEqual(self.get()[0], 'first')
+        self.assertEqual(self.get()[0], 'first')
+        self.assertEqual(self.build.call_count, 1)
+
+    def test_stale_entry_is_served_while_another_request_rebuilds(self):
+        data, version = self.get()
+        later = time.time() + homepage_cache.FRESH_SECONDS + 1
+        key = f'homepage:combined:{self.request.scheme}:{self.request.get_host()}:10::'
+        cache.add(f'{key}:lock', 1)
+        with mock.patch('products.homepage_cache.time.time', return_value=later):
+            self.assertEqual(self.get(), (data, version))
+            self.assertEqual(self.build.call_count, 1)
+
+            # Once the lock is free the next request rebuilds it
+            cache.delete(f'{key}:lock')
+            self.assertEqual(self.get()[0], 'second')
+
+    def test_invalidate_makes_the_next_request_rebuild(self):
+        data, version = self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            homepage_cache.invalidate()
+        self.assertEqual(self.get()[0], 'second')
+        self.assertNotEqual(self.get()[1], version)
+        self.assertEqual(self.build.call_count, 2)
+
+    def test_catalog_writes_reach_the_combined_products(self):
+        client = APIClient()
+        self.assertEqual(client.get('/combined-products/').json()['last_products'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Algebra', price=100)
+        names = [product['name'] for product in client.get('/combined-products/').json()['last_products']]
+        self.assertEqual(names, ['Algebra'])
+
+
+class FinalPriceFilterTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        window = {'discount_start': now - timedelta(days=1), 'discount_end': now + timedelta(days=1)}
+        category = Category.objects.create(name='Books')
+        self.halved = Product.objects.create(name='Halved', price=100)
+        self.full = Product.objects.create(name='Full', price=80)
+        self.category_discount = Product.objects.create(name='Category', price=60, category=category)
+        Discount.objects.create(product=self.halved, discount=50, **window)
+        Discount.objects.create(category=category, discount=10, **window)
+        # Expired discounts do not count
+        Discount.objects.create(
+            product=self.full, discount=90, discount_start=now - timedelta(days=3), discount_end=now - timedelta(days=2)
+        )
+        self.client = APIClient()
+
+    def names(self, **params):
+        response = self.client.get('/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json()['results']]
+
+    def test_ordering_by_final_price(self):
+        self.assertEqual(self.names(ordering='final_price'), ['Halved', 'Category', 'Full'])
+        self.assertEqual(self.names(ordering='-final_price'), ['Full', 'Category', 'Halved'])
+        self.assertEqual(self.names(ordering='price'), ['Category', 'Full', 'Halved'])
+
+    def test_filtering_by_final_price(self):
+        self.assertEqual(self.names(price_min=52, ordering='final_price'), ['Category', 'Full'])
+        self.assertEqual(self.names(price_max=54, ordering='-final_price'), ['Category', 'Halved'])
+        self.assertEqual(self.names(price_min=50, price_max=50), ['Halved'])
+
+    def test_invalid_ordering_is_refused(self):
+        response = self.client.get('/products/', {'ordering': 'stock_total'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.json())
+
+
+class StreamingListTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='buyer', password='x')
+        for status in ['i', 'i', 'w', 'i', 'd']:
+            pill = Pill.objects.create(user=user)
+            Pill.objects.filter(pk=pill.pk).update(status=status)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='staff', password='x', is_staff=True))
+        # Smaller than the list, so the rows span several serializer chunks
+        patcher = mock.patch.object(PillListCreateView, 'stream_chunk_size', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def paged(self, **params):
+        return self.client.get('/dashboard/pills/', params).json()['results']
+
+    def streamed(self, **params):
+        response = self.client.get('/dashboard/pills/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response['Content-Type'], b''.join(response.streaming_content).decode('utf-8')
+
+    def test_json_array(self):
+        for mode in ['1', 'json']:
+            with self.subTest(mode=mode):
+                content_type, body = self.streamed(stream=mode)
+                self.assertEqual(content_type, 'application/json')
+                self.assertEqual(json.loads(body), self.paged())
+
+    def test_json_lines(self):
+        content_type, body = self.streamed(stream='jsonl')
+        self.assertEqual(content_type, 'application/x-ndjson')
+        self.assertTrue(body.endswith('\n'))
+        self.assertEqual([json.loads(line) for line in body.splitlines()], self.paged())
+
+    def test_filters_apply_and_pagination_is_skipped(self):
+        _, body = self.streamed(stream='1', status='i', per_page=1)
+        rows = json.loads(body)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows, self.paged(status='i'))
+
+    def test_empty_list(self):
+        self.assertEqual(self.streamed(stream='1', status='r')[1], '[]')
+        self.assertEqual(self.streamed(stream='jsonl', status='r')[1], '')
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', password='x')
+        product = Product.objects.create(name='Algebra', price=100)
+        pill = Pill.objects.create(user=self.user)
+        pill.items.add(PillItem.objects.create(user=self.user, pill=pill, product=product, quantity=1, status=pill.status))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fields_and_omit_narrow_the_list(self):
+        product = self.client.get('/products/', {'fields': 'id,name,price'}).json()['results'][0]
+        self.assertEqual(set(product), {'id', 'name', 'price'})
+
+        product = self.client.get('/products/', {'omit': 'description,images'}).json()['results'][0]
+        self.assertNotIn('description', product)
+        self.assertNotIn('images', product)
+        self.assertIn('average_rating', product)
+
+        product = self.client.get('/products/', {'fields': 'id,name', 'omit': 'name'}).json()['results'][0]
+        self.assertEqual(set(product), {'id'})
+
+    def test_unselected_method_fields_are_not_evaluated(self):
+        with mock.patch.object(ProductSerializer, 'get_average_rating') as average_rating:
+            self.client.get('/products/', {'fields': 'id,name'})
+        average_rating.assert_not_called()
+
+    def test_nested_serializers_keep_every_field(self):
+        pill = self.client.get('/user-pills/', {'fields': 'id,items', 'omit': 'name'}).json()['results'][0]
+        self.assertEqual(set(pill), {'id', 'items'})
+        product = pill['items'][0]['product']
+        # The nested ProductSerializer is not narrowed by the root's selection
+        self.assertIn('name', product)
+        self.assertIn('price', product)
+        self.assertIn('average_rating', product)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name='Algebra', price=100)
+        self.client = APIClient()
+
+    def test_etag_then_not_modified_then_new_etag_after_a_write(self):
+        response = self.client.get('/products/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        # The catalog version row and the price boundary aggregate, nothing else
+        with self.assertNumQueries(2):
+            response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Algebra II'
+            self.product.save()
+        response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['name'], 'Algebra II')
+        self.assertEqual(self.client.get('/products/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_passed_price_boundary_changes_the_etag(self):
+        etag = self.client.get('/products/')['ETag']
+        Product.objects.filter(pk=self.product.pk).update(
+            effective_price_valid_until=timezone.now() - timedelta(minutes=1)
+        )
+        response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_views_without_prices_ignore_the_price_boundary(self):
+        etag = self.client.get('/categories/')['ETag']
+        Product.objects.filter(pk=self.product.pk).update(
+            effective_price_valid_until=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertEqual(self.client.get('/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class SuggestTests(TestCase):
+    def setUp(self):
+        # Cached per process and structure version, which the test transactions roll back
+        patcher = mock.patch('products.suggest._index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def names(self, index, query, limit=8):
+        return [result['name'] for result in index.lookup(query, limit)]
+
+    def test_prefix_matches_any_word_start(self):
+        index = SuggestIndex(1, [
+            ('product', 1, 'Advanced Math', 0),
+            ('product', 2, 'Mathematics workbook', 0),
+            ('subject', 3, 'Algebra', 0),
+        ])
+        self.assertEqual(set(self.names(index, 'math')), {'Advanced Math', 'Mathematics workbook'})
+        self.assertEqual(self.names(index, 'advanced ma'), ['Advanced Math'])
+        self.assertEqual(self.names(index, 'gebra'), [])
+        self.assertEqual(self.names(index, '  '), [])
+
+    def test_names_are_folded_like_the_search_index(self):
+        index = SuggestIndex(1, [('product', 1, 'الأحياء', 0), ('brand', 2, 'Éditions Nahda', 0)])
+        self.assertEqual(self.names(index, 'الاحي'), ['الأحياء'])
+        self.assertEqual(self.names(index, 'editions'), ['Éditions Nahda'])
+        self.assertEqual(self.names(index, 'ÉDI'), ['Éditions Nahda'])
+
+    def test_ranked_by_popularity_then_name_length(self):
+        index = SuggestIndex(1, [
+            ('product', 1, 'Algebra workbook', 5),
+            ('product', 2, 'Algebra', 5),
+            ('product', 3, 'Algebra revision notes', 40),
+            ('product', 4, 'Algebra basics', 0),
+        ])
+        expected = ['Algebra revision notes', 'Algebra', 'Algebra workbook', 'Algebra basics']
+        # Short prefixes come from the precomputed tops, longer ones from the sorted keys
+        self.assertEqual(self.names(index, 'al'), expected)
+        self.assertEqual(self.names(index, 'algeb'), expected)
+        self.assertEqual(self.names(index, 'algeb', limit=2), expected[:2])
+
+    def test_popularity_counts_units_sold_and_ratings(self):
+        user = User.objects.create_user(username='buyer', password='x')
+        subject = Subject.objects.create(name='Math')
+        teacher = Teacher.objects.create(name='Sara', subject=subject)
+        sold = Product.objects.create(name='Math notes', price=10, subject=subject, teacher=teacher)
+        rated = Product.objects.create(name='Math exams', price=10)
+        Product.objects.create(name='Math quizzes', price=10)
+        PillItem.objects.create(user=user, product=sold, quantity=3, status='d')
+        PillItem.objects.create(user=user, product=sold, quantity=50)
+        Product.objects.filter(pk=rated.pk).update(rating_count=2)
+
+        response = APIClient().get('/products/suggest/', {'q': 'ma'})
+        self.assertEqual(response.status_code, 200)
+        # The subject weighs what its products sold; on a tie the shorter name goes first
+        self.assertEqual(
+            [(result['type'], result['name']) for result in response.json()['results']],
+            [('subject', 'Math'), ('product', 'Math notes'), ('product', 'Math exams'), ('product', 'Math quizzes')]
+        )
+        self.assertEqual(APIClient().get('/products/suggest/', {'limit': 'x'}).status_code, 400)
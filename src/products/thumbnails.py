@@ -0,0 +1,74 @@
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (400, 400)
+
+# extension -> (Pillow format, save options)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def thumbnail_name(name, extension):
+    """Deterministic storage name of a thumbnail, derived from the original file name."""
+    stem = os.path.splitext(name)[0]
+    width, height = THUMBNAIL_SIZE
+    return f'thumbnails/{stem}_{width}x{height}.{extension}'
+
+
+def thumbnail_urls(field_file):
+    """URLs of the thumbnails of an image field, without touching the storage."""
+    if not field_file:
+        return None
+    return {
+        extension: field_file.storage.url(thumbnail_name(field_file.name, extension))
+        for extension in THUMBNAIL_FORMATS
+    }
+
+
+def generate_thumbnails(field_file, force=False):
+    """
+    Write the WebP and JPEG thumbnails of an image field next to the original.
+    Existing thumbnails are kept unless force is True. Returns the number written.
+    """
+    if not field_file:
+        return 0
+    storage = field_file.storage
+    missing = [
+        extension for extension in THUMBNAIL_FORMATS
+        if force or not storage.exists(thumbnail_name(field_file.name, extension))
+    ]
+    if not missing:
+        return 0
+
+    try:
+        with field_file.open('rb') as source:
+            image = ImageOps.exif_transpose(Image.open(source))
+            image.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+
+        for extension in missing:
+            image_format, options = THUMBNAIL_FORMATS[extension]
+            converted = image
+            if image_format == 'JPEG' and image.mode != 'RGB':
+                converted = image.convert('RGB')
+            elif image.mode not in ('RGB', 'RGBA'):
+                converted = image.convert('RGBA')
+            buffer = BytesIO()
+            converted.save(buffer, image_format, **options)
+
+            name = thumbnail_name(field_file.name, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(buffer.getvalue()))
+    except (OSError, UnidentifiedImageError) as e:
+        # A broken upload or storage hiccup must not fail the save; the backfill command can retry
+        logger.warning(f"Could not create thumbnails for {field_file.name}: {e}")
+        return 0
+    return len(missing)
@@ -17,6 +17,8 @@ urlpatterns = [
     path('teachers/', views.TeacherListView.as_view(), name='teacher-list'),
     path('teachers/<int:id>/', views.TeacherDetailView.as_view(), name='teacher-detail'),
     path('products/', views.ProductListView.as_view(), name='product-list'),
+    path('products/facets/', views.ProductFacetsView.as_view(), name='product-facets'),
+    path('products/suggest/', views.ProductSuggestView.as_view(), name='product-suggest'),
     path('products/<int:id>/', views.ProductDetailView.as_view(), name='product-detail'),
     path('last-products/', views.Last10ProductsListView.as_view(), name='last-products'),
     path('special-products/active/', views.ActiveSpecialProductsView.as_view(), name='special-products'),
@@ -70,6 +72,8 @@ urlpatterns = [
     path('dashboard/colors/', views.ColorListCreateView.as_view(), name='admin-color-list-create'),
     path('dashboard/colors/<int:id>/', views.ColorRetrieveUpdateDestroyView.as_view(), name='admin-color-detail'),
     path('dashboard/products/', views.ProductListCreateView.as_view(), name='admin-product-list-create'),
+    path('dashboard/products/export/', views.ProductExportView.as_view(), name='admin-product-export'),
+    path('dashboard/products/import/', views.ProductImportView.as_view(), name='admin-product-import'),
     path('dashboard/products-breifed/', views.ProductListBreifedView.as_view(), name='admin-product-list-breifed'),
     path('dashboard/products/<int:pk>/', views.ProductRetrieveUpdateDestroyView.as_view(), name='admin-product-detail'),
     path('dashboard/product-images/', views.ProductImageListCreateView.as_view(), name='admin-product-image-list-create'),
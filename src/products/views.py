@@ -1,11 +1,14 @@
 from datetime import timedelta
+import io
 import random
 import logging
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 logger = logging.getLogger(__name__)
 from django.utils import timezone
-from django.db.models import Sum, F, Count, Q, Case, When, IntegerField
+from django.db.models import Sum, F, Count, Q, Case, When, IntegerField, Window
+from django.db.models.functions import RowNumber
 from django.db import transaction
 from rest_framework import generics, status
 from rest_framework.exceptions import ValidationError
@@ -18,15 +21,24 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.views import APIView
 from .serializers import *
-from .filters import CategoryFilter, CouponDiscountFilter, PillFilter, ProductFilter, SpinWheelResultFilter
+from .filters import (
+    CategoryFilter, CouponDiscountFilter, DashboardProductFilter, PillFilter, ProductFilter, SpinWheelResultFilter
+)
 from .models import (
     Category, Color, CouponDiscount, PillAddress, ProductAvailability,
     ProductImage, Rating, Shipping, SubCategory, Brand, Product, Pill,
     SpinWheelDiscount, SpinWheelResult
 )
+from .catalog_io import FORMATS as CATALOG_FORMATS, CatalogImporter, export_chunks, guess_format
+from .conditional import ConditionalCatalogMixin, catalog_validators, not_modified, set_validators
+from .facets import FACETS, FLAGS, get_facet_index
 from .permissions import IsOwner, IsOwnerOrReadOnly
+from .streaming import StreamingListMixin
+from .suggest import DEFAULT_LIMIT as SUGGEST_DEFAULT_LIMIT, suggest
+from .thumbnails import generate_thumbnails
+from . import homepage_cache
 
-class CategoryListView(generics.ListAPIView):
+class CategoryListView(ConditionalCatalogMixin, generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     filter_backends = [DjangoFilterBackend]
@@ -49,7 +61,7 @@ class SubjectListView(generics.ListAPIView):
     filter_backends = [DjangoFilterBackend, rest_filters.SearchFilter]
     search_fields = ['name', ]
  
-class TeacherListView(generics.ListAPIView):
+class TeacherListView(ConditionalCatalogMixin, generics.ListAPIView):
     queryset = Teacher.objects.all()
     serializer_class = TeacherSerializer
     filter_backends = [DjangoFilterBackend, rest_filters.SearchFilter]
@@ -67,12 +79,64 @@ class TeacherDetailView(generics.RetrieveAPIView):
         serializer = self.get_serializer(teacher, context={'request': request})
         return Response(serializer.data)
 
-class ProductListView(generics.ListAPIView):
+class ProductListView(ConditionalCatalogMixin, generics.ListAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, rest_filters.SearchFilter]
+    conditional_include_prices = True
+    # ?search= is handled by ProductFilter through the full-text index (products.search)
+    filter_backends = [DjangoFilterBackend]
     filterset_class = ProductFilter
-    search_fields = ['name', 'category__name', 'brand__name','subject__name' , 'teacher__name', 'description']
+
+
+class ProductFacetsView(APIView):
+    """
+    Filter sidebar counts (category, sub_category, subject, teacher, brand,
+    year, type, color, size) for the products matching the same query
+    parameters as ProductListView, served from the in-memory facet index.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        filterset = ProductFilter(request.query_params, queryset=Product.objects.all(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        index = get_facet_index()
+        selected, flags, others = {}, {}, {}
+        for name, value in filterset.form.cleaned_data.items():
+            if value is None or value == '' or name == 'ordering':
+                continue
+            if name in FACETS:
+                selected[name] = getattr(value, 'pk', value)
+            elif name in FLAGS:
+                flags[name] = value
+            else:
+                others[name] = request.query_params[name]
+
+        # Filters the index cannot answer (search, price range) narrow it with one id query
+        restrict = None
+        if others:
+            matching = ProductFilter(others, queryset=Product.objects.all(), request=request).qs
+            restrict = index.mask_for_ids(matching.values_list('id', flat=True))
+
+        count, facets = index.counts(selected, flags, restrict)
+        return Response({'count': count, 'facets': facets}, status=status.HTTP_200_OK)
+
+
+class ProductSuggestView(APIView):
+    """
+    Typeahead for the search box: ?q= prefix, optional ?limit=. Answered from
+    the in-memory suggestion index (products.suggest), not the database.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', SUGGEST_DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        results = suggest(request.query_params.get('q', ''), limit)
+        return Response({'results': results}, status=status.HTTP_200_OK)
 
 
 class ProductDetailView(generics.RetrieveAPIView):
@@ -83,7 +147,7 @@ class ProductDetailView(generics.RetrieveAPIView):
 class Last10ProductsListView(generics.ListAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, rest_filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend]
     filterset_class = ProductFilter
 
 class ActiveSpecialProductsView(generics.ListAPIView):
@@ -109,16 +173,26 @@ class CombinedProductsView(APIView):
         # Get limit parameter with default of 10
         limit = int(request.query_params.get('limit', 10))
         
-        # Prepare response data
-        data = {
+        # Answer 304 before touching the cache when the client is up to date
+        etag, last_modified = catalog_validators(include_prices=True)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        
+        # Prepare response data (cached, see products.homepage_cache)
+        data, version = homepage_cache.get_or_build(request, 'combined', limit, lambda: {
             'last_products': self.get_last_products(limit),
             'important_products': self.get_important_products(limit),
             'first_year_products': self.get_year_products('first-secondary', limit),
             'second_year_products': self.get_year_products('second-secondary', limit),
             'third_year_products': self.get_year_products('third-secondary', limit),
-        }
+        }, version=etag)
         
-        return Response(data, status=status.HTTP_200_OK)
+        response = Response(data, status=status.HTTP_200_OK)
+        # A stale payload served during a rebuild must not carry the current validators
+        if version == etag:
+            set_validators(response, etag, last_modified)
+        return response
     
     def get_last_products(self, limit):
         queryset = Product.objects.all().order_by('-id')[:limit]
@@ -146,11 +220,11 @@ class SpecialBestProductsView(APIView):
         # Get limit parameter with default of 10
         limit = int(request.query_params.get('limit', 10))
         
-        # Prepare response data
-        data = {
+        # Prepare response data (cached, see products.homepage_cache)
+        data, _ = homepage_cache.get_or_build(request, 'special-best', limit, lambda: {
             'special_products': self.get_special_products(limit),
             'best_products': self.get_best_products(limit),
-        }
+        })
         
         return Response(data, status=status.HTTP_200_OK)
     
@@ -160,16 +234,18 @@ class SpecialBestProductsView(APIView):
             is_active=True
         ).order_by('-order')[:limit].select_related('product')
         
-        # Serialize with additional fields
-        result = []
-        for sp in special_products:
-            product_data = ProductSerializer(sp.product, context={'request': self.request}).data
-            result.append({
+        # Serialize all products in one batch, then add the additional fields
+        products_data = ProductSerializer(
+            [sp.product for sp in special_products], many=True, context={'request': self.request}
+        ).data
+        return [
+            {
                 'order': sp.order,
                 'special_image': self.get_special_image_url(sp),
                 **product_data
-            })
-        return result
+            }
+            for sp, product_data in zip(special_products, products_data)
+        ]
     
     def get_special_image_url(self, special_product):
         if special_product.special_image and hasattr(special_product.special_image, 'url'):
@@ -184,67 +260,74 @@ class SpecialBestProductsView(APIView):
             is_active=True
         ).order_by('-order')[:limit].select_related('product')
         
-        # Serialize with additional fields
-        result = []
-        for bp in best_products:
-            product_data = ProductSerializer(bp.product, context={'request': self.request}).data
-            result.append({
+        # Serialize all products in one batch, then add the additional fields
+        products_data = ProductSerializer(
+            [bp.product for bp in best_products], many=True, context={'request': self.request}
+        ).data
+        return [
+            {
                 'order': bp.order,
                 **product_data
-            })
-        return result
+            }
+            for bp, product_data in zip(best_products, products_data)
+        ]
 
 
 class TeacherProductsView(APIView):
     permission_classes = [AllowAny]
     
     def get(self, request, teacher_id, *args, **kwargs):
+        # Get parameters with defaults
+        limit = int(request.query_params.get('limit', 10))
+        is_important = request.query_params.get('important', 'false').lower() == 'true'
+        
+        # One indexed lookup; cheaper than the catalog version reads a cached copy would need
         try:
-            teacher = Teacher.objects.get(pk=teacher_id)
+            teacher_data = self.get_teacher(teacher_id)
         except Teacher.DoesNotExist:
             return Response(
                 {"error": "Teacher not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Get parameters with defaults
-        limit = int(request.query_params.get('limit', 10))
-        is_important = request.query_params.get('important', 'false').lower() == 'true'
-        
         # Prepare response data
+        books, products = self.get_books_and_products(teacher_id, limit, is_important)
         data = {
-            'teacher': TeacherSerializer(teacher, context={'request': request}).data,
-            'books': self.get_books(teacher, limit, is_important),
-            'products': self.get_products(teacher, limit, is_important),
+            'teacher': teacher_data,
+            'books': books,
+            'products': products,
         }
         
         return Response(data, status=status.HTTP_200_OK)
     
-    def get_books(self, teacher, limit, is_important):
-        queryset = Product.objects.filter(
-            teacher=teacher,
-            type='book'
-        )
-        
-        if is_important:
-            queryset = queryset.filter(is_important=True)
-            
-        queryset = queryset.order_by('-date_added')[:limit]
-        serializer = ProductSerializer(queryset, many=True, context={'request': self.request})
-        return serializer.data
+    def get_teacher(self, teacher_id):
+        teacher = Teacher.objects.select_related('subject').get(pk=teacher_id)
+        return TeacherSerializer(teacher, context={'request': self.request}).data
     
-    def get_products(self, teacher, limit, is_important):
+    def get_books_and_products(self, teacher_id, limit, is_important):
+        """The newest `limit` books and products of a teacher, fetched and serialized together."""
         queryset = Product.objects.filter(
-            teacher=teacher,
-            type='product'
+            teacher_id=teacher_id,
+            type__in=['book', 'product']
         )
         
         if is_important:
             queryset = queryset.filter(is_important=True)
-            
-        queryset = queryset.order_by('-date_added')[:limit]
-        serializer = ProductSerializer(queryset, many=True, context={'request': self.request})
-        return serializer.data
+        
+        # One query: number the rows within each type and keep the first `limit` of each
+        queryset = queryset.annotate(
+            type_rank=Window(
+                RowNumber(),
+                partition_by=F('type'),
+                order_by=[F('date_added').desc(), F('id').desc()]
+            )
+        ).filter(type_rank__lte=limit).order_by('-date_added', '-id')
+        
+        rows = list(queryset)
+        serialized = ProductSerializer(rows, many=True, context={'request': self.request}).data
+        books = [data for product, data in zip(rows, serialized) if product.type == 'book']
+        products = [data for product, data in zip(rows, serialized) if product.type == 'product']
+        return books, products
 
 
 class UserCartView(generics.ListAPIView):
@@ -252,7 +335,9 @@ class UserCartView(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return PillItem.objects.filter(user=self.request.user, status__isnull=True).order_by('-date_added')
+        return PillItem.objects.filter(
+            user=self.request.user, status__isnull=True
+        ).select_related('product', 'color').order_by('-date_added')
 
 
 
@@ -268,38 +353,26 @@ class PillItemCreateView(generics.CreateAPIView):
         color = serializer.validated_data.get('color')
         quantity = serializer.validated_data['quantity']
 
-        with transaction.atomic():
-            # Check for existing item with the exact same attributes
-            existing_item = PillItem.objects.filter(
+        # Creates the cart line, or adds to the one with the exact same attributes
+        item_id = PillItem.add_to_cart(user, product, size, color, quantity)
+        if item_id is None:
+            # The combined quantity is over the stock: validate it to report why
+            existing_quantity = PillItem.objects.filter(
                 user=user,
                 product=product,
                 size=size,
                 color=color,
                 status__isnull=True
-            ).first()
-
-            if existing_item:
-                # If same exact item exists, combine quantities
-                combined_quantity = existing_item.quantity + quantity
-                try:
-                    temp_data = {
-                        'product': product.id,
-                        'size': size,
-                        'color': color.id if color else None,
-                        'quantity': combined_quantity
-                    }
-                    # Create a new serializer instance for validation
-                    validation_serializer = self.get_serializer(data=temp_data)
-                    validation_serializer.is_valid(raise_exception=True)
-                except serializers.ValidationError as e:
-                    raise serializers.ValidationError(e.detail)
-
-                existing_item.quantity = combined_quantity
-                existing_item.save()
-                serializer.instance = existing_item
-            else:
-                # Create new item
-                serializer.save(user=user, status=None)
+            ).values_list('quantity', flat=True).first() or 0
+            validation_serializer = self.get_serializer(data={
+                'product': product.id,
+                'size': size,
+                'color': color.id if color else None,
+                'quantity': existing_quantity + quantity
+            })
+            validation_serializer.is_valid(raise_exception=True)
+            raise serializers.ValidationError({'quantity': ["Not enough stock for this item."]})
+        serializer.instance = PillItem.objects.select_related('product', 'color').get(pk=item_id)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -672,7 +745,7 @@ class CustomPillFilterBackend(filters.BaseFilterBackend):
         return queryset
 
 
-class PillItemListCreateView(generics.ListCreateAPIView):
+class PillItemListCreateView(StreamingListMixin, generics.ListCreateAPIView):
     queryset = PillItem.objects.select_related(
         'user', 'product', 'color', 'pill'
     ).prefetch_related('product__images')
@@ -790,10 +863,8 @@ class UserActiveAlertsView(generics.ListAPIView):
         back_in_stock_alerts = StockAlert.objects.filter(
             user=request.user,
             is_notified=False
-        ).select_related('product').annotate(
-            available_quantity=Sum('product__availabilities__quantity')
-        ).filter(
-            available_quantity__gt=0
+        ).select_related('product').filter(
+            product__stock_total__gt=0
         )
         price_drop_alerts = PriceDropAlert.objects.filter(
             user=request.user,
@@ -1045,7 +1116,7 @@ class ProductListCreateView(generics.ListCreateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     filter_backends = [DjangoFilterBackend, rest_filters.SearchFilter]
-    filterset_class = ProductFilter
+    filterset_class = DashboardProductFilter
     search_fields = ['name', 'category__name', 'brand__name', 'description']
     pagination_class = CustomPageNumberPagination
     # permission_classes = [IsAdminUser]
@@ -1054,7 +1125,7 @@ class ProductListBreifedView(generics.ListCreateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductBreifedSerializer
     filter_backends = [DjangoFilterBackend, rest_filters.SearchFilter]
-    filterset_class = ProductFilter
+    filterset_class = DashboardProductFilter
     search_fields = ['name', 'category__name', 'brand__name', 'description']
     # permission_classes = [IsAdminUser]
 
@@ -1069,6 +1140,44 @@ class ProductImageListCreateView(generics.ListCreateAPIView):
     filterset_fields = ['product']
     # permission_classes = [IsAdminUser]
 
+class ProductExportView(APIView):
+    """Stream the whole catalog as CSV (default) or JSON Lines: ?file_format=csv|jsonl."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in CATALOG_FORMATS:
+            raise ValidationError({'file_format': f"Choose one of {', '.join(CATALOG_FORMATS)}."})
+        content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(export_chunks(file_format), content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="catalog.{file_format}"'
+        return response
+
+class ProductImportView(APIView):
+    """
+    Bulk create/update products from an uploaded CSV or JSON Lines `file`
+    (same columns as the export). Rows with a known product_number update it.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'No file was submitted.'})
+        file_format = request.data.get('file_format') or guess_format(upload.name)
+        if file_format not in CATALOG_FORMATS:
+            raise ValidationError({'file_format': f"Choose one of {', '.join(CATALOG_FORMATS)}."})
+
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        importer = CatalogImporter().run(stream, file_format)
+        return Response({
+            'created': importer.created,
+            'updated': importer.updated,
+            'skipped': importer.skipped,
+            'errors': [{'line': line, 'message': message} for line, message in importer.errors],
+        }, status=status.HTTP_200_OK)
+
 class ProductImageBulkCreateView(generics.CreateAPIView):
     # permission_classes = [IsAdminUser]
 
@@ -1082,6 +1191,12 @@ class ProductImageBulkCreateView(generics.CreateAPIView):
             for image in images
         ]
         ProductImage.objects.bulk_create(product_images)
+        # bulk_create skips the ProductImage signals
+        for product_image in product_images:
+            generate_thumbnails(product_image.image)
+        Product.refresh_primary_images([product.pk])
+        # New images change the has_images facet
+        homepage_cache.invalidate(structure=True)
         return Response(
             {"message": "Images uploaded successfully."},
             status=status.HTTP_201_CREATED
@@ -1165,7 +1280,7 @@ class BestProductRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView
     serializer_class = BestProductSerializer
     # permission_classes = [IsAdminUser]
 
-class PillListCreateView(generics.ListCreateAPIView):
+class PillListCreateView(StreamingListMixin, generics.ListCreateAPIView):
     queryset = Pill.objects.all()
     serializer_class = PillCreateSerializer
     filter_backends = [DjangoFilterBackend, rest_filters.SearchFilter]
@@ -1256,17 +1371,18 @@ class ProductAvailabilityListCreateView(generics.ListCreateAPIView):
         ).first()
         
         if existing_availability:
-            # Calculate the new total quantity
-            total_quantity = existing_availability.quantity + new_quantity
-            
-            # Update the existing instance directly
-            existing_availability.quantity = total_quantity
+            # Add to the stored quantity in SQL so concurrent restocks are not lost
+            updates = {'quantity': F('quantity') + new_quantity}
             
             # Update other fields if provided
             if 'native_price' in request.data:
-                existing_availability.native_price = request.data['native_price']
+                updates['native_price'] = request.data['native_price']
             
-            existing_availability.save()
+            with transaction.atomic():
+                ProductAvailability.objects.filter(pk=existing_availability.pk).update(**updates)
+                Product.adjust_stock(existing_availability.product_id, new_quantity)
+            homepage_cache.invalidate()
+            existing_availability.refresh_from_db()
             
             serializer = self.get_serializer(existing_availability)
             return Response(serializer.data, status=status.HTTP_200_OK)
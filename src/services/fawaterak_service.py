@@ -73,7 +73,8 @@ class FawaterakPaymentService:
                 })
             
             # Add shipping
-            shipping_price = float(pill.shipping_price())
+            breakdown = pill.price_breakdown()
+            shipping_price = float(breakdown.shipping)
             if shipping_price > 0:
                 cart_items.append({
                     "name": "Shipping Fee",
@@ -83,7 +84,7 @@ class FawaterakPaymentService:
                 cart_total += shipping_price
             
             # Handle discounts
-            discount_amount = float(pill.coupon_discount + pill.calculate_gift_discount())
+            discount_amount = float(breakdown.coupon + breakdown.gift)
             if discount_amount > 0:
                 cart_items.append({
                     "name": "Discount (Coupon + Gifts)",
@@ -122,7 +123,7 @@ class FawaterakPaymentService:
                     "pill_id": pill.id,
                     "pill_number": pill.pill_number,
                     "user_id": pill.user.id,
-                    "original_total": str(pill.final_price())
+                    "original_total": str(breakdown.final)
                 },
                 "sendEmail": True,
                 "sendSMS": False,
@@ -154,9 +154,10 @@ class KhazenlyService:
                 })
             
             # Calculate amounts with proper gift and coupon discounts
-            shipping_fees = float(pill.shipping_price())
-            gift_discount = float(pill.calculate_gift_discount())
-            coupon_discount = float(pill.coupon_discount) if pill.coupon_discount else 0
+            breakdown = pill.price_breakdown()
+            shipping_fees = float(breakdown.shipping)
+            gift_discount = float(breakdown.gift)
+            coupon_discount = float(breakdown.coupon)
             total_discount = gift_discount + coupon_discount
             total_amount = total_product_price + shipping_fees - total_discount
             
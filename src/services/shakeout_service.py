@@ -103,10 +103,11 @@ class ShakeoutService:
             }
             
             # Calculate totals
-            items_total = sum(item.product.discounted_price() * item.quantity for item in pill.items.all())
-            shipping_cost = pill.shipping_price()
-            total_discount = pill.calculate_coupon_discount() + pill.calculate_gift_discount()
-            final_amount = pill.final_price()
+            breakdown = pill.price_breakdown()
+            items_total = breakdown.subtotal
+            shipping_cost = breakdown.shipping
+            total_discount = breakdown.coupon + breakdown.gift
+            final_amount = breakdown.final
             
             # Prepare invoice items (all prices must be positive)
             invoice_items = []
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:58
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Store',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('store_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='stores/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png', 'webp'])])),
+                ('national_id_image', models.ImageField(blank=True, null=True, upload_to='stores/national_ids/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png', 'webp'])])),
+                ('government', models.CharField(blank=True, choices=[('1', 'Cairo'), ('2', 'Alexandria'), ('3', 'Kafr El Sheikh'), ('4', 'Dakahlia'), ('5', 'Sharqia'), ('6', 'Gharbia'), ('7', 'Monufia'), ('8', 'Qalyubia'), ('9', 'Giza'), ('10', 'Beni Suef'), ('11', 'Fayoum'), ('12', 'Minya'), ('13', 'Assiut'), ('14', 'Sohag'), ('15', 'Qena'), ('16', 'Luxor'), ('17', 'Aswan'), ('18', 'Red Sea'), ('19', 'Beheira'), ('20', 'Ismailia'), ('21', 'Suez'), ('22', 'Port Said'), ('23', 'Damietta'), ('24', 'Matruh'), ('25', 'New Valley'), ('26', 'North Sinai'), ('27', 'South Sinai')], max_length=2, null=True)),
+                ('address', models.TextField()),
+                ('phone1', models.CharField(max_length=20)),
+                ('phone2', models.CharField(blank=True, max_length=20, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('whatsapp_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('facebook_link', models.URLField(blank=True, null=True)),
+                ('telegram_link', models.URLField(blank=True, null=True)),
+                ('instagram_link', models.URLField(blank=True, null=True)),
+                ('youtube_link', models.URLField(blank=True, null=True)),
+                ('tiktok_link', models.URLField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='store', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StoreReporting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('date', models.DateTimeField(auto_now_add=True)),
+                ('is_handled', models.BooleanField(default=False)),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reports', to='store.store')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='store_reports', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StoreRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_name', models.CharField(max_length=100)),
+                ('last_name', models.CharField(max_length=100)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='store_requests/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'])])),
+                ('national_id_image', models.ImageField(blank=True, null=True, upload_to='stores/national_ids/', validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png', 'webp'])])),
+                ('store_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('government', models.CharField(blank=True, choices=[('1', 'Cairo'), ('2', 'Alexandria'), ('3', 'Kafr El Sheikh'), ('4', 'Dakahlia'), ('5', 'Sharqia'), ('6', 'Gharbia'), ('7', 'Monufia'), ('8', 'Qalyubia'), ('9', 'Giza'), ('10', 'Beni Suef'), ('11', 'Fayoum'), ('12', 'Minya'), ('13', 'Assiut'), ('14', 'Sohag'), ('15', 'Qena'), ('16', 'Luxor'), ('17', 'Aswan'), ('18', 'Red Sea'), ('19', 'Beheira'), ('20', 'Ismailia'), ('21', 'Suez'), ('22', 'Port Said'), ('23', 'Damietta'), ('24', 'Matruh'), ('25', 'New Valley'), ('26', 'North Sinai'), ('27', 'South Sinai')], max_length=2, null=True)),
+                ('address', models.TextField()),
+                ('phone1', models.CharField(blank=True, max_length=20, null=True)),
+                ('phone2', models.CharField(blank=True, max_length=20, null=True)),
+                ('email', models.EmailField(blank=True, max_length=254, null=True)),
+                ('whatsapp_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('facebook_link', models.URLField(blank=True, null=True)),
+                ('telegram_link', models.URLField(blank=True, null=True)),
+                ('instagram_link', models.URLField(blank=True, null=True)),
+                ('youtube_link', models.URLField(blank=True, null=True)),
+                ('tiktok_link', models.URLField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('refused', 'Refused')], default='pending', max_length=10)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField(auto_now=True)),
+                ('refuse_reason', models.TextField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='store_requests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date_added'],
+            },
+        ),
+    ]